@@ -1,10 +1,46 @@
-from .gcquant import (
-    match_area,
-    std_curves,
-    concentrations
-)
-
-from .peaks import (
-    find_peaks,
-    integrate
-)
+""" pyvalence.analyze loads its submodules on first access of one of
+    their functions, so that importing it stays cheap.
+"""
+import importlib
+
+_attributes = {
+    'match_area': 'gcquant',
+    'std_curves': 'gcquant',
+    'concentrations': 'gcquant',
+    'find_peaks': 'peaks',
+    'integrate': 'peaks',
+    'find_peaks_online': 'peaks',
+    'Pipeline': 'pipeline',
+    'peak_spectra': 'spectra',
+    'target_area': 'targetion',
+    'smooth': 'smoothing',
+    'map_ids_to_fid': 'detectors',
+    'quantify': 'shards',
+    'compound_matrix': 'matrix',
+    'CompoundMatrix': 'matrix',
+    'resample_runs': 'comparison',
+    'spectral_profiles': 'comparison',
+    'similarity': 'comparison',
+    'outlier_scores': 'comparison',
+    'cluster_runs': 'comparison',
+    'deconvolve': 'deconvolution',
+    'peak_purity': 'purity',
+    'CalibrationStore': 'calibration',
+    'compound_fingerprints': 'calibration'
+}
+
+__all__ = list(_attributes)
+
+
+def __getattr__(name):
+    if name in _attributes:
+        module = importlib.import_module('.' + _attributes[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_attributes))
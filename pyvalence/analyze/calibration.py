@@ -0,0 +1,230 @@
+""" pyvalence.analyze.calibration saves the curves of ``std_curves`` to a
+    folder, keyed by a fingerprint of the standards table and the areas of
+    the standards runs, so that later sample batches of a sequence are
+    quantified with a stored calibration instead of recalibrating.
+"""
+
+import os
+import json
+import numpy as np
+import pandas as pd
+
+from .gcquant import std_curves
+from .pipeline import _fingerprint
+
+_INDEX = '_models.json'
+
+
+def _points(compiled, standards):
+    """ return calibration points of the standards runs found in
+        ``compiled``: 'library_id', 'key', 'cal_conc' and 'area', NaN
+        where the compound was not matched in the run
+    """
+    melted = pd.melt(standards, id_vars=['library_id'],
+                     value_vars=list(standards.keys()[1:]),
+                     var_name='key', value_name='cal_conc')
+    melted = melted.dropna(subset=['cal_conc']).astype(
+        {'library_id': str, 'key': str, 'cal_conc': float})
+    if compiled is None or compiled.empty:
+        return melted.iloc[:0].assign(area=np.nan)
+    areas = compiled.reset_index()[['key', 'library_id', 'area']].astype(
+        {'library_id': str, 'key': str, 'area': float})
+    melted = melted[melted['key'].isin(areas['key'])]
+    return pd.merge(melted, areas, how='left', on=['library_id', 'key'])
+
+
+def _point_hashes(points):
+    """ return uint64 hash of every calibration point
+    """
+    return pd.util.hash_pandas_object(
+        points[['library_id', 'key', 'cal_conc', 'area']],
+        index=False).values
+
+
+def compound_fingerprints(compiled, standards):
+    """ Fingerprints the calibration points of every compound.
+
+        All points are hashed at once and the hashes of each compound are
+        summed, so the fingerprint does not depend on row order.
+
+        Args
+        ----
+        compiled : pandas.DataFrame
+            Output of ``match_area`` including the standards runs.
+        standards : pandas.DataFrame
+            Standards table as expected by ``std_curves``.
+
+        Returns
+        -------
+        pandas.Series
+            Hex fingerprint indexed by 'library_id'.
+    """
+    points = _points(compiled, standards)
+    codes, lids = pd.factorize(points['library_id'])
+    sums = np.zeros(len(lids), dtype=np.uint64)
+    np.add.at(sums, codes, _point_hashes(points))
+    return pd.Series(['{:016x}'.format(val) for val in sums],
+                     index=pd.Index(lids, name='library_id'),
+                     name='fingerprint')
+
+
+def read_curves(path):
+    """ Returns the curves of a calibration written by
+        ``CalibrationStore.save``, or None if there is no file at ``path``.
+    """
+    if not os.path.isfile(path):
+        return None
+    return pd.read_csv(path, dtype={'library_id': str, 'fingerprint': str})
+
+
+class CalibrationStore(object):
+    """ Folder of calibrations keyed by a fingerprint of their standards.
+
+        Every calibration is the output of ``std_curves`` with a
+        'fingerprint' column identifying the calibration points of each
+        compound, written to ``<fingerprint>.csv``, and the hashes of the
+        points, written to ``<fingerprint>.npy`` for stale checks.
+
+        Parameters
+        ----------
+        path : str
+            Folder of the store, created on the first save.
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def _index(self):
+        """ Non-public method returning the saved fingerprints and the
+            standards runs of every calibration, oldest first.
+        """
+        try:
+            with open(os.path.join(self.path, _INDEX)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return []
+
+    @property
+    def models(self):
+        """ list(str): fingerprints of the saved calibrations, oldest
+            first.
+        """
+        return [entry['fingerprint'] for entry in self._index()]
+
+    def file(self, fingerprint):
+        """ Return path of the curves of calibration ``fingerprint``,
+            which ``concentrations`` accepts in place of the curves.
+        """
+        return os.path.join(self.path, fingerprint + '.csv')
+
+    def fingerprint(self, compiled, standards, **kwargs):
+        """ Return the fingerprint a calibration of ``compiled`` and
+            ``standards`` with ``std_curves`` arguments ``kwargs`` is
+            saved under.
+        """
+        fps = compound_fingerprints(compiled, standards)
+        return _fingerprint(fps.sort_index(), sorted(kwargs.items()))
+
+    def save(self, compiled, standards, curves=None, **kwargs):
+        """ Save a calibration and return its fingerprint.
+
+            Parameters
+            ----------
+            compiled : pandas.DataFrame
+                Output of ``match_area`` including the standards runs.
+            standards : pandas.DataFrame
+                Standards table as expected by ``std_curves``.
+            curves : pandas.DataFrame
+                Optional. Output of ``std_curves`` for ``compiled`` and
+                ``standards``. Fitted with ``kwargs`` if omitted.
+            **kwargs
+                Arguments of ``std_curves``, part of the fingerprint.
+
+            Returns
+            -------
+            str
+        """
+        if curves is None:
+            curves = std_curves(compiled, standards, **kwargs)
+        if curves is None:
+            raise ValueError('no calibration curves to save')
+        points = _points(compiled, standards)
+        fps = compound_fingerprints(compiled, standards)
+        fingerprint = _fingerprint(fps.sort_index(), sorted(kwargs.items()))
+
+        os.makedirs(self.path, exist_ok=True)
+        curves = curves.astype({'library_id': str}).assign(
+            fingerprint=lambda df: df['library_id'].map(fps))
+        curves.to_csv(self.file(fingerprint), index=False)
+        np.save(os.path.join(self.path, fingerprint + '.npy'),
+                _point_hashes(points))
+        index = [entry for entry in self._index()
+                 if entry['fingerprint'] != fingerprint]
+        index.append({'fingerprint': fingerprint,
+                      'runs': sorted(points['key'].unique().tolist())})
+        with open(os.path.join(self.path, _INDEX), 'w') as f:
+            json.dump(index, f)
+        return fingerprint
+
+    def load(self, fingerprint=None):
+        """ Return the curves of calibration ``fingerprint``, the latest
+            saved one if omitted, or None if it is not stored.
+        """
+        if fingerprint is None:
+            models = self.models
+            if not models:
+                return None
+            fingerprint = models[-1]
+        return read_curves(self.file(fingerprint))
+
+    def curves(self, compiled, standards, **kwargs):
+        """ Return the stored calibration of ``compiled`` and
+            ``standards``, fitting and saving it only if it is not stored.
+        """
+        curves = self.load(self.fingerprint(compiled, standards, **kwargs))
+        if curves is None:
+            curves = self.load(self.save(compiled, standards, **kwargs))
+        return curves
+
+    def stale(self, compiled, standards, fingerprint=None):
+        """ Check a batch against a stored calibration.
+
+            The calibration points of the standards runs in ``compiled``
+            are hashed and looked up in the points of the calibration all
+            at once. A compound is stale if any of its points, a standards
+            run re-measured or a changed standards concentration, is not
+            part of the calibration. Batches without standards runs have
+            no points and nothing is stale.
+
+            Parameters
+            ----------
+            compiled : pandas.DataFrame
+                Output of ``match_area`` for the batch.
+            standards : pandas.DataFrame
+                Standards table as expected by ``std_curves``.
+            fingerprint : str
+                Optional. Calibration to check, the latest saved one if
+                omitted.
+
+            Returns
+            -------
+            pandas.Series
+                Boolean indexed by the 'library_id' of every compound of
+                the calibration or the batch's points.
+        """
+        if fingerprint is None:
+            models = self.models
+            if not models:
+                raise KeyError('no calibration in {}'.format(self.path))
+            fingerprint = models[-1]
+        curves = self.load(fingerprint)
+        if curves is None:
+            raise KeyError('{} not in {}'.format(fingerprint, self.path))
+        stored = np.load(os.path.join(self.path, fingerprint + '.npy'))
+
+        points = _points(compiled, standards)
+        new = ~np.isin(_point_hashes(points), stored)
+        stale = pd.Series(new, index=points['library_id']).groupby(
+            level=0).any()
+        lids = pd.Index(curves['library_id']).union(stale.index)
+        return stale.reindex(lids, fill_value=False).rename_axis(
+            'library_id').rename('stale')
@@ -0,0 +1,238 @@
+""" pyvalence.analyze.comparison compares the runs of a sequence to flag
+    outlier injections and group similar samples. Traces of all runs are
+    resampled onto a common time grid at once and compared with blocked
+    matrix products.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .smoothing import _run_bounds
+
+
+def resample_runs(chrom, column=None, grid=None, npoints=None):
+    """ Resamples the trace of every run onto a common time grid.
+
+        All runs are interpolated linearly in one step: the retention
+        times of every run are offset by the run number times a span
+        larger than any time, so one ``searchsorted`` over the stacked
+        times finds the neighbours of every grid point in every run.
+        Grid points outside a run take the value of its nearest scan.
+
+        Args
+        ----
+        chrom : pandas.DataFrame
+            Stacked chromatogram indexed by run 'key' with a 'tme' column,
+            e.g. ``AgilentGcms.chromatogram`` or ``chromatogram_fid``.
+        column : str
+            Optional. Trace to resample. If omitted, the first column
+            other than 'tme'.
+        grid : numpy.ndarray
+            Optional. Increasing retention times to resample onto.
+        npoints : int
+            Optional. Number of points of the default grid, which spans
+            the time range shared by all runs. If omitted, the median
+            number of points per run.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per run indexed by 'key' and one column per grid
+            time.
+    """
+    if chrom is None or 'tme' not in chrom:
+        print('Not enough info for `resample_runs`.')
+        return None
+    if column is None:
+        column = [col for col in chrom.columns if col != 'tme'][0]
+
+    starts, stops = _run_bounds(chrom.index)
+    tme = chrom['tme'].values.astype(float)
+    x = chrom[column].values.astype(float)
+    if grid is None:
+        lo, hi = tme[starts].max(), tme[stops - 1].min()
+        if hi <= lo:
+            lo, hi = tme[starts].min(), tme[stops - 1].max()
+        npoints = npoints or int(np.median(stops - starts))
+        grid = np.linspace(lo, hi, npoints)
+    grid = np.asarray(grid, dtype=float)
+
+    nruns = len(starts)
+    span = 2 * max(np.abs(tme).max(initial=0), np.abs(grid).max(initial=0)) + 1
+    code = np.repeat(np.arange(nruns), stops - starts)
+    query = (np.arange(nruns)[:, None] * span + grid).ravel()
+    right = np.searchsorted(code * span + tme, query, 'left')
+
+    first = np.repeat(starts, len(grid))
+    last = np.repeat(stops - 1, len(grid))
+    right = np.clip(right, first, last)
+    left = np.maximum(right - 1, first)
+    t = np.tile(grid, nruns)
+    dt = tme[right] - tme[left]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        w = np.where(dt > 0, (t - tme[left]) / dt, 0.)
+    w = np.clip(w, 0., 1.)
+    values = (1 - w) * x[left] + w * x[right]
+
+    keys = pd.Index(np.asarray(chrom.index)[starts], name='key')
+    return pd.DataFrame(values.reshape(nruns, len(grid)), index=keys,
+                        columns=pd.Index(grid, name='tme'))
+
+
+def spectral_profiles(spectra, bin_width=1.0):
+    """ Sums the scans of every run into a spectrum binned by m/z.
+
+        Args
+        ----
+        spectra : dict
+            (scipy.sparse.csr_matrix, times, ions) by run key, e.g.
+            ``AgilentGcms.spectra_sparse``.
+        bin_width : float
+            Width of the m/z bins.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per run indexed by 'key' and one column per m/z bin.
+    """
+    if not spectra:
+        print('Not enough info for `spectral_profiles`.')
+        return None
+    keys = list(spectra)
+    rows, bins, weights = [], [], []
+    for i, key in enumerate(keys):
+        scans, _, ions = spectra[key]
+        total = np.asarray(scans.sum(axis=0)).ravel()
+        rows.append(np.full(len(ions), i))
+        bins.append(np.floor(np.asarray(ions, dtype=float) / bin_width))
+        weights.append(total)
+    rows, bins = np.concatenate(rows), np.concatenate(bins).astype(np.int64)
+    labels, bin_codes = np.unique(bins, return_inverse=True)
+    flat = rows * len(labels) + bin_codes
+    values = np.bincount(flat, weights=np.concatenate(weights),
+                         minlength=len(keys) * len(labels))
+    return pd.DataFrame(values.reshape(len(keys), len(labels)),
+                        index=pd.Index(keys, name='key'),
+                        columns=pd.Index(labels * bin_width, name='mz'))
+
+
+def similarity(profiles, metric='correlation', block_size=1024,
+               dtype=np.float32):
+    """ Computes the pairwise similarity of all runs.
+
+        Rows are centered (correlation) and scaled to unit length once,
+        then the similarity matrix is filled block by block from matrix
+        products of ``block_size`` rows with the remaining rows, so the
+        temporary memory is bounded and each pair is computed once.
+
+        Args
+        ----
+        profiles : pandas.DataFrame
+            One row per run, e.g. from ``resample_runs`` or
+            ``spectral_profiles``.
+        metric : str
+            'correlation' for Pearson correlation or 'cosine' for cosine
+            similarity.
+        block_size : int
+            Number of runs per block.
+        dtype : numpy.dtype
+            Precision of the products and the result.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Run x run similarity matrix.
+    """
+    if profiles is None:
+        print('Not enough info for `similarity`.')
+        return None
+    x = np.asarray(profiles.values, dtype=float)
+    if metric == 'correlation':
+        x = x - x.mean(axis=1, keepdims=True)
+    elif metric != 'cosine':
+        raise ValueError('{} not a recognized metric'.format(metric))
+    norm = np.linalg.norm(x, axis=1, keepdims=True)
+    x = (x / np.where(norm > 0, norm, 1.)).astype(dtype)
+
+    n = len(x)
+    out = np.empty((n, n), dtype=dtype)
+    for lo in range(0, n, block_size):
+        hi = min(lo + block_size, n)
+        block = x[lo:hi] @ x[lo:].T
+        out[lo:hi, lo:] = block
+        out[lo:, lo:hi] = block.T
+    return pd.DataFrame(out, index=profiles.index, columns=profiles.index)
+
+
+def outlier_scores(sim, k=5, cutoff=3.5):
+    """ Scores how unlike the rest of the sequence every run is.
+
+        A run is typical if it has close neighbours, e.g. replicate
+        injections or samples of the same kind, so the score is the robust
+        z-score of the mean similarity of a run to its ``k`` most similar
+        other runs, scaled by the median absolute deviation. It is
+        positive for runs less similar to their neighbours than typical.
+
+        Args
+        ----
+        sim : pandas.DataFrame
+            Run x run similarity matrix from ``similarity``.
+        k : int
+            Number of neighbours averaged.
+        cutoff : float
+            Score above which a run is flagged as outlier.
+
+        Returns
+        -------
+        pandas.DataFrame
+            'neighbor_similarity', 'score' and 'outlier' by run key.
+    """
+    if sim is None:
+        print('Not enough info for `outlier_scores`.')
+        return None
+    values = np.array(sim.values, dtype=float)
+    np.fill_diagonal(values, -np.inf)
+    k = max(1, min(k, len(values) - 1))
+    if len(values) > 1:
+        near = np.partition(values, -k, axis=1)[:, -k:].mean(axis=1)
+    else:
+        near = np.ones(len(values))
+    center = np.median(near)
+    mad = 1.4826 * np.median(np.abs(near - center))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = (center - near) / mad if mad > 0 else np.zeros(len(near))
+    return pd.DataFrame({'neighbor_similarity': near, 'score': score,
+                         'outlier': score > cutoff}, index=sim.index)
+
+
+def cluster_runs(sim, threshold=0.9, method='average'):
+    """ Groups runs by hierarchical clustering of their similarity.
+
+        Args
+        ----
+        sim : pandas.DataFrame
+            Run x run similarity matrix from ``similarity``.
+        threshold : float
+            Minimum similarity at which clusters are merged.
+        method : str
+            Linkage method passed to ``scipy.cluster.hierarchy.linkage``.
+
+        Returns
+        -------
+        pandas.Series
+            Cluster number, starting at 1, by run key.
+    """
+    if sim is None:
+        print('Not enough info for `cluster_runs`.')
+        return None
+    if len(sim) < 2:
+        return pd.Series(np.ones(len(sim), dtype=int), index=sim.index,
+                         name='cluster')
+    from scipy.cluster import hierarchy
+    from scipy.spatial.distance import squareform
+    dist = np.clip(1. - np.asarray(sim.values, dtype=float), 0., None)
+    dist = (dist + dist.T) / 2
+    np.fill_diagonal(dist, 0.)
+    tree = hierarchy.linkage(squareform(dist, checks=False), method=method)
+    labels = hierarchy.fcluster(tree, 1. - threshold, criterion='distance')
+    return pd.Series(labels, index=sim.index, name='cluster')
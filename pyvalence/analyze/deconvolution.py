@@ -0,0 +1,435 @@
+""" pyvalence.analyze.deconvolution resolves coeluting peaks of stacked
+    chromatograms by fitting Gaussian or exponentially modified Gaussian
+    (EMG) mixtures to clusters of overlapping peaks. All clusters with the
+    same number of peaks are fitted together in one batched
+    Levenberg-Marquardt solve.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .smoothing import _run_bounds
+
+_SQRT2 = np.sqrt(2.)
+_SQRT2PI = np.sqrt(2. * np.pi)
+
+# number of parameters per component: area, center, log sigma [, log tau]
+_NPARAMS = {'gaussian': 3, 'emg': 4}
+
+
+def _gaussian(x, area, sigma):
+    """ return Gaussian of ``area`` and width ``sigma`` at offsets ``x``
+        from its center, and its derivatives by area, center and log sigma
+    """
+    g = np.exp(-.5 * (x / sigma) ** 2) / (sigma * _SQRT2PI)
+    f = area * g
+    return f, (g, f * x / sigma ** 2, f * ((x / sigma) ** 2 - 1))
+
+
+def _emg(x, area, sigma, tau):
+    """ return EMG of ``area``, Gaussian width ``sigma`` and exponential
+        decay ``tau`` at offsets ``x`` from its Gaussian center, and its
+        derivatives by area, center, log sigma and log tau
+    """
+    from scipy.special import erfc, erfcx
+    z = (sigma / tau - x / sigma) / _SQRT2
+    g = np.exp(-.5 * (x / sigma) ** 2)
+    # exp(a) * erfc(z) with a = z**2 - x**2 / (2 sigma**2), written with
+    # erfcx where exp(a) would overflow
+    a = np.where(z < 0, .5 * (sigma / tau) ** 2 - x / tau, 0.)
+    e = np.where(z >= 0, g * erfcx(np.maximum(z, 0.)),
+                 np.exp(a) * erfc(np.minimum(z, 0.)))
+    scale = area / (2 * tau)
+    f = scale * e
+    k = np.sqrt(2. / np.pi) * g
+    de_dx = k / sigma - e / tau
+    de_ds = e * sigma / tau ** 2 - k * (1 / tau + x / sigma ** 2)
+    de_dt = e * (x / tau ** 2 - sigma ** 2 / tau ** 3) + k * sigma / tau ** 2
+    return f, (e / (2 * tau), -scale * de_dx, sigma * scale * de_ds,
+               tau * (scale * de_dt - f / tau))
+
+
+def _mixture(t, p, k, shape):
+    """ return components (C, K, N), model (C, N) and Jacobian (C, N, M)
+        at times ``t`` (C, N) of mixtures of ``k`` components on a straight
+        baseline. Every row of ``p`` (C, M) holds the parameters of the
+        components followed by the baseline at ``t[:, 0]`` and its slope.
+    """
+    C, N = t.shape
+    comp = p[:, :-2].reshape(C, k, -1)
+    x = t[:, None, :] - comp[:, :, 1, None]
+    area, sigma = comp[:, :, 0, None], np.exp(comp[:, :, 2, None])
+    if shape == 'gaussian':
+        comps, jac = _gaussian(x, area, sigma)
+    else:
+        comps, jac = _emg(x, area, sigma, np.exp(comp[:, :, 3, None]))
+    dt = t - t[:, :1]
+    model = comps.sum(axis=1) + p[:, -2, None] + p[:, -1, None] * dt
+    jac = np.stack(jac, axis=-1).transpose(0, 2, 1, 3).reshape(C, N, -1)
+    jac = np.concatenate([jac, np.ones((C, N, 1)), dt[:, :, None]], axis=2)
+    return comps, model, jac
+
+
+def _cho_solve(a, b):
+    """ return solutions of the symmetric positive definite systems
+        ``a`` (C, M, M) for ``b`` (C, M). All systems are factorised at
+        once column by column, flooring the pivots, so a system that is
+        singular to rounding does not fail the batch. Systems that are
+        not finite have a zero solution.
+    """
+    bad = ~np.isfinite(a).all(axis=(1, 2)) | ~np.isfinite(b).all(axis=1)
+    a = np.where(bad[:, None, None], np.eye(a.shape[-1]), a)
+    b = np.where(bad[:, None], 0., b)
+    m = a.shape[-1]
+    low = np.zeros_like(a)
+    for j in range(m):
+        row = low[:, j, :j]
+        pivot = a[:, j, j] - np.einsum('ck,ck->c', row, row)
+        low[:, j, j] = np.sqrt(np.maximum(pivot,
+                                          1e-12 * a[:, j, j] + 1e-300))
+        low[:, j + 1:, j] = (
+            a[:, j + 1:, j] - np.einsum('cik,ck->ci', low[:, j + 1:, :j], row)
+        ) / low[:, j, j, None]
+    z = np.empty_like(b)
+    for i in range(m):
+        z[:, i] = (b[:, i] - np.einsum('cj,cj->c', low[:, i, :i],
+                                       z[:, :i])) / low[:, i, i]
+    x = np.empty_like(b)
+    for i in reversed(range(m)):
+        x[:, i] = (z[:, i] - np.einsum('cj,cj->c', low[:, i + 1:, i],
+                                       x[:, i + 1:])) / low[:, i, i]
+    return x
+
+
+def _levenberg_marquardt(t, y, w, p, k, bounds, shape, max_iter, tol):
+    """ Fit mixtures of ``k`` components with parameters ``p`` (C, M),
+        see ``_mixture``, to ``y`` (C, N) at times ``t`` with point
+        weights ``w``, all clusters at once. Every cluster keeps its own
+        damping, updated by the ratio of actual to predicted cost
+        reduction, and stops once an accepted step improves its cost by
+        less than ``tol`` or changes no parameter by more than
+        ``sqrt(tol)`` relative to its magnitude, or to one for parameters
+        near zero. Clusters whose damping grows past 1e10 without an
+        accepted step stall and stop unconverged. ``bounds`` are the
+        lower and upper bounds of the parameters. Returns fitted
+        parameters and whether each cluster converged.
+    """
+    p = np.clip(p, *bounds)
+    _, f, jac = _mixture(t, p, k, shape)
+    cost = (w * (y - f) ** 2).sum(axis=1)
+    lam = np.full(len(p), 1e-3)
+    nu = np.full(len(p), 2.)
+    scale = np.zeros(jac.shape[::2])
+    converged = np.zeros(len(p), dtype=bool)
+    active = np.arange(len(p))
+    eye = np.eye(jac.shape[-1])
+
+    for _ in range(max_iter):
+        if not len(active):
+            break
+        ta, ya, wa, pa = t[active], y[active], w[active], p[active]
+        ja = jac[active]
+        jw = ja * wa[:, :, None]
+        jtj = np.einsum('cnm,cnk->cmk', jw, ja)
+        grad = np.einsum('cnm,cn->cm', jw, ya - f[active])
+        # damp by the largest curvature seen so far of every parameter,
+        # solving with unit columns as centers and areas differ by orders
+        # of magnitude in sensitivity
+        diag = np.diagonal(jtj, axis1=1, axis2=2)
+        scale[active] = np.maximum(scale[active], diag)
+        damp = lam[active, None] * scale[active]
+        # parameters of components at zero area have no curvature
+        norm = np.sqrt(np.maximum(
+            diag, 1e-12 * diag.max(axis=1, keepdims=True) + 1e-300))
+        lhs = (jtj / norm[:, :, None] / norm[:, None, :] +
+               eye * (damp / norm ** 2 + 1e-12)[:, None])
+        step = _cho_solve(lhs, grad / norm) / norm
+
+        trial = np.clip(pa + step, bounds[0][active], bounds[1][active])
+        step = trial - pa
+        _, ft, jt = _mixture(ta, trial, k, shape)
+        ct = (wa * (ya - ft) ** 2).sum(axis=1)
+        predicted = np.einsum('cm,cm->c', step, damp * step + grad)
+        gain = cost[active] - ct
+        better = np.isfinite(ct) & (gain > 0)
+
+        idx = active[better]
+        rho = gain[better] / np.maximum(predicted[better], 1e-300)
+        p[idx], f[idx], jac[idx] = trial[better], ft[better], jt[better]
+        done = ((gain[better] <= tol * np.maximum(cost[idx], 1e-300)) |
+                (np.abs(step[better]) <=
+                 np.sqrt(tol) * np.maximum(np.abs(pa[better]), 1)).all(1))
+        cost[idx] = ct[better]
+        lam[idx] *= np.maximum(1 / 3., 1 - (2 * np.minimum(rho, 1) - 1) ** 3)
+        nu[idx] = 2.
+        worse = active[~better]
+        lam[worse] *= nu[worse]
+        nu[worse] *= 2
+        converged[idx[done]] = True
+        active = active[~converged[active] & (lam[active] <= 1e10)]
+    return p, converged
+
+
+def _shoulders(trace, pk, props, fwhm, prom):
+    """ return samples of the shoulders of peaks ``pk`` of ``trace``,
+        found with ``props``, and the peak each belongs to. Every
+        component of a peak is a minimum of the smoothed second
+        derivative, standing out of its noise. The minimum closest to a
+        maximum is its own, the others between the peak's bases and at
+        least ``prom`` above them are shoulders.
+    """
+    import scipy.signal as signal
+    none = np.empty(0, dtype=np.int64)
+    # smooth over half the width of the prominent peaks
+    major = props['prominences'] >= np.median(props['prominences'])
+    window = max(5, int(np.median(fwhm[major]) / 2) // 2 * 2 + 1)
+    if window > len(trace):
+        return none, none
+    coeffs = signal.savgol_coeffs(window, 3, deriv=2)
+    noise = (np.median(np.abs(np.diff(trace))) / (.6745 * _SQRT2) *
+             np.sqrt((coeffs ** 2).sum()))
+    curv = -signal.savgol_filter(trace, window, 3, deriv=2)
+    cand, _ = signal.find_peaks(
+        curv, height=0, prominence=max(4 * noise, .01 * curv.max()))
+    if not len(cand):
+        return none, none
+
+    # closest peak whose bases enclose the minimum
+    left_base, right_base = props['left_bases'], props['right_bases']
+    inside = ((cand[:, None] >= left_base) & (cand[:, None] <= right_base))
+    dist = np.where(inside, np.abs(cand[:, None] - pk), np.inf)
+    owner = dist.argmin(axis=1)
+    dist = dist[np.arange(len(cand)), owner]
+    own = np.full(len(pk), np.inf)
+    np.minimum.at(own, owner, dist)
+    base = np.maximum(trace[left_base], trace[right_base])[owner]
+    keep = (np.isfinite(dist) & (dist > own[owner]) &
+            (trace[cand] - base >= prom))
+    return cand[keep], owner[keep]
+
+
+def _clusters(lo, hi, run):
+    """ return cluster number of every peak window [``lo``, ``hi``) sorted
+        by ``lo``, merging windows that overlap within a run
+    """
+    reach = np.maximum.accumulate(hi)
+    new = np.r_[True, (lo[1:] >= reach[:-1]) | (run[1:] != run[:-1])]
+    return np.cumsum(new) - 1
+
+
+def deconvolve(chrom, column=None, shape='gaussian', prominence=None,
+               width=4., max_iter=200, tol=1e-8, batch_size=4096):
+    """ Fits a peak shape to every peak of every run, resolving coeluting
+        peaks.
+
+        Peaks are found per run with ``find_peaks``. Peaks whose windows
+        of ``width`` widths around the apex overlap form a cluster, which
+        is fitted as a mixture of one component per peak on a straight
+        baseline. Shoulders, minima of the smoothed second derivative of
+        a peak other than the one of its maximum, get components of their
+        own, so coeluting peaks without a maximum are resolved too.
+        Clusters with the same number of components are padded to a
+        common length and fitted together with analytic Jacobians,
+        ``batch_size`` clusters per solve.
+
+        Args
+        ----
+        chrom : pandas.DataFrame
+            Stacked chromatogram indexed by run 'key' with a 'tme'
+            column, e.g. ``AgilentGcms.chromatogram`` or
+            ``chromatogram_fid``.
+        column : str
+            Optional. Trace to fit. If omitted, the first column other
+            than 'tme'.
+        shape : str
+            'gaussian' or 'emg' (exponentially modified Gaussian) for
+            tailing peaks.
+        prominence : float
+            Optional. Minimum prominence of the peaks. If omitted, 1% of
+            the run's maximum.
+        width : float
+            Half width of the fit windows in peak widths (sigma).
+        max_iter : int
+            Maximum number of Levenberg-Marquardt iterations.
+        tol : float
+            Relative cost improvement below which a cluster converged.
+        batch_size : int
+            Maximum number of clusters fitted in one solve.
+
+        Returns
+        -------
+        pandas.DataFrame
+            One row per component indexed by 'key' with the 'peak',
+            'rt', 'first', 'max', 'last', 'height' and 'area' columns of
+            ``AgilentGcms.results_tic``, usable as ``area`` table of
+            ``match_area``, plus the fitted 'sigma', 'tau' (emg), the
+            'cluster' and whether its fit 'converged'. Areas are in units
+            of the trace times minutes, scan numbers are 1-based.
+    """
+    if chrom is None or 'tme' not in chrom:
+        print('Not enough info for `deconvolve`.')
+        return None
+    if shape not in _NPARAMS:
+        raise ValueError('{} not a recognized shape'.format(shape))
+    if column is None:
+        column = [col for col in chrom.columns if col != 'tme'][0]
+    import scipy.signal as signal
+
+    starts, stops = _run_bounds(chrom.index)
+    tme = chrom['tme'].values.astype(float)
+    y = chrom[column].values.astype(float)
+
+    # peaks and their half widths at half height in samples, run by run,
+    # shoulders start from the widths of their peak
+    apex, left, right, run = [], [], [], []
+    for i, (lo, hi) in enumerate(zip(starts, stops)):
+        trace = y[lo:hi]
+        prom = (prominence if prominence is not None
+                else .01 * np.abs(trace).max(initial=0))
+        pk, props = signal.find_peaks(trace, prominence=prom)
+        if not len(pk):
+            continue
+        _, _, lips, rips = signal.peak_widths(trace, pk, rel_height=.5)
+        half_l = np.maximum(pk - lips, .5)
+        half_r = np.maximum(rips - pk, .5)
+        sh, owner = _shoulders(trace, pk, props, half_l + half_r, prom or 0)
+        apex.append(np.r_[pk, sh] + lo)
+        left.append(np.r_[half_l, half_l[owner]])
+        right.append(np.r_[half_r, half_r[owner]])
+        run.append(np.full(len(pk) + len(sh), i))
+    if not apex:
+        print('Not enough info for `deconvolve`.')
+        return None
+    apex, left, right, run = map(np.concatenate, (apex, left, right, run))
+    sig = (left + right) / 2.3548
+    lead_sig = left / 1.1774
+    # the exponential decay of a tailing peak widens its trailing half
+    tau = (np.maximum(right - left, 0) / np.log(2) if shape == 'emg'
+           else np.zeros(len(apex)))
+
+    # fit windows, EMG peaks get room for their tails
+    lo = np.maximum(np.floor(apex - width * sig).astype(np.int64),
+                    starts[run])
+    hi = np.minimum(np.ceil(apex + width * (sig + tau)).astype(np.int64) + 1,
+                    stops[run])
+    order = np.lexsort((lo, run))
+    apex, sig, lead_sig, tau, run, lo, hi = (
+        arr[order] for arr in (apex, sig, lead_sig, tau, run, lo, hi))
+    cluster = _clusters(lo, hi, run)
+    ncl = cluster[-1] + 1
+    c_lo = np.full(ncl, np.iinfo(np.int64).max)
+    c_hi = np.zeros(ncl, dtype=np.int64)
+    np.minimum.at(c_lo, cluster, lo)
+    np.maximum.at(c_hi, cluster, hi)
+    ncomp = np.bincount(cluster)
+
+    nparams = _NPARAMS[shape]
+    params = np.empty((len(apex), nparams))
+    converged = np.empty(len(apex), dtype=bool)
+    heights = np.empty(len(apex))
+    peak_rt = np.empty(len(apex))
+    first_of = np.r_[0, np.cumsum(ncomp)[:-1]]
+
+    for k in np.unique(ncomp):
+        members = np.flatnonzero(ncomp == k)
+        for b in range(0, len(members), batch_size):
+            cl = members[b:b + batch_size]
+            n = c_hi[cl] - c_lo[cl]
+            pos = c_lo[cl, None] + np.arange(n.max())
+            w = (pos < c_hi[cl, None]).astype(float)
+            pos = np.minimum(pos, c_hi[cl, None] - 1)
+            t, yy = tme[pos], y[pos]
+
+            # straight baseline through the window edges to start from
+            last = c_hi[cl] - 1
+            t0, t1 = tme[c_lo[cl]], tme[last]
+            y0, y1 = y[c_lo[cl]], y[last]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                slope = np.where(t1 > t0, (y1 - y0) / (t1 - t0), 0.)
+
+            comp = first_of[cl, None] + np.arange(k)
+            ap = apex[comp]
+            dt = np.abs(np.gradient(tme)[ap]) + 1e-12
+            sigma = sig[comp] * dt
+            since = tme[ap] - t0[:, None]
+            height = np.maximum(
+                y[ap] - (y0[:, None] + slope[:, None] * since), 1e-12)
+            p0 = np.empty((len(cl), k, nparams))
+            p0[:, :, 0] = height * sigma * _SQRT2PI
+            p0[:, :, 1] = tme[ap]
+            p0[:, :, 2] = np.log(sigma)
+
+            span = np.maximum(t1 - t0, 1e-12)[:, None]
+            low = np.full(p0.shape, -np.inf)
+            high = np.full(p0.shape, np.inf)
+            low[:, :, 0] = 0.
+            low[:, :, 1], high[:, :, 1] = t0[:, None], t1[:, None]
+            low[:, :, 2:] = np.log(dt / 4)[:, :, None]
+            high[:, :, 2:] = np.log(span)[:, :, None]
+
+            def flat(comp_params, base):
+                return np.concatenate([comp_params.reshape(len(cl), -1),
+                                       base], axis=1)
+            base = np.stack([y0, slope], axis=1)
+            free = np.full((len(cl), 2), np.inf)
+
+            # EMGs start from the leading half, which the tail leaves
+            # alone, and the decay widening the trailing half
+            if shape == 'emg':
+                lead = lead_sig[comp] * dt
+                decay = np.maximum(tau[comp] * dt, lead / 4)
+                p0[:, :, 0] = height * (lead * _SQRT2PI + decay)
+                p0[:, :, 2] = np.log(lead)
+                p0[:, :, 3] = np.log(decay)
+            fitted, ok = _levenberg_marquardt(
+                t, yy, w, flat(p0, base), k,
+                (flat(low, -free), flat(high, free)),
+                shape, max_iter, tol)
+            comps, _, _ = _mixture(t, fitted, k, shape)
+            comps = np.where(w[:, None, :] > 0, comps, -np.inf)
+            top = comps.argmax(axis=2)
+            fitted = fitted[:, :-2].reshape(len(cl), k, nparams)
+            params[comp] = fitted
+            converged[comp] = ok[:, None]
+            heights[comp] = np.take_along_axis(
+                comps, top[:, :, None], 2)[..., 0]
+            peak_rt[comp] = (fitted[:, :, 1] if shape == 'gaussian'
+                             else np.take_along_axis(t, top, 1))
+
+    sigma = np.exp(params[:, 2])
+    tail = np.exp(params[:, 3]) if shape == 'emg' else 0.
+    edges = [peak_rt - width * sigma, peak_rt,
+             peak_rt + width * (sigma + tail)]
+
+    # 1-based scan numbers of the edges within their runs, all runs at once
+    span = 2 * max(np.abs(tme).max(), np.abs(np.concatenate(edges)).max()) + 1
+    stacked = np.repeat(np.arange(len(starts)), stops - starts) * span + tme
+    scans = [np.clip(np.searchsorted(stacked, run * span + edge),
+                     starts[run], stops[run] - 1) - starts[run] + 1
+             for edge in edges]
+
+    keys = np.asarray(chrom.index)[starts][run]
+    result = pd.DataFrame({
+        'rt': peak_rt,
+        'first': scans[0],
+        'max': scans[1],
+        'last': scans[2],
+        'height': heights,
+        'area': params[:, 0],
+        'sigma': sigma,
+        'cluster': cluster,
+        'converged': converged
+    })
+    if shape == 'emg':
+        result.insert(result.columns.get_loc('cluster'), 'tau', tail)
+    order = np.lexsort((peak_rt, run))
+    result = result.iloc[order].reset_index(drop=True)
+    result.insert(0, 'peak', pd.Series(run[order]).groupby(run[order])
+                                                  .cumcount().values + 1)
+    keys = keys[order]
+    result.index = (pd.CategoricalIndex(keys,
+                                        categories=chrom.index.categories,
+                                        name='key')
+                    if isinstance(chrom.index, pd.CategoricalIndex)
+                    else pd.Index(keys, name='key'))
+    return result
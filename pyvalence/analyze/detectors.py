@@ -0,0 +1,206 @@
+""" pyvalence.analyze.detectors transfers species identified by the MS to
+    the peaks of the FID, correcting the retention time offset between the
+    two detectors of every run.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _run_codes(*indexes):
+    """ return run codes of every ``indexes`` in a shared numbering
+    """
+    keys = [np.asarray(pd.Index(index).astype(str)) for index in indexes]
+    codes, _ = pd.factorize(np.concatenate(keys))
+    bounds = np.cumsum([len(k) for k in keys])[:-1]
+    return np.split(codes, bounds)
+
+
+def _window_pairs(code, rt, ref_code, ref_rt, tol):
+    """ return every pair of a query peak (``code``, ``rt``) and a
+        reference peak of the same run within ``tol`` of each other as
+        positions into the queries and the reference. The reference must
+        be sorted by run and retention time.
+    """
+    span = 2 * max(np.abs(rt).max(initial=0),
+                   np.abs(ref_rt).max(initial=0)) + 2 * tol + 1
+    ref_val = ref_code * span + ref_rt
+    lo = np.searchsorted(ref_val, code * span + rt - tol, 'left')
+    hi = np.searchsorted(ref_val, code * span + rt + tol, 'right')
+    counts = hi - lo
+    query = np.repeat(np.arange(len(rt)), counts)
+    ref = (np.repeat(lo - np.cumsum(counts) + counts, counts) +
+           np.arange(counts.sum()))
+    return query, ref
+
+
+def _vote_shift(code, shift, nruns, tol):
+    """ return per run the candidate ``shift`` agreeing within ``tol``
+        with the most other candidates of its run, or 0 for runs without
+        candidates.
+    """
+    order = np.lexsort((shift, code))
+    code, shift = code[order], shift[order]
+    _, support = _window_pairs(code, shift, code, shift, tol)
+    votes = np.bincount(support, minlength=len(shift))
+    best = np.zeros(nruns)
+    if len(shift):
+        # within every run the candidate with the most votes comes last
+        rank = np.lexsort((votes, code))
+        last = np.r_[code[rank][1:] != code[rank][:-1], True]
+        best[code[rank][last]] = shift[rank][last]
+    return best
+
+
+def _fit_transform(code, ms_rt, fid_rt, nruns, iters=3):
+    """ return intercept and slope per run of the line mapping ``ms_rt``
+        to ``fid_rt``, refitted ``iters`` times without the pairs whose
+        residual exceeds three scaled median absolute deviations of their
+        run. Runs with a single pair get a pure offset and runs without
+        pairs the identity.
+    """
+    keep = np.ones(len(code), dtype=bool)
+    for _ in range(iters):
+        def sums(w):
+            return np.bincount(code[keep], weights=w[keep], minlength=nruns)
+        n = sums(np.ones(len(code)))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            xbar, ybar = sums(ms_rt) / n, sums(fid_rt) / n
+            sxx = sums(ms_rt * ms_rt) - n * xbar ** 2
+            sxy = sums(ms_rt * fid_rt) - n * xbar * ybar
+            slope = np.where((n > 1) & (sxx > 1e-12), sxy / sxx, 1.)
+        intercept = np.where(n > 0, ybar - slope * xbar, 0.)
+
+        resid = np.abs(fid_rt - intercept[code] - slope[code] * ms_rt)
+        mad = (pd.Series(resid[keep]).groupby(code[keep]).median()
+                 .reindex(range(nruns)).fillna(0).values)
+        keep = resid <= np.maximum(3 * 1.4826 * mad[code], 1e-3)
+    return intercept, slope
+
+
+def _assign(lib_i, fid_i, dist):
+    """ return the one-to-one subset of candidate pairs taking the closest
+        pairs first. Every round accepts all pairs that are the closest
+        candidate of both their lib and fid peak, then drops the pairs
+        sharing a peak with an accepted one.
+    """
+    accepted = []
+    while len(dist):
+        order = np.argsort(dist, kind='stable')
+        lib_i, fid_i, dist = lib_i[order], fid_i[order], dist[order]
+        _, first_lib = np.unique(lib_i, return_index=True)
+        _, first_fid = np.unique(fid_i, return_index=True)
+        best = np.zeros(len(dist), dtype=int)
+        best[first_lib] += 1
+        best[first_fid] += 1
+        mutual = best == 2
+        accepted.append((lib_i[mutual], fid_i[mutual]))
+        taken = (np.isin(lib_i, lib_i[mutual]) |
+                 np.isin(fid_i, fid_i[mutual]))
+        lib_i, fid_i, dist = lib_i[~taken], fid_i[~taken], dist[~taken]
+    if not accepted:
+        return np.empty(0, dtype=int), np.empty(0, dtype=int)
+    return (np.concatenate([a for a, _ in accepted]),
+            np.concatenate([b for _, b in accepted]))
+
+
+def map_ids_to_fid(lib, fid, threshold=0.05, max_offset=0.5, min_qual=80,
+                   passes=3, metrics=False):
+    """ Matches species identified by the MS to FID peak areas.
+
+        The MS and FID retention times of a run differ by a systematic
+        offset. For every run a line mapping MS to FID retention times is
+        fitted to anchor pairs, i.e. identifications with a library match
+        quality of at least ``min_qual`` paired with their closest FID
+        peak, discarding outlying pairs. All identifications are then
+        moved onto the FID time axis and matched one-to-one to the FID
+        peaks within ``threshold``, closest first, for all runs at once.
+
+        Args
+        ----
+        lib : pandas.DataFrame
+            Identified species indexed by run 'key' with 'library_id',
+            'rt' and optionally 'qual' columns, e.g.
+            ``AgilentGcms.results_lib``.
+        fid : pandas.DataFrame
+            FID peaks indexed by run 'key' with 'rt', 'area' and 'peak'
+            columns, e.g. ``AgilentGcms.results_fid``.
+        threshold : float
+            Maximum difference between transformed MS and FID retention
+            times of a match.
+        max_offset : float
+            Maximum difference between MS and FID retention times of an
+            anchor pair.
+        min_qual : int
+            Minimum library match quality of anchor identifications.
+        passes : int
+            Number of times anchors are paired with the current transform
+            and the transform is refitted.
+        metrics : boolean
+            When metrics is true the FID peak, its rt and the delta to the
+            transformed MS rt are returned in additional columns
+            'area_pk', 'area_rt' and 'delta_rt'.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Same layout as the output of ``match_area`` with FID areas,
+            ready for ``std_curves`` and ``concentrations``.
+    """
+    if lib is None or fid is None:
+        print('Not enough info for `map_ids_to_fid`.')
+        return None
+
+    lib_code, fid_code = _run_codes(lib.index, fid.index)
+    nruns = max(lib_code.max(initial=-1), fid_code.max(initial=-1)) + 1
+    lib_rt = lib['rt'].values.astype(float)
+    order = np.lexsort((fid['rt'].values, fid_code))
+    ref_code = fid_code[order]
+    ref_rt = fid['rt'].values.astype(float)[order]
+
+    # robust per-run transform from anchor pairs
+    anchor = (lib['qual'].to_numpy(float, na_value=np.nan) >= min_qual
+              if 'qual' in lib
+              else np.ones(len(lib), dtype=bool))
+    a_code, a_rt = lib_code[anchor], lib_rt[anchor]
+    query, ref = _window_pairs(a_code, a_rt, ref_code, ref_rt, max_offset)
+    shift = _vote_shift(a_code[query], ref_rt[ref] - a_rt[query], nruns,
+                        threshold)
+    intercept, slope = shift, np.ones(nruns)
+    for _ in range(passes):
+        # pair anchors with the current transform and refit, extending
+        # the fit from the anchors near the voted shift to the whole run
+        a_pred = intercept[a_code] + slope[a_code] * a_rt
+        query, ref = _window_pairs(a_code, a_pred, ref_code, ref_rt,
+                                   threshold)
+        query, ref = _assign(query, ref, np.abs(ref_rt[ref] - a_pred[query]))
+        intercept, slope = _fit_transform(a_code[query], a_rt[query],
+                                          ref_rt[ref], nruns)
+    pred = intercept[lib_code] + slope[lib_code] * lib_rt
+
+    # candidate pairs within threshold of the transformed rt
+    cand_lib, cand_fid = _window_pairs(lib_code, pred, ref_code, ref_rt,
+                                       threshold)
+    dist = np.abs(ref_rt[cand_fid] - pred[cand_lib])
+    yi, xi = _assign(cand_lib, cand_fid, dist)
+    xi = order[xi]
+
+    result = lib.reset_index()
+    result['area'] = np.nan
+    result.loc[yi, 'area'] = fid['area'].to_numpy(float, na_value=np.nan)[xi]
+    if metrics:
+        result['area_pk'] = result['area_rt'] = result['delta_rt'] = np.nan
+        result.loc[yi, 'area_pk'] = fid['peak'].to_numpy(
+            float, na_value=np.nan)[xi]
+        result.loc[yi, 'area_rt'] = fid['rt'].values[xi]
+        result.loc[yi, 'delta_rt'] = np.abs(result.loc[yi, 'area_rt'] -
+                                            pred[yi])
+    result = (result.set_index('key')
+                    .drop(['pct_area', 'ref'], axis=1, errors='ignore'))
+    if isinstance(lib.index, pd.CategoricalIndex):
+        result.index = pd.CategoricalIndex(
+            result.index, categories=lib.index.categories, name='key')
+    result['area%'] = (result.area /
+                       result.groupby(level='key', observed=True)
+                             .area.transform('sum'))
+    return result
@@ -5,7 +5,6 @@
 
 import numpy as np
 import pandas as pd
-from scipy.stats import linregress
 
 
 def match_area(lib, area, threshold=0.1, metrics=False):
@@ -48,10 +47,8 @@ def match_area(lib, area, threshold=0.1, metrics=False):
     def area_percent(comp):
         """
         """
-        comp_g = comp.groupby(comp.index)
-        comp['area%'] = (comp_g.apply(lambda x: x.area/x.area.sum())
-                               .reset_index(level=0)
-                               .drop('key', axis=1).area)
+        comp_g = comp.groupby(level='key', observed=True)
+        comp['area%'] = comp.area / comp_g.area.transform('sum')
         return comp
 
     def matchiter(lib, area, threshold):
@@ -63,30 +60,25 @@ def match_area(lib, area, threshold=0.1, metrics=False):
                                        for i in range(len(lib))] for k in j]
         }))
 
-        def distance(row, x, y):
-            return abs(x[row.xi] - y[row.yi])
-
         def find_mins(df):
             xys, xs, ys = [], [], []
             while df.shape[0] > 0:
                 top = df[df.index == df.distance.idxmin()]
                 xys.append(top)
-                xs.append(top.xi)
-                ys.append(top.yi)
+                xs.extend(top.xi)
+                ys.extend(top.yi)
                 df = df[~(df.xi.isin(xs) | (df.yi.isin(ys)))]
             return pd.concat(xys)
 
-        df['distance'] = df.apply(
-            distance,
-            axis=1, x=area.rt.values, y=lib.rt.values
-        )
+        df['distance'] = np.abs(area.rt.values[df.xi.values] -
+                                lib.rt.values[df.yi.values])
         df = df[df.distance <= threshold]
 
-        match = find_mins(df)
+        match = find_mins(df) if not df.empty else df
         xi, yi = match.xi, match.yi
 
         lib['area'] = np.nan
-        lib.loc[yi, 'area'] = area.area[xi].values
+        lib.loc[yi, 'area'] = area.area[xi].to_numpy(float, na_value=np.nan)
 
         if metrics:
             lib['area_pk'] = lib['area_rt'] = lib['delta_rt'] = np.nan
@@ -100,21 +92,105 @@ def match_area(lib, area, threshold=0.1, metrics=False):
         print('Not enough info for `match_area`.')
         return None
 
-    lib_grouped = lib.groupby(lib.index)
-    area_grouped = area.groupby(area.index)
-    returndf = lib_grouped.apply(
-        lambda x: matchiter(
-            lib=x.reset_index(),
-            area=area_grouped.get_group(x.name).reset_index(),
-            threshold=threshold)
+    lib_grouped = lib.groupby(level='key', observed=True)
+    area_grouped = area.groupby(level='key', observed=True)
+    returndf = pd.concat(
+        matchiter(lib=x.reset_index(),
+                  area=area_grouped.get_group(key).reset_index(),
+                  threshold=threshold)
+        for key, x in lib_grouped
     )
     return area_percent(
-        (returndf.reset_index(level=0)
-                 .drop(['header=', 'pct_area', 'ref', 'key'], axis=1))
-        )
+        returndf.drop(['pct_area', 'ref'], axis=1, errors='ignore')
+    )
 
 
-def std_curves(compiled, standards):
+def _calibration_uncertainty(points, method='analytic', n_boot=1000,
+                             alpha=0.05, seed=None):
+    """ return uncertainty of the calibration line of every compound in
+        ``points``, a dataframe of 'library_id', 'area' and 'cal_conc'.
+
+        Sums over the points of all compounds are taken at once with
+        bincount. For 'bootstrap', the points of every compound are
+        resampled ``n_boot`` times and all (compound x resample) lines
+        are fitted in one batched least squares computation.
+    """
+    from scipy.stats import t as t_dist
+    codes, lids = pd.factorize(points['library_id'])
+    x = points['area'].values.astype(float)
+    y = points['cal_conc'].values.astype(float)
+    n = np.bincount(codes).astype(float)
+
+    def sums(w):
+        return np.bincount(codes, weights=w, minlength=len(n))
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        xbar, ybar = sums(x) / n, sums(y) / n
+        sxx = sums(x * x) - n * xbar ** 2
+        sxy = sums(x * y) - n * xbar * ybar
+        syy = sums(y * y) - n * ybar ** 2
+        slope = sxy / sxx
+        dof = n - 2
+        resid_var = (syy - slope * sxy) / dof
+
+        if method == 'analytic':
+            var_rf = resid_var / sxx
+            var_intercept = resid_var * (1 / n + xbar ** 2 / sxx)
+            cov = -xbar * resid_var / sxx
+            tval = t_dist.ppf(1 - alpha / 2, dof)
+            intercept = ybar - slope * xbar
+            rf_ci = (slope - tval * np.sqrt(var_rf),
+                     slope + tval * np.sqrt(var_rf))
+            intercept_ci = (intercept - tval * np.sqrt(var_intercept),
+                            intercept + tval * np.sqrt(var_intercept))
+        elif method == 'bootstrap':
+            order = np.argsort(codes, kind='stable')
+            xs, ys = x[order], y[order]
+            counts = n.astype(int)
+            starts = np.cumsum(counts) - counts
+            rng = np.random.default_rng(seed)
+            draw = (rng.random((len(n), n_boot, counts.max())) *
+                    counts[:, None, None]).astype(int)
+            valid = np.arange(counts.max()) < counts[:, None, None]
+            idx = starts[:, None, None] + draw
+            bx = np.where(valid, xs[idx], 0.)
+            by = np.where(valid, ys[idx], 0.)
+            nn = n[:, None]
+            sx, sy = bx.sum(axis=-1), by.sum(axis=-1)
+            slopes = ((nn * (bx * by).sum(axis=-1) - sx * sy) /
+                      (nn * (bx * bx).sum(axis=-1) - sx ** 2))
+            intercepts = (sy - slopes * sx) / nn
+            slopes[~np.isfinite(slopes)] = np.nan
+            intercepts[np.isnan(slopes)] = np.nan
+
+            q = [100 * alpha / 2, 100 * (1 - alpha / 2)]
+            rf_ci = np.nanpercentile(slopes, q, axis=1)
+            intercept_ci = np.nanpercentile(intercepts, q, axis=1)
+            var_rf = np.nanvar(slopes, axis=1, ddof=1)
+            var_intercept = np.nanvar(intercepts, axis=1, ddof=1)
+            cov = np.nanmean(
+                (slopes - np.nanmean(slopes, axis=1)[:, None]) *
+                (intercepts - np.nanmean(intercepts, axis=1)[:, None]),
+                axis=1)
+        else:
+            raise ValueError('{} not a recognized method'.format(method))
+
+    return pd.DataFrame({
+        'library_id': lids,
+        'rf_lo': rf_ci[0],
+        'rf_hi': rf_ci[1],
+        'intercept_lo': intercept_ci[0],
+        'intercept_hi': intercept_ci[1],
+        'var_rf': var_rf,
+        'var_intercept': var_intercept,
+        'cov_rf_intercept': cov,
+        'resid_var': resid_var,
+        'dof': dof
+    })
+
+
+def std_curves(compiled, standards, uncertainty=None, n_boot=1000,
+               alpha=0.05, seed=None):
     """ Takes matched_area dataframe (compiled), of species with areas and ids
         and a standards dataframe to calculate the corresponding response
         factor (RF)
@@ -131,6 +207,18 @@ def std_curves(compiled, standards):
             each subsequent column should contain the file name for a stanards
             vial. The value of each row for file should be the concentration
             in molar for that species in that vial.
+        uncertainty : str
+            Optional. 'analytic' for t-distribution intervals of the least
+            squares fit or 'bootstrap' to resample the calibration points.
+            Adds confidence intervals of the response factor and
+            intercept, and the (co)variances ``concentrations`` uses for
+            prediction intervals.
+        n_boot : int
+            Number of resamples per compound for 'bootstrap'.
+        alpha : float
+            Confidence intervals cover ``1 - alpha``.
+        seed : int
+            Optional. Seed of the 'bootstrap' resampling.
 
         Returns
         -------
@@ -149,8 +237,13 @@ def std_curves(compiled, standards):
             value_vars=list(standards.keys()[1:])
         )
         standards_melted.columns = ['library_id', 'key', 'cal_conc']
+        compiled = compiled.reset_index()
+
+        # align dtypes so the merge keeps categorical join keys
+        standards_melted = standards_melted.astype(
+            {col: compiled[col].dtype for col in ['library_id', 'key']})
 
-        return (pd.merge(compiled.reset_index(),
+        return (pd.merge(compiled,
                          standards_melted,
                          how='left',
                          on=['library_id', 'key'])
@@ -158,6 +251,7 @@ def std_curves(compiled, standards):
 
     def lin_wrap(group):
         """ """
+        from scipy.stats import linregress
         if group.shape[0] > 1:
             return linregress(group.area, group.cal_conc)
         else:
@@ -168,20 +262,24 @@ def std_curves(compiled, standards):
         return None
 
     matched_cal_conc = match_cal_conc(compiled, standards)
-    b = (matched_cal_conc.groupby('library_id')
-                         .apply(lambda df: lin_wrap(df))
-                         .apply(pd.Series)
-                         .reset_index())
+    cal_grouped = matched_cal_conc.groupby('library_id', observed=True)
+    b = (cal_grouped.apply(lambda df: lin_wrap(df))
+                    .dropna()
+                    .apply(lambda res: pd.Series(tuple(res)))
+                    .reset_index())
     b.columns = ['library_id', 'responsefactor', 'intercept',
                  'rvalue', 'pvalue', 'stderr']
-    d = pd.DataFrame(
-        {'max': matched_cal_conc.groupby('library_id')['area'].max(),
-         'min': matched_cal_conc.groupby('library_id')['area'].min()}
-    ).reset_index()
-    return pd.merge(b, d, on='library_id')
+    d = cal_grouped['area'].agg(['max', 'min']).reset_index()
+    curves = pd.merge(b, d, on='library_id')
+    if uncertainty is not None:
+        fitted = matched_cal_conc[
+            matched_cal_conc['library_id'].isin(curves['library_id'])]
+        curves = pd.merge(curves, _calibration_uncertainty(
+            fitted, uncertainty, n_boot, alpha, seed), on='library_id')
+    return curves
 
 
-def concentrations(compiled, stdcurves):
+def concentrations(compiled, stdcurves, alpha=0.05):
     """ Calculates the concentration of species.
 
         Concentrations takes a dataframe which contains species matched
@@ -195,43 +293,70 @@ def concentrations(compiled, stdcurves):
             Compiled is a dataframe containing identified species and an
             associated area with unknown concentrations. It can be generated
             from match_area
-        stdcurves : pandas.DataFrame
+        stdcurves : pandas.DataFrame or str
             This is a dataframe containing the calculated response factors.
-            It is generated from std_curves
+            It is generated from std_curves, or loaded from the path of a
+            calibration saved by CalibrationStore, skipping recalibration.
+        alpha : float
+            If ``stdcurves`` was generated with an ``uncertainty`` mode,
+            'conc_lo' and 'conc_hi' bound the ``1 - alpha`` prediction
+            interval of each concentration.
 
         Returns
         -------
         pandas.DataFrame
             A dataframe is returned which contains all data from compiled plus
             the calculated concentrations, concentration percentages,
-            & area percentages
+            & area percentages. 'out_of_range' flags areas outside the
+            'min'..'max' area range of the calibration standards.
     """
-    def conc_cal(x):
-        aX = x['area'] * x['responsefactor']
-        B = x['intercept']
-        conc = aX + B if aX + B > 0 else np.nan
-        return conc
+    def conc_cal(df):
+        conc = df['area'] * df['responsefactor'] + df['intercept']
+        return conc.where(conc > 0)
 
+    if isinstance(stdcurves, str):
+        from .calibration import read_curves
+        stdcurves = read_curves(stdcurves)
     if compiled is None or stdcurves is None:
         print('Not enough info for `concentrations`.')
         return None
 
     # calculate concentration of species
     compiled = compiled.reset_index()
+    if 'fingerprint' in stdcurves:
+        stdcurves = stdcurves.drop('fingerprint', axis=1).astype(
+            {'library_id': compiled['library_id'].dtype})
     return_df = (pd.merge(compiled, stdcurves, on='library_id', how='outer')
-                   .assign(conc=(lambda df: df.apply(conc_cal, axis=1)))
+                   .assign(conc=conc_cal)
                    .drop(['rvalue', 'pvalue', 'stderr'], axis=1))
+    return_df = return_df.assign(
+        out_of_range=(return_df['area'] < return_df['min']) |
+                     (return_df['area'] > return_df['max']))
 
     # calculate concentration percentage
-    totals_c = pd.DataFrame(
-        {'totals_c': (return_df.groupby('key')['conc']
-                               .apply(np.sum, axis=0))}
-    ).reset_index()
-    return_df = return_df.merge(totals_c, on=['key'])
-    return_df['conc%'] = return_df['conc']/return_df['totals_c']
-    return_df.drop(['totals_c'], axis=1, inplace=True)
-
-    return return_df.set_index('key')
+    totals_c = (return_df.groupby('key', observed=True)['conc']
+                         .transform('sum'))
+    return_df = return_df.assign(**{'conc%': return_df['conc']/totals_c})
+
+    # propagate calibration uncertainty into prediction intervals
+    if 'var_rf' in return_df:
+        area = return_df['area']
+        pred_var = (return_df['resid_var'] +
+                    area ** 2 * return_df['var_rf'] +
+                    return_df['var_intercept'] +
+                    2 * area * return_df['cov_rf_intercept'])
+        from scipy.stats import t as t_dist
+        with np.errstate(invalid='ignore'):
+            half = (t_dist.ppf(1 - alpha / 2, return_df['dof']) *
+                    np.sqrt(pred_var))
+        return_df = return_df.assign(conc_lo=return_df['conc'] - half,
+                                     conc_hi=return_df['conc'] + half)
+        return_df = return_df.drop(
+            ['rf_lo', 'rf_hi', 'intercept_lo', 'intercept_hi', 'var_rf',
+             'var_intercept', 'cov_rf_intercept', 'resid_var', 'dof'],
+            axis=1)
+
+    return return_df[return_df['key'].notnull()].set_index('key')
 
 
 def concentrations_exp(concentrations, standards):
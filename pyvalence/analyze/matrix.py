@@ -0,0 +1,228 @@
+""" pyvalence.analyze.matrix turns the long output of ``match_area`` or
+    ``concentrations`` into a compound x run matrix without pivoting, for
+    comparing large sequences of runs.
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+
+def _labels(values, categories=None):
+    """ return codes of ``values`` and their labels. Labels are the given
+        ``categories`` in their order, else the sorted observed values.
+    """
+    cat = pd.Categorical(values, categories=categories)
+    if categories is None:
+        cat = cat.as_ordered()
+    return cat.codes.astype(np.int64), pd.Index(cat.categories)
+
+
+def _memmap(arr, path):
+    """ return ``arr`` saved to ``path`` and opened memory mapped
+    """
+    np.save(path, arr)
+    return np.load(path, mmap_mode='r')
+
+
+class CompoundMatrix(object):
+    """ Values of every compound (rows) in every run (columns).
+
+        Parameters
+        ----------
+        values : scipy.sparse.csr_matrix or numpy.ndarray
+            Compound x run matrix. Compounds not found in a run are not
+            stored in the sparse matrix and NaN in the dense one.
+        compounds : pandas.Index
+            Library ids of the rows.
+        runs : pandas.Index
+            Run keys of the columns.
+    """
+    def __init__(self, values, compounds, runs):
+        self.values = values
+        self.compounds = compounds
+        self.runs = runs
+        self._csc = None
+
+    @property
+    def sparse(self):
+        """ bool: True if the values are a sparse matrix.
+        """
+        return not isinstance(self.values, np.ndarray)
+
+    @property
+    def shape(self):
+        """ tuple: number of compounds and runs.
+        """
+        return self.values.shape
+
+    def _positions(self, labels, index, name):
+        """ Non-public method returning positions of ``labels`` in
+            ``index``. Slices and boolean masks are passed through.
+        """
+        if labels is None:
+            return slice(None)
+        if isinstance(labels, slice):
+            return labels
+        labels = np.asarray(labels)
+        if labels.dtype == bool:
+            return np.flatnonzero(labels)
+        pos = index.get_indexer(labels)
+        if (pos < 0).any():
+            raise KeyError('{} not in {}'.format(
+                list(labels[pos < 0]), name))
+        return pos
+
+    def select(self, compounds=None, runs=None):
+        """ Select compounds and runs by label.
+
+            Rows of the sparse matrix are sliced in CSR format and columns
+            in a CSC copy made on the first column selection.
+
+            Parameters
+            ----------
+            compounds : list or slice or numpy.ndarray
+                Optional. Library ids, a positional slice or a boolean
+                mask of the compounds to keep.
+            runs : list or slice or numpy.ndarray
+                Optional. Run keys, a positional slice or a boolean mask
+                of the runs to keep.
+
+            Returns
+            -------
+            CompoundMatrix
+        """
+        rows = self._positions(compounds, self.compounds, 'compounds')
+        cols = self._positions(runs, self.runs, 'runs')
+        values, labels = self.values, self.runs[cols]
+        if self.sparse and runs is not None:
+            if self._csc is None:
+                self._csc = values.tocsc()
+            values = self._csc[:, cols].tocsr()
+            cols = slice(None)
+        values = values[rows][:, cols]
+        return CompoundMatrix(values, self.compounds[rows], labels)
+
+    def normalize(self, method='total', istd=None):
+        """ Scale every run column at once.
+
+            Parameters
+            ----------
+            method : str
+                'total' divides each run by its sum, giving area% or conc%
+                of ``match_area`` or ``concentrations`` values. 'istd'
+                divides each run by the value of its internal standard.
+            istd : str
+                Library id of the internal standard for method 'istd'.
+
+            Returns
+            -------
+            CompoundMatrix
+                Runs whose total or internal standard is missing or zero
+                become NaN.
+        """
+        if method == 'total':
+            if self.sparse:
+                ref = np.asarray(self.values.sum(axis=0)).ravel()
+            else:
+                ref = np.nansum(self.values, axis=0)
+        elif method == 'istd':
+            if istd is None:
+                raise ValueError('istd is required for method istd')
+            row = self._positions([istd], self.compounds, 'compounds')[0]
+            ref = self.values[row]
+            if self.sparse:
+                ref = ref.toarray()
+            ref = np.asarray(ref, dtype=float).ravel()
+        else:
+            raise ValueError('{} not a recognized method'.format(method))
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scale = np.where(ref != 0, 1. / ref, np.nan)
+        if self.sparse:
+            values = self.values.tocsr(copy=True).astype(float)
+            values.data *= scale[values.indices]
+        else:
+            values = self.values * scale
+        return CompoundMatrix(values, self.compounds, self.runs)
+
+    def to_frame(self):
+        """ Return the matrix as a dense DataFrame indexed by 'library_id'
+            with a column per run, like ``pivot_table``.
+        """
+        values = self.values
+        if self.sparse:
+            dense = np.full(self.shape, np.nan)
+            coo = values.tocoo()
+            dense[coo.row, coo.col] = coo.data
+            values = dense
+        return pd.DataFrame(np.asarray(values),
+                            index=self.compounds.rename('library_id'),
+                            columns=self.runs.rename('key'))
+
+
+def compound_matrix(table, value='conc', sparse=True, mmap_dir=None):
+    """ Builds the compound x run matrix of a quantitation table.
+
+        Library ids and run keys are turned into categorical codes, which
+        index the matrix directly, so no intermediate wide frame is built.
+        Values of a compound found more than once in a run are summed and
+        missing values are left out.
+
+        Args
+        ----
+        table : pandas.DataFrame
+            Output of ``match_area`` or ``concentrations`` indexed by run
+            'key' with 'library_id' and ``value`` columns. Runs of a
+            categorical index keep their order, including runs without
+            matches.
+        value : str
+            Column holding the matrix values, e.g. 'area' or 'conc'.
+        sparse : boolean
+            Build a scipy.sparse.csr_matrix instead of a dense array.
+        mmap_dir : str
+            Optional. Folder the arrays are saved to and memory mapped
+            from, so that large matrices are paged in on access.
+
+        Returns
+        -------
+        CompoundMatrix
+    """
+    if table is None or value not in table:
+        print('Not enough info for `compound_matrix`.')
+        return None
+
+    index = table.index
+    categories = (index.categories if isinstance(index, pd.CategoricalIndex)
+                  else None)
+    run_codes, runs = _labels(np.asarray(index), categories)
+    cmp_codes, compounds = _labels(table['library_id'].values)
+    values = table[value].values.astype(float)
+    keep = (run_codes >= 0) & (cmp_codes >= 0) & ~np.isnan(values)
+    run_codes, cmp_codes, values = (run_codes[keep], cmp_codes[keep],
+                                    values[keep])
+    shape = (len(compounds), len(runs))
+
+    if sparse:
+        import scipy.sparse
+        matrix = scipy.sparse.csr_matrix((values, (cmp_codes, run_codes)),
+                                         shape=shape)
+        matrix.sum_duplicates()
+        if mmap_dir is not None:
+            os.makedirs(mmap_dir, exist_ok=True)
+            # the constructor copies its arrays, so replace them after
+            for attr in ('data', 'indices', 'indptr'):
+                setattr(matrix, attr, _memmap(
+                    getattr(matrix, attr),
+                    os.path.join(mmap_dir, attr + '.npy')))
+    else:
+        flat = cmp_codes * shape[1] + run_codes
+        found = np.bincount(flat, minlength=shape[0] * shape[1]) > 0
+        matrix = np.bincount(flat, weights=values,
+                             minlength=shape[0] * shape[1])
+        matrix[~found] = np.nan
+        matrix = matrix.reshape(shape)
+        if mmap_dir is not None:
+            os.makedirs(mmap_dir, exist_ok=True)
+            matrix = _memmap(matrix, os.path.join(mmap_dir, 'values.npy'))
+    return CompoundMatrix(matrix, compounds, runs)
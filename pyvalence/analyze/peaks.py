@@ -1,5 +1,4 @@
-import scipy.signal as signal
-from scipy import integrate
+import numpy as np
 
 
 def find_peaks(x, height=None, threshold=None,
@@ -8,6 +7,7 @@ def find_peaks(x, height=None, threshold=None,
     """ use scipy.signal find peaks ver batim atm
         https://docs.scipy.org/doc/scipy/reference/generated/scipy.signal.find_peaks.html#scipy.signal.find_peaks
     """
+    import scipy.signal as signal
     peaks, _ = signal.find_peaks(
         x, height, threshold, distance, prominence, width, wlen, rel_height
     )
@@ -23,5 +23,38 @@ def integrate(chrom, a, b):
         :param: b
         :return: area under chrome between tme a, b
     """
-    chrom = chrom[(chrom.tme > a) | (chrom.tme <= b)]
-    return integrate.cumtrapz(chrom.tic)
+    from scipy import integrate as sp_integrate
+    tme = chrom.tme.values
+    lo, hi = np.searchsorted(tme, [a, b], 'right')
+    return sp_integrate.cumtrapz(chrom.tic.values[lo:hi])
+
+
+def find_peaks_online(chunks, margin=20, **kwargs):
+    """ find peaks of a signal arriving in chunks, e.g. the tic of the
+        chromatogram chunks of ``AgilentGcmsFollower.follow``
+
+        A peak is reported once ``margin`` samples followed it, so that
+        later data cannot change it. Only the samples since the last
+        reported peak are searched again on every chunk.
+
+        :param: chunks iterable of 1-d arrays
+        :param: margin samples required after a peak before reporting it
+        :param: kwargs passed to find_peaks
+        :return: generator of arrays with the positions of the new peaks
+                 in the whole signal, one per chunk and one for the peaks
+                 at the end of the signal
+    """
+    buf = np.empty(0)
+    offset, last = 0, -1
+    for chunk in chunks:
+        buf = np.concatenate([buf, np.asarray(chunk, dtype=float)])
+        peaks = find_peaks(buf, **kwargs) + offset
+        new = peaks[(peaks > last) & (peaks < offset + len(buf) - margin)]
+        if len(new):
+            last = new[-1]
+            # keep the samples since the last peak
+            start = max(last - margin, offset)
+            buf, offset = buf[start - offset:], start
+        yield new
+    peaks = find_peaks(buf, **kwargs) + offset
+    yield peaks[peaks > last]
@@ -0,0 +1,216 @@
+""" pyvalence.analyze.pipeline chains the gcquant stages over an AgilentGcms
+    collection and memoizes the output of each stage so that only the runs
+    and compounds whose inputs changed are recomputed.
+"""
+
+import hashlib
+import pandas as pd
+
+from .gcquant import (
+    match_area,
+    std_curves,
+    concentrations
+)
+
+
+def _fingerprint(*objs):
+    """ return hex digest identifying the contents of ``objs``
+    """
+    h = hashlib.sha1()
+    for obj in objs:
+        if isinstance(obj, pd.DataFrame):
+            h.update(repr(list(obj.columns)).encode())
+            h.update(pd.util.hash_pandas_object(obj).values.tobytes())
+        elif isinstance(obj, pd.Series):
+            h.update(repr(obj.name).encode())
+            h.update(pd.util.hash_pandas_object(obj).values.tobytes())
+        else:
+            h.update(repr(obj).encode())
+    return h.hexdigest()
+
+
+def _split(df, level='key'):
+    """ return dictionary of ``df`` grouped by ``level``
+    """
+    if df is None:
+        return {}
+    return {key: grp for key, grp in df.groupby(level=level, observed=True)}
+
+
+def _stack(frames, index_name):
+    """ concatenate cached frames and restore categorical columns that
+        were lost by concatenating differing categories
+    """
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return None
+    categories = {col: 'category' for col, ty in frames[0].dtypes.items()
+                  if ty == 'category'}
+    stacked = pd.concat(frames, axis=0).astype(categories)
+    stacked.index = pd.CategoricalIndex(stacked.index, name=index_name)
+    return stacked
+
+
+class Pipeline(object):
+    """ Memoized ``match_area`` -> ``std_curves`` -> ``concentrations``
+        workflow over an AgilentGcms collection.
+
+        Each stage caches its output per run key (or per compound for
+        ``std_curves``) together with a fingerprint of its inputs and
+        parameters. Calling ``run`` again after runs were added or
+        standards changed only recomputes the affected runs and compounds;
+        adding a sample that is not a standard does not recalibrate.
+
+        Parameters
+        ----------
+        standards : pandas.DataFrame
+            Optional. Standards table as expected by ``std_curves``.
+        threshold : float
+            Retention time threshold passed to ``match_area``.
+    """
+    def __init__(self, standards=None, threshold=0.1):
+        self.standards = standards
+        self.threshold = threshold
+        self._matched = {}
+        self._curves = {}
+        self._conc = {}
+        self.recomputed = {}
+
+    def _match_stage(self, agi):
+        """ Non-public method updating ``match_area`` cache per run key.
+        """
+        libs = _split(agi.results_lib)
+        areas = _split(agi.results_tic)
+        fingerprints = {
+            key: _fingerprint(libs[key], areas[key], self.threshold)
+            for key in libs if key in areas
+        }
+        stale = [key for key, fp in fingerprints.items()
+                 if self._matched.get(key, (None,))[0] != fp]
+
+        self._matched = {key: val for key, val in self._matched.items()
+                         if key in fingerprints}
+        if stale:
+            matched = _split(match_area(
+                pd.concat([libs[key] for key in stale]),
+                pd.concat([areas[key] for key in stale]),
+                threshold=self.threshold
+            ))
+            for key in stale:
+                self._matched[key] = (fingerprints[key], matched.get(key))
+        self.recomputed['match_area'] = stale
+
+    def _curves_stage(self):
+        """ Non-public method updating ``std_curves`` cache per compound.
+            Only matched areas of standards runs contribute to a compound's
+            fingerprint.
+        """
+        std = self.standards.set_index('library_id')
+        std_keys = [key for key in std.columns if key in self._matched]
+        compiled = _stack((self._matched[key][1] for key in std_keys), 'key')
+        by_compound = {} if compiled is None else {
+            lid: grp.sort_index()
+            for lid, grp in compiled.groupby('library_id', observed=True)
+        }
+
+        def contributing(lid, row):
+            """ matched rows of runs with a standard for compound ``lid``
+            """
+            grp = by_compound.get(lid, pd.DataFrame())
+            return grp[grp.index.isin(row.index)]
+
+        fingerprints = {}
+        for lid, row in std.iterrows():
+            row = row.dropna().astype(float)
+            fingerprints[lid] = _fingerprint(row, contributing(lid, row))
+        stale = [lid for lid, fp in fingerprints.items()
+                 if self._curves.get(lid, (None,))[0] != fp]
+
+        self._curves = {lid: val for lid, val in self._curves.items()
+                        if lid in fingerprints}
+        if stale:
+            curves = None
+            fitted = [lid for lid in stale if lid in by_compound]
+            if fitted:
+                curves = std_curves(
+                    pd.concat([by_compound[lid] for lid in fitted]),
+                    std.loc[fitted].reset_index()
+                )
+            curves = _split(curves.set_index('library_id')
+                            if curves is not None else None,
+                            level='library_id')
+            for lid in stale:
+                self._curves[lid] = (fingerprints[lid], curves.get(lid))
+        self.recomputed['std_curves'] = stale
+
+    def _conc_stage(self):
+        """ Non-public method updating ``concentrations`` cache per run key.
+        """
+        fingerprints = {}
+        for key, (match_fp, matched) in self._matched.items():
+            lids = [] if matched is None else matched.library_id.unique()
+            fingerprints[key] = _fingerprint(
+                match_fp, [self._curves[lid][0] for lid in lids
+                           if lid in self._curves])
+        stale = [key for key, fp in fingerprints.items()
+                 if self._conc.get(key, (None,))[0] != fp]
+
+        self._conc = {key: val for key, val in self._conc.items()
+                      if key in fingerprints}
+        if stale:
+            conc = _split(concentrations(
+                _stack((self._matched[key][1] for key in stale), 'key'),
+                self.curves
+            ))
+            for key in stale:
+                self._conc[key] = (fingerprints[key], conc.get(key))
+        self.recomputed['concentrations'] = stale
+
+    def run(self, agi, standards=None):
+        """ Run the workflow over ``agi`` reusing cached stage outputs.
+
+            Parameters
+            ----------
+            agi : obj
+                AgilentGcms collection.
+            standards : pandas.DataFrame
+                Optional. Replaces the standards table of the pipeline.
+
+            Returns
+            -------
+            pandas.DataFrame
+                Output of ``concentrations`` for all runs in ``agi``.
+        """
+        if standards is not None:
+            self.standards = standards
+        if agi.results_lib is None or agi.results_tic is None:
+            print('Not enough info for `Pipeline`.')
+            return None
+        if self.standards is None:
+            print('Not enough info for `Pipeline`.')
+            return None
+
+        self._match_stage(agi)
+        self._curves_stage()
+        self._conc_stage()
+        return self.concentrations
+
+    @property
+    def compiled(self):
+        """ pandas.DataFrame: cached ``match_area`` output of all runs.
+        """
+        return _stack((val for _, val in self._matched.values()), 'key')
+
+    @property
+    def curves(self):
+        """ pandas.DataFrame: cached ``std_curves`` output of all compounds.
+        """
+        curves = _stack((val for _, val in self._curves.values()),
+                        'library_id')
+        return None if curves is None else curves.reset_index()
+
+    @property
+    def concentrations(self):
+        """ pandas.DataFrame: cached ``concentrations`` output of all runs.
+        """
+        return _stack((val for _, val in self._conc.values()), 'key')
@@ -0,0 +1,209 @@
+""" pyvalence.analyze.purity scores whether integrated peaks are pure or
+    hide coeluting species, from the spectra of the sparse DATA.MS scans
+    across every peak.
+"""
+
+import numpy as np
+import pandas as pd
+
+from .spectra import _scan_rows
+
+
+def _gather(peaks, spectra):
+    """ return the scans over ``first``..``last`` of every peak of every
+        run stacked into one CSR matrix on a common m/z axis, with the
+        position of every peak's first, apex and last scan in it. Peaks of
+        runs without spectra get position -1.
+    """
+    import scipy.sparse
+    blocks, pos = [], np.full((len(peaks), 3), -1, dtype=np.int64)
+    codes = (peaks.index.codes if isinstance(peaks.index, pd.CategoricalIndex)
+             else pd.factorize(peaks.index)[0])
+    offset = 0
+    for code in np.unique(codes):
+        key = peaks.index[np.argmax(codes == code)]
+        if spectra.get(key) is None:
+            continue
+        scans, _, ions = spectra[key]
+        at = np.flatnonzero(codes == code)
+        first, apex, last = _scan_rows(peaks.iloc[at], scans.shape[0])
+        width = last - first + 1
+        starts = np.cumsum(width) - width
+        rows = np.repeat(first - starts, width) + np.arange(width.sum())
+        starts += offset
+        pos[at] = np.stack([starts, starts + apex - first,
+                            starts + width - 1], axis=1)
+        blocks.append((scans[rows], np.asarray(ions)))
+        offset += width.sum()
+    if not blocks:
+        return None, pos
+
+    mz = np.unique(np.concatenate([ions for _, ions in blocks]))
+    stacked = scipy.sparse.vstack([
+        scipy.sparse.csr_matrix(
+            (mat.data, np.searchsorted(mz, ions)[mat.indices], mat.indptr),
+            shape=(mat.shape[0], len(mz)))
+        for mat, ions in blocks
+    ]).tocsr()
+    return stacked, pos
+
+
+def _edge_selection(pos, nrows):
+    """ return sparse (3 * peaks x rows) matrix averaging the leading edge
+        scans before the apex, the apex scan and the trailing edge scans
+        after it of every peak
+    """
+    import scipy.sparse
+    first, apex, last = pos.T
+    npeaks = len(pos)
+
+    def mean_rows(lo, hi, row_offset):
+        width = np.maximum(hi - lo, 0)
+        starts = np.cumsum(width) - width
+        rows = np.repeat(np.arange(npeaks), width) + row_offset
+        cols = np.repeat(lo - starts, width) + np.arange(width.sum())
+        weights = np.repeat(1. / np.maximum(width, 1), width)
+        return rows, cols, weights
+
+    parts = [mean_rows(first, apex, 0),
+             (np.arange(npeaks) + npeaks, apex, np.ones(npeaks)),
+             mean_rows(apex + 1, last + 1, 2 * npeaks)]
+    rows, cols, weights = (np.concatenate(arr) for arr in zip(*parts))
+    return scipy.sparse.csr_matrix((weights, (rows, cols)),
+                                   shape=(3 * npeaks, nrows))
+
+
+def _cosine(a, b):
+    """ return cosine similarity of the rows of sparse ``a`` and ``b``
+    """
+    dot = np.asarray(a.multiply(b).sum(axis=1)).ravel()
+    norm_a = np.sqrt(np.asarray(a.multiply(a).sum(axis=1)).ravel())
+    norm_b = np.sqrt(np.asarray(b.multiply(b).sum(axis=1)).ravel())
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return dot / (norm_a * norm_b)
+
+
+def _top_ions(spectra, n_ions, min_ratio):
+    """ return (row, column) of the ``n_ions`` most abundant ions of every
+        row of CSR ``spectra``, the most abundant first within each row.
+        Ions below ``min_ratio`` of the most abundant one are left out.
+    """
+    rows = np.repeat(np.arange(spectra.shape[0]), np.diff(spectra.indptr))
+    order = np.lexsort((-spectra.data, rows))
+    rank = np.arange(len(order)) - spectra.indptr[rows[order]]
+    peak = np.zeros(spectra.shape[0])
+    np.maximum.at(peak, rows, spectra.data)
+    keep = order[(rank < n_ions) &
+                 (spectra.data[order] >= min_ratio * peak[rows[order]])]
+    return rows[keep], spectra.indices[keep]
+
+
+def _ion_ratio_cv(scans, pos, apex_spectra, n_ions, min_ratio):
+    """ return mean coefficient of variation, weighted by base ion
+        abundance, of the ratios of the most abundant apex ions to the
+        base ion over the scans of every peak
+    """
+    npeaks = len(pos)
+    peak, ion = _top_ions(apex_spectra, n_ions, min_ratio)
+    if not len(peak):
+        return np.full(npeaks, np.nan)
+    is_base = np.r_[True, peak[1:] != peak[:-1]]
+    base_ion = np.full(npeaks, -1)
+    base_ion[peak[is_base]] = ion[is_base]
+    peak, ion = peak[~is_base], ion[~is_base]
+    if not len(peak):
+        return np.full(npeaks, np.nan)
+
+    # every (peak, ion, scan) over the peak's scans
+    width = pos[peak, 2] - pos[peak, 0] + 1
+    pair = np.repeat(np.arange(len(peak)), width)
+    starts = np.cumsum(width) - width
+    rows = pos[peak, 0][pair] + np.arange(width.sum()) - starts[pair]
+    value = np.asarray(scans[rows, ion[pair]]).ravel()
+    base = np.asarray(scans[rows, base_ion[peak][pair]]).ravel()
+
+    ok = base > 0
+    pair, value, base = pair[ok], value[ok], base[ok]
+    ratio = value / base
+    npair = len(peak)
+    wsum = np.bincount(pair, weights=base, minlength=npair)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = np.bincount(pair, weights=base * ratio, minlength=npair) / wsum
+        var = np.bincount(pair, weights=base * (ratio - mean[pair]) ** 2,
+                          minlength=npair) / wsum
+        cv = np.sqrt(var) / mean
+        total = np.bincount(peak, weights=np.nan_to_num(cv),
+                            minlength=npeaks)
+        counted = np.bincount(peak, weights=np.isfinite(cv),
+                              minlength=npeaks)
+        return total / counted
+
+
+def peak_purity(agi, table='tic', n_ions=4, min_ratio=0.1):
+    """ Scores the purity of every integrated peak of every run.
+
+        The scans over each peak's ``first``..``last`` range are gathered
+        from the CSR scans of all runs into one matrix. The mean spectrum
+        of the leading edge, before the apex scan, and of the trailing
+        edge, after it, are compared to the apex spectrum by cosine
+        similarity, all peaks with one sparse product. A coeluting species
+        changes the spectrum across the peak, which lowers the similarity
+        and makes the ratios of the most abundant apex ions to the base
+        ion vary over the peak's scans.
+
+        Args
+        ----
+        agi : AgilentGcms
+            Collection providing ``results_<table>`` and
+            ``spectra_sparse``.
+        table : str
+            Peak table, the ``results_<table>`` attribute of ``agi``.
+            It must contain 'first', 'max' and 'last' columns with 1-based
+            scan numbers.
+        n_ions : int
+            Number of most abundant apex ions, including the base ion,
+            whose ratios are followed.
+        min_ratio : float
+            Smallest abundance, relative to the base ion at the apex, of
+            the followed ions, so that noise ions are left out.
+
+        Returns
+        -------
+        pandas.DataFrame
+            The peak table with 'purity_lead' and 'purity_trail' cosine
+            similarities, 'ion_ratio_cv' and their combined 'purity', the
+            smallest of the similarities and one minus the ion ratio
+            variation, between 0 and 1. Peaks without spectra, or scans on
+            one side of the apex, are NaN in the affected columns.
+    """
+    peaks = getattr(agi, 'results_' + table)
+    spectra = agi.spectra_sparse
+    if peaks is None or not spectra:
+        print('Not enough info for `peak_purity`.')
+        return None
+
+    scans, pos = _gather(peaks, spectra)
+    result = peaks.copy()
+    npeaks = len(peaks)
+    lead, trail, cv = (np.full(npeaks, np.nan) for _ in range(3))
+    found = pos[:, 0] >= 0
+    if scans is not None and found.any():
+        pos_found = pos[found]
+        edges = _edge_selection(pos_found, scans.shape[0]).dot(scans).tocsr()
+        n = len(pos_found)
+        before, apex, after = edges[:n], edges[n:2 * n], edges[2 * n:]
+        lead[found] = np.where(pos_found[:, 1] > pos_found[:, 0],
+                               _cosine(before, apex), np.nan)
+        trail[found] = np.where(pos_found[:, 2] > pos_found[:, 1],
+                                _cosine(after, apex), np.nan)
+        cv[found] = _ion_ratio_cv(scans, pos_found, apex, n_ions,
+                                   min_ratio)
+
+    result['purity_lead'] = lead
+    result['purity_trail'] = trail
+    result['ion_ratio_cv'] = cv
+    with np.errstate(invalid='ignore'):
+        stability = np.clip(1 - cv, 0, 1)
+    result['purity'] = np.clip(
+        pd.DataFrame([lead, trail, stability]).min(axis=0).values, 0, 1)
+    return result
@@ -0,0 +1,200 @@
+""" pyvalence.analyze.shards runs the quantitation workflow over run lists
+    too large for one process. Runs are split into shards that are built
+    and quantified by independent workers, and the shard results merged.
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .gcquant import (
+    match_area,
+    std_curves,
+    concentrations
+)
+from .pipeline import _stack
+
+
+def results_file(files):
+    """ Returns path of RESULTS.CSV among ``files``, a list of
+        (name, path) as discovered in an Agilent .D folder, or None.
+    """
+    return {name.lower(): path for name, path in files}.get('results.csv')
+
+
+def _shard_results(dir_list):
+    """ return stacked lib and tic tables of the runs in ``dir_list``,
+        reading their RESULTS.CSV only
+    """
+    from ..build import AgilentGcmsDir
+    from ..build.agilentgcms import AgilentGcmsResults
+    tables = {'lib': [], 'tic': []}
+    for path, files in zip(dir_list, AgilentGcmsDir._scandirs(dir_list)):
+        source = results_file(files)
+        if source is None:
+            continue
+        results = AgilentGcmsResults(source)
+        for name, frames in tables.items():
+            df = results[name]
+            if df is not None:
+                frames.append(df.set_axis(pd.Index(
+                    [os.path.basename(path)] * len(df), name='key')))
+    return _stack(tables['lib'], 'key'), _stack(tables['tic'], 'key')
+
+
+def _shard_compiled(dir_list, threshold):
+    """ return ``match_area`` output of the runs in ``dir_list``
+    """
+    lib, tic = _shard_results(dir_list)
+    if lib is None or tic is None:
+        return None
+    return match_area(lib, tic, threshold=threshold)
+
+
+def _match_shard(job):
+    """ Build shard and match its areas. Runs in the workers.
+    """
+    dir_list, threshold = job
+    return _shard_compiled(dir_list, threshold)
+
+
+def _quantify_shard(job):
+    """ Build shard and compute its concentrations with the broadcast
+        calibration curves. Runs in the workers.
+    """
+    dir_list, threshold, curves = job
+    compiled = _shard_compiled(dir_list, threshold)
+    if compiled is None:
+        return None
+    return concentrations(compiled, curves)
+
+
+def _shards(dir_list, shard_size):
+    """ return ``dir_list`` split into lists of at most ``shard_size`` runs
+    """
+    return [dir_list[i:i + shard_size]
+            for i in range(0, len(dir_list), shard_size)]
+
+
+def _checkpointed(executor, dir_list, threshold, shard_size, checkpoint):
+    """ return matched areas of the runs in ``dir_list``, loaded from
+        ``checkpoint`` where it has them and matched in shards otherwise.
+        Every matched run is saved to ``checkpoint``; the runs of shards
+        that raised are passed to its ``fail`` and left out.
+    """
+    runs, pending = {}, []
+    for path in dir_list:
+        runs[path] = checkpoint.load(path)
+        if runs[path] is None:
+            pending.append(path)
+
+    futures = {executor.submit(_match_shard, (shard, threshold)): shard
+               for shard in _shards(pending, shard_size)}
+    for future in as_completed(futures):
+        shard = futures[future]
+        try:
+            compiled = future.result()
+        except Exception as err:
+            for path in shard:
+                checkpoint.fail(path, err)
+            continue
+        for path in shard:
+            if compiled is not None:
+                runs[path] = compiled[compiled.index == os.path.basename(path)]
+            checkpoint.save(path, runs[path])
+    return _stack((runs[path] for path in dir_list
+                   if runs[path] is not None and len(runs[path])), 'key')
+
+
+def quantify(dir_list, standards, threshold=0.1, shard_size=16, workers=None,
+             executor=None, checkpoint=None):
+    """ Computes concentrations of all runs in ``dir_list`` shard by shard.
+
+        The runs named in ``standards`` are matched first and ``std_curves``
+        is fitted once on their merged areas. The curves are then sent to
+        the workers with the shards of the remaining runs, which build
+        their runs, match areas and compute concentrations independently.
+        Only the shard results travel back to be merged.
+
+        With a ``checkpoint``, the matched areas of every run are saved as
+        their shard completes and loaded again by the next call, so an
+        interrupted call resumes where it stopped. All runs are then
+        matched before ``std_curves`` and ``concentrations`` are computed
+        on the merged areas.
+
+        Args
+        ----
+        dir_list : list(str) or str
+            Paths to Agilent .D folders, or a root folder containing them.
+            Runs are keyed by folder name.
+        standards : pandas.DataFrame
+            Standards table as expected by ``std_curves``.
+        threshold : float
+            Retention time threshold passed to ``match_area``.
+        shard_size : int
+            Number of runs per shard.
+        workers : int
+            Optional. Number of processes of the default process pool.
+        executor : concurrent.futures.Executor
+            Optional. Executor that runs the shards, e.g. a cluster
+            client's executor. Functions and arguments are picklable.
+            If omitted, a local ProcessPoolExecutor is used.
+        checkpoint : obj
+            Optional. Store of matched areas with methods ``load(path)``
+            returning the areas of the run at ``path``, empty if it has
+            none, or None if it must be matched; ``save(path, compiled)``
+            receiving the areas of a matched run, None if it has no
+            RESULTS.CSV; ``fail(path, err)`` receiving the exception
+            raised by the shard of the run; and ``save_curves(curves)``
+            receiving the output of ``std_curves``. Failed runs are left
+            out.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Output of ``concentrations`` for all runs.
+    """
+    if isinstance(dir_list, str):
+        from ..build import AgilentGcmsDir
+        dir_list = AgilentGcmsDir._listdirs(dir_list)
+    if standards is None or not len(dir_list):
+        print('Not enough info for `quantify`.')
+        return None
+
+    std_keys = set(standards.columns[1:])
+    std_dirs = [path for path in dir_list
+                if os.path.basename(path) in std_keys]
+    exp_dirs = [path for path in dir_list
+                if os.path.basename(path) not in std_keys]
+
+    own_executor = executor is None
+    if own_executor:
+        executor = ProcessPoolExecutor(workers)
+    try:
+        if checkpoint is not None:
+            compiled = _checkpointed(executor, dir_list, threshold,
+                                     shard_size, checkpoint)
+            curves = std_curves(compiled, standards)
+            if curves is None:
+                return None
+            checkpoint.save_curves(curves)
+            return concentrations(compiled, curves)
+        std_compiled = _stack(executor.map(
+            _match_shard,
+            [(shard, threshold) for shard in _shards(std_dirs, shard_size)]
+        ), 'key')
+        curves = std_curves(std_compiled, standards)
+        if curves is None:
+            return None
+        results = list(executor.map(
+            _quantify_shard,
+            [(shard, threshold, curves)
+             for shard in _shards(exp_dirs, shard_size)]
+        ))
+    finally:
+        if own_executor:
+            executor.shutdown()
+
+    results.insert(0, concentrations(std_compiled, curves))
+    return _stack(results, 'key')
@@ -0,0 +1,125 @@
+""" pyvalence.analyze.smoothing filters the traces of stacked multi-run
+    chromatograms without mixing neighbouring runs.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+
+def _run_bounds(index):
+    """ return start and stop rows of every run of stacked ``index``
+    """
+    codes = (index.codes if isinstance(index, pd.CategoricalIndex)
+             else pd.factorize(index)[0])
+    bounds = np.flatnonzero(np.diff(codes)) + 1
+    return np.r_[0, bounds], np.r_[bounds, len(codes)]
+
+
+def _kernel(method, window, polyorder, sigma):
+    """ return convolution kernel of smoothing ``method``
+    """
+    if window < 1 or window % 2 == 0:
+        raise ValueError('window must be a positive odd number')
+    if method == 'savgol':
+        import scipy.signal as signal
+        return signal.savgol_coeffs(window, polyorder)
+    if method == 'moving_average':
+        return np.full(window, 1. / window)
+    if method == 'gaussian':
+        sigma = window / 6. if sigma is None else sigma
+        half = np.arange(window) - window // 2
+        kernel = np.exp(-.5 * (half / sigma) ** 2)
+        return kernel / kernel.sum()
+    raise ValueError('{} not a recognized method'.format(method))
+
+
+def _convolve_runs(x, starts, stops, kernel):
+    """ return ``x`` convolved with ``kernel`` run by run. Every run is
+        padded with its mirrored edges, all padded runs are convolved in
+        one call and the padding is dropped again.
+    """
+    half = len(kernel) // 2
+    lengths = stops - starts
+    padded = lengths + 2 * half
+    offsets = np.cumsum(padded) - padded
+
+    # source row of every padded position, mirrored into its own run
+    seg = np.repeat(np.arange(len(starts)), padded)
+    pos = np.arange(padded.sum()) - offsets[seg] - half + starts[seg]
+    first, last = starts[seg], stops[seg] - 1
+    pos = np.where(pos < first, 2 * first - pos, pos)
+    pos = np.where(pos > last, 2 * last - pos, pos)
+    pos = np.clip(pos, first, last)
+
+    valid = np.convolve(x[pos], kernel[::-1], 'valid')
+    keep = np.repeat(offsets - np.cumsum(lengths) + lengths, lengths)
+    return valid[np.arange(lengths.sum()) + keep]
+
+
+def smooth(chrom, columns=None, method='savgol', window=11, polyorder=2,
+           sigma=None, threads=None):
+    """ Smooths the traces of a stacked multi-run chromatogram.
+
+        Runs are delimited by the ``key`` index, so the filter never
+        reaches across a run boundary; the edges of every run are
+        mirrored. All runs are filtered with a single convolution, or
+        with one convolution per group of runs if ``threads`` is given.
+
+        Args
+        ----
+        chrom : pandas.DataFrame
+            Stacked chromatogram indexed by run ``key`` with runs in
+            contiguous rows, e.g. ``AgilentGcms.chromatogram``.
+        columns : str or list(str)
+            Optional. Columns to smooth. Defaults to all columns except
+            'tme'.
+        method : str
+            'savgol' for Savitzky-Golay, 'moving_average' or 'gaussian'.
+        window : int
+            Odd number of points of the filter window.
+        polyorder : int
+            Polynomial order of the Savitzky-Golay filter.
+        sigma : float
+            Optional. Standard deviation of the Gaussian filter in points.
+            Defaults to ``window / 6``.
+        threads : int
+            Optional. Filter groups of runs concurrently in this many
+            threads.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Copy of ``chrom`` with smoothed ``columns``.
+    """
+    if chrom is None or chrom.empty:
+        print('Not enough info for `smooth`.')
+        return None
+    if columns is None:
+        columns = [col for col in chrom.columns if col != 'tme']
+    elif isinstance(columns, str):
+        columns = [columns]
+
+    kernel = _kernel(method, window, polyorder, sigma)
+    starts, stops = _run_bounds(chrom.index)
+    groups = np.array_split(np.arange(len(starts)), threads or 1)
+    groups = [grp for grp in groups if len(grp)]
+
+    result = chrom.copy()
+    for col in columns:
+        x = chrom[col].values.astype(float)
+        out = np.empty_like(x)
+
+        def run(grp):
+            lo, hi = starts[grp[0]], stops[grp[-1]]
+            out[lo:hi] = _convolve_runs(x[lo:hi], starts[grp] - lo,
+                                        stops[grp] - lo, kernel)
+
+        if len(groups) > 1:
+            with ThreadPoolExecutor(len(groups)) as pool:
+                list(pool.map(run, groups))
+        else:
+            run(groups[0])
+        result[col] = out.astype(chrom[col].dtype)
+    return result
@@ -0,0 +1,119 @@
+""" pyvalence.analyze.spectra extracts the mass spectra behind integrated
+    peaks straight from the sparse DATA.MS scans.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _scan_rows(peaks, nscans):
+    """ return 0-based scan rows of the 1-based ``first``, ``max`` and
+        ``last`` scan numbers of ``peaks``, clipped to the run. Missing
+        ``first`` or ``last`` scans fall back to the apex.
+    """
+    def rows(col):
+        return peaks[col].to_numpy(float, na_value=np.nan) - 1
+    first, apex, last = rows('first'), rows('max'), rows('last')
+    apex = np.where(np.isnan(apex), (first + last) // 2, apex)
+    first = np.where(np.isnan(first), apex, first)
+    last = np.where(np.isnan(last), apex, last)
+    first, apex, last = (np.clip(np.nan_to_num(arr), 0, nscans - 1)
+                         .astype(np.int64) for arr in (first, apex, last))
+    return np.minimum(first, apex), apex, np.maximum(last, apex)
+
+
+def _selection(first, apex, last, nscans, mode):
+    """ return sparse (peak x scan) matrix which, multiplied with the scans
+        of a run, gives the spectrum of every peak for ``mode``.
+    """
+    import scipy.sparse
+    npeaks = len(apex)
+    if mode == 'apex':
+        rows, cols = np.arange(npeaks), apex
+        weights = np.ones(npeaks)
+    elif mode == 'mean':
+        width = last - first + 1
+        starts = np.cumsum(width) - width
+        rows = np.repeat(np.arange(npeaks), width)
+        cols = (np.repeat(first - starts, width) +
+                np.arange(width.sum()))
+        weights = np.repeat(1. / width, width)
+    elif mode == 'background_subtracted':
+        rows = np.tile(np.arange(npeaks), 3)
+        cols = np.concatenate([apex, first, last])
+        weights = np.repeat([1., -.5, -.5], npeaks)
+    else:
+        raise ValueError('{} not a recognized mode'.format(mode))
+    return scipy.sparse.csr_matrix((weights, (rows, cols)),
+                                   shape=(npeaks, nscans))
+
+
+def peak_spectra(agi, table='tic', mode='apex'):
+    """ Gathers the mass spectrum of every integrated peak in every run.
+
+        Peaks are located by the ``first``, ``max`` and ``last`` scan
+        numbers of the RESULTS.CSV peak table. For each run a sparse
+        selection matrix over the scans is built for all its peaks at
+        once and multiplied with the run's CSR scans, so no spectra are
+        densified.
+
+        Args
+        ----
+        agi : AgilentGcms
+            Collection providing ``results_<table>`` and
+            ``spectra_sparse``.
+        table : str
+            Peak table, the ``results_<table>`` attribute of ``agi``.
+            It must contain 'peak', 'first', 'max' and 'last' columns
+            with 1-based scan numbers.
+        mode : str
+            'apex' for the spectrum at the peak maximum, 'mean' for the
+            average spectrum over ``first``..``last``, or
+            'background_subtracted' for the apex spectrum minus the mean
+            of the ``first`` and ``last`` scans, clipped at zero.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Sparse DataFrame with one row per (key, peak) and one column
+            per ion m/z.
+    """
+    peaks = getattr(agi, 'results_' + table)
+    spectra = agi.spectra_sparse
+    if peaks is None or not spectra:
+        print('Not enough info for `peak_spectra`.')
+        return None
+
+    runs, labels = [], []
+    for key, grp in peaks.groupby(level='key', observed=True):
+        if spectra.get(key) is None:
+            continue
+        scans, _, ions = spectra[key]
+        sel = _selection(*_scan_rows(grp, scans.shape[0]),
+                         nscans=scans.shape[0], mode=mode)
+        runs.append((sel.dot(scans).tocsr(), ions))
+        labels.append(pd.MultiIndex.from_arrays(
+            [np.repeat(key, len(grp)), grp['peak'].values],
+            names=['key', 'peak']))
+
+    if not runs:
+        print('Not enough info for `peak_spectra`.')
+        return None
+
+    # map the ions of every run onto one sorted m/z axis
+    import scipy.sparse
+    ions = np.unique(np.concatenate([run_ions for _, run_ions in runs]))
+    stacked = scipy.sparse.vstack([
+        scipy.sparse.csr_matrix(
+            (mat.data, np.searchsorted(ions, run_ions)[mat.indices],
+             mat.indptr),
+            shape=(mat.shape[0], len(ions)))
+        for mat, run_ions in runs
+    ]).tocsr()
+    if mode == 'background_subtracted':
+        np.maximum(stacked.data, 0, out=stacked.data)
+    stacked.eliminate_zeros()
+
+    index = labels[0].append(labels[1:]) if len(labels) > 1 else labels[0]
+    return pd.DataFrame.sparse.from_spmatrix(stacked, index=index,
+                                             columns=ions)
@@ -0,0 +1,151 @@
+""" pyvalence.analyze.targetion quantifies species from extracted ion
+    traces of the DATA.MS scans rather than from the TIC areas of
+    RESULTS.CSV, so coeluting species do not inflate each other.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def _channels(method):
+    """ return m/z and owning compound of every target and qualifier ion
+        channel of ``method``, and the expected ratio of each qualifier.
+    """
+    ncomp = len(method)
+    mzs = [method['target'].values.astype(float)]
+    owner = [np.arange(ncomp)]
+    ratios = [np.full(ncomp, np.nan)]
+    if 'qualifiers' in method:
+        quals = [np.atleast_1d(q) if q is not None else np.empty(0)
+                 for q in method['qualifiers']]
+        counts = np.array([len(q) for q in quals], dtype=int)
+        mzs.append(np.concatenate(quals).astype(float) if counts.sum()
+                   else np.empty(0))
+        owner.append(np.repeat(np.arange(ncomp), counts))
+        if 'ratios' in method:
+            # qualifiers of a compound without ratios expect none
+            ratios.append(np.concatenate(
+                [np.full(len(q), np.nan) if r is None else np.atleast_1d(r)
+                 for q, r in zip(quals, method['ratios'])]).astype(float)
+                if counts.sum() else np.empty(0))
+        else:
+            ratios.append(np.full(counts.sum(), np.nan))
+    return (np.concatenate(mzs), np.concatenate(owner),
+            np.concatenate(ratios))
+
+
+def _integrate(eic, times, lo, hi):
+    """ return trapezoid area of every channel of ``eic`` between scan
+        ``lo`` and ``hi`` above the straight baseline joining them, and
+        the scan of the channel's apex within the window.
+    """
+    nscans, nchan = eic.shape
+    cum = np.zeros((nscans, nchan))
+    np.cumsum((eic[1:] + eic[:-1]) / 2 * np.diff(times)[:, None],
+              axis=0, out=cum[1:])
+    chan = np.arange(nchan)
+    baseline = (eic[lo, chan] + eic[hi, chan]) / 2 * (times[hi] - times[lo])
+    area = np.clip(cum[hi, chan] - cum[lo, chan] - baseline, 0, None)
+
+    scans = np.arange(nscans)[:, None]
+    inside = (scans >= lo) & (scans <= hi)
+    apex = np.where(inside, eic, -np.inf).argmax(axis=0)
+    return area, apex
+
+
+def target_area(agi, method, mz_tol=0.3, ratio_tol=0.2):
+    """ Integrates target and qualifier ion traces of every compound of a
+        quantitation method in every run.
+
+        The extracted ion traces of all ions of the method are computed
+        for a run at once as a product of its sparse scans with an ion
+        selection matrix, and integrated over each compound's retention
+        time window with a cumulative trapezoid. The result has the shape
+        of the ``match_area`` output and can be passed to ``std_curves``
+        and ``concentrations``.
+
+        Args
+        ----
+        agi : AgilentGcms
+            Collection providing ``spectra_sparse``.
+        method : pandas.DataFrame
+            One row per compound with columns 'library_id', 'target'
+            (target ion m/z), 'rt_min' and 'rt_max' (retention time
+            window). Optional 'qualifiers' holds a list of qualifier ion
+            m/z per compound and 'ratios' the expected qualifier to target
+            area ratio of each qualifier.
+        mz_tol : float
+            Ions within ``mz_tol`` of a method m/z contribute to its trace.
+        ratio_tol : float
+            Relative tolerance on the qualifier ratios. A compound is
+            'qualified' if every qualifier with an expected ratio is
+            within ``ratio_tol`` of it.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Indexed by run 'key' with the columns 'library_id', 'rt' (apex
+            of the target trace), 'area' (target ion area), 'area%' and
+            'qualified'.
+    """
+    spectra = agi.spectra_sparse
+    if method is None or not spectra:
+        print('Not enough info for `target_area`.')
+        return None
+
+    import scipy.sparse
+    mzs, owner, ratios = _channels(method)
+    ncomp = len(method)
+    has_ratio = ~np.isnan(ratios)
+    rt_min = method['rt_min'].values.astype(float)
+    rt_max = method['rt_max'].values.astype(float)
+
+    keys, rts, areas, qualified = [], [], [], []
+    for key in agi.keys:
+        if spectra.get(key) is None:
+            continue
+        scans, times, ions = spectra[key]
+        if not len(times):
+            continue
+
+        # ion x channel selection matrix
+        ion_idx, chan_idx = np.nonzero(
+            np.abs(ions[:, None] - mzs[None, :]) <= mz_tol)
+        select = scipy.sparse.csr_matrix(
+            (np.ones(len(ion_idx)), (ion_idx, chan_idx)),
+            shape=(len(ions), len(mzs)))
+        eic = np.asarray(scans.dot(select).todense())
+
+        lo = np.searchsorted(times, rt_min[owner], 'left')
+        hi = np.searchsorted(times, rt_max[owner], 'right') - 1
+        lo, hi = np.clip(lo, 0, len(times) - 1), np.clip(hi, 0, None)
+        hi = np.maximum(hi, lo)
+        area, apex = _integrate(eic, times, lo, hi)
+
+        target = area[:ncomp]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            observed = area / target[owner]
+        off = has_ratio & ~(np.abs(observed - ratios) <= ratio_tol * ratios)
+        failed = np.bincount(owner[off], minlength=ncomp) > 0
+
+        keys.append(np.repeat(key, ncomp))
+        rts.append(times[apex[:ncomp]])
+        areas.append(target)
+        qualified.append(~failed & (target > 0))
+
+    if not keys:
+        print('Not enough info for `target_area`.')
+        return None
+
+    result = pd.DataFrame({
+        'library_id': pd.Categorical(np.tile(method['library_id'].values,
+                                             len(keys))),
+        'rt': np.concatenate(rts).astype('f4'),
+        'area': np.concatenate(areas),
+        'qualified': np.concatenate(qualified)
+    }, index=pd.CategoricalIndex(np.concatenate(keys),
+                                 categories=list(agi.keys), name='key'))
+    result['area%'] = (result.area /
+                       result.groupby(level='key', observed=True)
+                             .area.transform('sum'))
+    return result
@@ -1,6 +1,29 @@
-from .agilentgcms import (
-    AgilentGcms,
-    AgilentGcmsDir,
-    AgilentGcmsDataMs,
-    AgilentGcmsResults,
-)
+""" pyvalence.build loads its submodules on first access of one of their
+    classes, so that importing it stays cheap.
+"""
+import importlib
+
+_attributes = {
+    'AgilentGcms': 'agilentgcms',
+    'AgilentGcmsDir': 'agilentgcms',
+    'AgilentGcmsDataMs': 'agilentgcms',
+    'AgilentGcmsResults': 'agilentgcms',
+    'AgilentGcmsFollower': 'agilentgcms',
+    'RunCache': 'cache'
+}
+
+__all__ = list(_attributes)
+
+
+def __getattr__(name):
+    if name in _attributes:
+        module = importlib.import_module('.' + _attributes[name], __name__)
+        value = getattr(module, name)
+        globals()[name] = value
+        return value
+    raise AttributeError(
+        'module {!r} has no attribute {!r}'.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_attributes))
@@ -2,16 +2,62 @@
 """
 import re
 import csv
+import io
 import os
 import struct
+import time
+import shutil
+import asyncio
+import tempfile
+import weakref
+import fnmatch
+import multiprocessing
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import pandas as pd
-import scipy.sparse
+from pandas.api.types import union_categoricals
+from . import store
+from .cache import RunCache
+
+
+def _open_binary(source):
+    """ return binary file object for ``source``, which is either a path
+        or the contents of the file as bytes.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return io.BytesIO(source)
+    return open(source, 'rb')
+
+
+def _open_text(source):
+    """ return text file object for ``source``, which is either a path
+        or the contents of the file as bytes.
+    """
+    if isinstance(source, (bytes, bytearray)):
+        return io.TextIOWrapper(io.BytesIO(source))
+    return open(source)
+
+
+def _decode_spectra(job):
+    """ Decode spectra of DATA.MS file into memory mapped spectra
+        partition of ``cache_dir``. Runs in worker processes so only
+        ``key`` is sent back to the parent.
+    """
+    file_path, cache_dir, key = job
+    if not store.is_current(cache_dir, key, file_path):
+        AgilentGcmsDataMs._read_spectra_sparse(
+            file_path, store.spectra_allocator(cache_dir, key))
+        store.mark_current(cache_dir, key, file_path)
+    return key
+
 
 class AgilentGcmsTableBase(object):
     """ Base class for Agilent GCMS builders. This class should not be
         instantiated directly.
     """
+    _nullable = {'i4': 'Int32', 'i8': 'Int64'}
+
     @classmethod
     def _clean_name(cls, item):
         """ return clean name from colstr item.
@@ -30,6 +76,14 @@ class AgilentGcmsTableBase(object):
         """
         return [cls._clean_name(colstr[col]) for col in header]
 
+    @classmethod
+    def _pd_dtypes(cls, header, colstr):
+        """ return mapping of column name to declared type from colstr
+            items, including columns declared with type None.
+        """
+        return {cls._clean_name(colstr[col]): cls._np_type(colstr[col])
+                for col in header}
+
     @classmethod
     def _column_structure(cls, header, keys):
         """ match table colstr with header read from file
@@ -52,11 +106,24 @@ class AgilentGcmsTableBase(object):
 
     def _as_dataframe(self, header, data):
         """ transform results of reader function to pandas.DataFrame
-            with appropriate column names and data types
+            with appropriate column names and data types. Numeric fields
+            that cannot be parsed, e.g. blank ones, become missing values,
+            which is why integer columns use the nullable integer types.
+            Columns declared with type None are dropped.
         """
         key, colstr = self._column_structure(header, self.col_keys)
+        dtypes = self._pd_dtypes(header, colstr)
         df = (pd.DataFrame(data, columns=self._pd_columns(header, colstr))
-                .apply(pd.to_numeric, errors='ignore'))
+                .drop([col for col, ty in dtypes.items() if ty is None],
+                      axis=1))
+        for col, ty in dtypes.items():
+            if ty is None:
+                continue
+            if ty == 'category':
+                df[col] = df[col].astype(ty)
+            else:
+                df[col] = pd.to_numeric(df[col], errors='coerce').astype(
+                    self._nullable.get(ty, ty))
         return (key, df)
 
     def _build_data(self):
@@ -66,6 +133,14 @@ class AgilentGcmsTableBase(object):
             return self._as_dataframe(tbl[0], tbl[1:])
         return {key: df for key, df in map(build, self._tables)}
 
+    def _parse(self):
+        """ Non-public method building all tables now and dropping the
+            lines they were read from.
+        """
+        if not self._data:
+            self._data = self._build_data()
+        self._tables = []
+
     def _access(self, key):
         """ provide access to key in data with appropriate
             exception handling
@@ -86,42 +161,42 @@ class AgilentGcmsResults(AgilentGcmsTableBase):
         and mutation of tables into single pandas df
 
         Arguments:
-            file_path: path to RESULTS.CSV file
+            file_path: path to RESULTS.CSV file or its contents as bytes
     """
     __tic_colstr = {
-        'Header=': ('header=', 'O'),
+        'Header=': ('header=', None),
         'Peak': ('peak', 'i4'),
         'R.T.': ('rt', 'f4'),
         'First': ('first', 'i4'),
         'Max': ('max', 'i4'),
         'Last': ('last', 'i4'),
-        'PK  TY': ('pk_ty', 'O'),
+        'PK  TY': ('pk_ty', 'category'),
         'Height': ('height', 'i4'),
-        'Area': ('area', 'i4'),
+        'Area': ('area', 'i8'),
         'Pct Max': ('pct_max', 'f4'),
         'Pct Total': ('pct_total', 'f4')
     }
 
     __lib_colstr = {
-        'Header=': ('header=', 'O'),
+        'Header=': ('header=', None),
         'PK': ('pk', 'i4'),
         'RT': ('rt', 'f4'),
         'Area Pct': ('pct_area', 'f4'),
-        'Library/ID': ('library_id', 'O'),
+        'Library/ID': ('library_id', 'category'),
         'Ref': ('ref', 'i4'),
-        'CAS': ('cas', 'O'),
+        'CAS': ('cas', 'category'),
         'Qual': ('qual', 'i4'),
     }
 
     __fid_colstr = {
-        'Header=': ('header=', 'O'),
+        'Header=': ('header=', None),
         'Peak': ('peak', 'i4'),
         'R.T.': ('rt', 'f4'),
         'Start': ('first', 'i4'),
         'End': ('end', 'i4'),
-        'PK TY': ('pk_ty', '0'),
+        'PK TY': ('pk_ty', 'category'),
         'Height': ('height', 'i4'),
-        'Area': ('area', 'i4'),
+        'Area': ('area', 'i8'),
         'Pct Max': ('pct_max', 'f4'),
         'Pct Total': ('pct_total', 'f4')
     }
@@ -179,7 +254,8 @@ class AgilentGcmsResults(AgilentGcmsTableBase):
             except StopIteration as e:
                 return meta, tables
 
-        return scan_csv(csv.reader(open(file_path)))
+        with _open_text(file_path) as f:
+            return scan_csv(csv.reader(f))
 
     def __init__(self, file_path):
         super().__init__(self.__colstr_key, self._results_reader, file_path)
@@ -208,8 +284,8 @@ class AgilentGcmsDataMs(AgilentGcmsTableBase):
 
         Parameters
         ----------
-        file_path : str
-            Path to DATA.MS file.
+        file_path : str or bytes
+            Path to DATA.MS file or its contents as bytes.
     """
 
     __chrom_colstr = {
@@ -229,6 +305,13 @@ class AgilentGcmsDataMs(AgilentGcmsTableBase):
             return __colstr_key[attr]
         return None
 
+    @staticmethod
+    def _read_nscans(f):
+        """ return number of scans of open DATA.MS file ``f``
+        """
+        f.seek(0x118)
+        return struct.unpack('>H', f.read(2))[0]
+
     @staticmethod
     def _read_chromatogram(file_path):
         """ Extract tic and tme data from DATA.MS file
@@ -242,15 +325,10 @@ class AgilentGcmsDataMs(AgilentGcmsTableBase):
                 from the DATA.MS file as [tic, tme].
         """
 
-        f = open(file_path, 'rb')
+        f = _open_binary(file_path)
         resolution = 0.0001 #desired time resolution in seconds
         
-        f.seek(0x5)             # get number of scans to read in
-        if f.read(4) == 'GC':
-            f.seek(0x142)
-        else:
-            f.seek(0x118)
-        nscans = struct.unpack('>H', f.read(2))[0]
+        nscans = AgilentGcmsDataMs._read_nscans(f)
 
         f.seek(0x10A)            # find the starting location of the data
         f.seek(2 * struct.unpack('>H', f.read(2))[0] - 2)
@@ -277,31 +355,35 @@ class AgilentGcmsDataMs(AgilentGcmsTableBase):
         return [], [jj]
     
     @staticmethod
-    def _read_spectra(file_path):
-        """ Extract chromatogram data from DATA.MS file
+    def _read_spectra_sparse(file_path, alloc=None):
+        """ Extract sparse spectra from DATA.MS file
 
             Args:
                 file_path (str): path to DATA.MS file
+                alloc (callable): optional ``alloc(name, shape, dtype)``
+                    returning the array that ``data``, ``indices``,
+                    ``indptr``, ``times`` or ``ions`` is decoded into,
+                    e.g. a memory mapped array. Defaults to numpy.empty.
 
             Returns:
-                pandas DataFrame with chromatograph ions as columns,
-                time as index, measurements as values
+                (data, times, ions): ``data`` is a scipy.sparse.csr_matrix
+                with one row per scan and one column per ion, ``times``
+                and ``ions`` label its rows and columns.
         """
-        f = open(file_path, 'rb')
+        f = _open_binary(file_path)
 
-        f.seek(0x5)             # get number of scans to read in
-        if f.read(4) == 'GC':   # GC and LC chemstation store in different places
-            f.seek(0x142)
-        else:
-            f.seek(0x118)
-        nscans = struct.unpack('>H', f.read(2))[0]
+        nscans = AgilentGcmsDataMs._read_nscans(f)
 
         f.seek(0x10A)
         f.seek(2 * struct.unpack('>H', f.read(2))[0] - 2)
         dstart = f.tell()
 
+        if alloc is None:
+            def alloc(name, shape, dtype):
+                return np.empty(shape, dtype=dtype)
+
         tot_pts = 0             # determine total number of measurements in file
-        rowst = np.empty(nscans + 1, dtype=int)
+        rowst = np.empty(nscans + 1, dtype=np.int64)
         rowst[0] = 0
 
         for scn in range(nscans):
@@ -309,18 +391,23 @@ class AgilentGcmsDataMs(AgilentGcmsTableBase):
             npos = f.tell() + 2 * struct.unpack('>H', f.read(2))[0]
 
             # keep a running total of how many measurements
-            tot_pts += (npos - f.tell() - 26) / 4
+            tot_pts += (npos - f.tell() - 26) // 4
             rowst[scn + 1] = tot_pts
             f.seek(npos)        # move forward
 
         # go back to the beginning and load all the other data
         f.seek(dstart)
 
+        # int32 indices keep scipy from copying the index arrays
+        idx_type = np.int32 if tot_pts < 2 ** 31 else np.int64
+        indptr = alloc('indptr', nscans + 1, idx_type)
+        indptr[:] = rowst
+
         ions = []
         i_lkup = {}
-        cols = np.empty(int(tot_pts), dtype=np.int)
-        vals = np.empty(int(tot_pts), dtype=np.int)
-        times = np.empty(nscans)
+        cols = alloc('indices', tot_pts, idx_type)
+        vals = np.empty(tot_pts, dtype=np.int64)
+        times = alloc('times', nscans, np.float64)
 
         for scn in range(nscans):
             npos = f.tell() + 2 * struct.unpack('>H', f.read(2))[0]
@@ -341,25 +428,244 @@ class AgilentGcmsDataMs(AgilentGcmsTableBase):
             f.seek(npos)
         f.close()
 
-        vals = ((vals & 16383) * 8 ** (vals >> 14)).astype(float)
+        data = alloc('data', tot_pts, np.float64)
+        data[:] = (vals & 16383) * 8 ** (vals >> 14)
+        import scipy.sparse
         data = scipy.sparse.csr_matrix(
-            (vals, cols, rowst),
+            (data, cols, indptr),
             shape=(nscans, len(ions)),
-            dtype=float
+            copy=False
         )
-        ions = np.array(ions) / 20.
+        ions_mz = alloc('ions', len(ions), np.float64)
+        ions_mz[:] = np.array(ions, dtype=np.float64) / 20.
+        return data, times, ions_mz
+
+    @staticmethod
+    def _read_header(file_path):
+        """ Read run information from the fixed header of DATA.MS file and
+            the retention time of its first scan. No other scan is read.
+
+            Args:
+                file_path (str): path to DATA.MS file
+
+            Returns:
+                dict of ``file_type``, ``sample``, ``operator``, ``date``,
+                ``instrument``, ``method``, ``nscans`` and ``tmin``.
+        """
+        f = _open_binary(file_path)
+
+        def pascal_str(offset):
+            f.seek(offset)
+            size = f.read(1)
+            size = size[0] if size else 0
+            return f.read(size).decode('ascii', 'replace').strip('\x00 ')
+
+        header = {
+            'file_type': pascal_str(0x4),
+            'sample': pascal_str(0x18),
+            'operator': pascal_str(0x94),
+            'date': pascal_str(0xB2),
+            'instrument': pascal_str(0xD0),
+            'method': pascal_str(0xE4)
+        }
+
+        nscans = AgilentGcmsDataMs._read_nscans(f)
+
+        f.seek(0x10A)
+        # the first scan starts 2 bytes before, with its size in words
+        f.seek(2 * struct.unpack('>H', f.read(2))[0])
+        first = f.read(4)
+        f.close()
+
+        header['nscans'] = nscans
+        header['tmin'] = (struct.unpack('>I', first)[0] / 60000.
+                          if nscans and len(first) == 4 else np.nan)
+        return header
+
+    @classmethod
+    def _read_tmax(cls, file_path):
+        """ return retention time of the last scan of DATA.MS file, found
+            by walking all scan headers.
+        """
+        times = cls._read_scan_index(file_path)['time']
+        return times[-1] if len(times) else np.nan
+
+    @staticmethod
+    def _read_scan_index(file_path):
+        """ Walk scan headers of DATA.MS file without decoding the scans
+
+            Args:
+                file_path (str): path to DATA.MS file
+
+            Returns:
+                numpy structured array with the byte ``offset``, number of
+                points ``npts`` and retention ``time`` of every scan.
+        """
+        f = _open_binary(file_path)
+
+        nscans = AgilentGcmsDataMs._read_nscans(f)
+
+        f.seek(0x10A)
+        pos = 2 * struct.unpack('>H', f.read(2))[0] - 2
+
+        index = np.empty(nscans, dtype=[('offset', 'i8'), ('npts', 'i4'),
+                                        ('time', 'f8')])
+        for scn in range(nscans):
+            f.seek(pos)
+            nwords, tme = struct.unpack('>HI', f.read(6))
+            index[scn] = (pos, (2 * nwords - 28) // 4, tme / 60000.)
+            pos += 2 * nwords
+        f.close()
+        return index
+
+    @staticmethod
+    def _read_scans(file_path, index):
+        """ Decode the consecutive scans of DATA.MS file listed in ``index``
+            with a single read.
+
+            Args:
+                file_path (str): path to DATA.MS file
+                index (numpy.ndarray): consecutive rows of scan index
+
+            Returns:
+                (data, times, ions): as ``_read_spectra_sparse`` with the
+                ions of the decoded scans in ascending order.
+        """
+        lo = hi = 0
+        if len(index):
+            lo = index['offset'][0]
+            hi = index['offset'][-1] + 28 + 4 * int(index['npts'][-1])
+        f = _open_binary(file_path)
+        f.seek(lo)
+        block = f.read(hi - lo)
+        f.close()
+        return AgilentGcmsDataMs._decode_scans(block, lo, index)
+
+    @staticmethod
+    def _decode_scans(block, lo, index):
+        """ Decode the scans listed in ``index`` from bytes ``block`` read
+            from file offset ``lo`` of DATA.MS file.
+
+            Args:
+                block (bytes): contents of DATA.MS from offset ``lo``
+                lo (int): file offset of ``block``
+                index (numpy.ndarray): rows of scan index within ``block``
+
+            Returns:
+                (data, times, ions): see ``_read_scans``.
+        """
+        npts = index['npts'].astype(np.int64)
+        indptr = np.zeros(len(index) + 1, dtype=np.int64)
+        np.cumsum(npts, out=indptr[1:])
+        words = np.frombuffer(block, dtype='>u2', count=len(block) // 2)
+
+        # each scan has an 18 byte header before its (ion, abundance) pairs
+        first = (index['offset'] - lo + 18) // 2
+        pairs = (np.repeat(first - 2 * indptr[:-1], npts) +
+                 2 * np.arange(indptr[-1]))
+        ions, cols = np.unique(words[pairs], return_inverse=True)
+        vals = words[pairs + 1].astype(np.int64)
+
+        import scipy.sparse
+        data = scipy.sparse.csr_matrix(
+            ((vals & 16383) * 8. ** (vals >> 14), cols.ravel(), indptr),
+            shape=(len(index), len(ions))
+        )
+        return data, np.array(index['time']), ions / 20.
+
+    @classmethod
+    def _read_spectra(cls, file_path):
+        """ Extract chromatogram data from DATA.MS file
+
+            Args:
+                file_path (str): path to DATA.MS file
+
+            Returns:
+                pandas DataFrame with chromatograph ions as columns,
+                time as index, measurements as values
+        """
+        data, times, ions = cls._read_spectra_sparse(file_path)
         return pd.DataFrame(data=data.todense(), index=times, columns=ions)
 
     def __init__(self, file_path):
-        self._spectra = self._read_spectra(file_path)
+        self._file_path = file_path
+        self._spectra = None
+        self._spectra_store = None
+        self._scan_index = None
         super().__init__(self.__colstr_key, self._read_chromatogram, file_path)
 
     @property
     def spectra(self):
         """ WIP: For testing chromatogram build
         """
+        data, times, ions = self.spectra_sparse
+        return pd.DataFrame(data=data.todense(), index=times, columns=ions)
+
+    @property
+    def spectra_sparse(self):
+        """ (scipy.sparse.csr_matrix, numpy.ndarray, numpy.ndarray):
+            spectra with one row per scan, their retention times and ions.
+            Decoded on first access. If a spectra store is attached, they
+            are decoded into it once and memory mapped from it.
+        """
+        if self._spectra is None:
+            if self._spectra_store is None:
+                self._spectra = self._read_spectra_sparse(self._file_path)
+            else:
+                cache_dir, key = self._spectra_store
+                if not store.is_current(cache_dir, key, self._file_path):
+                    self._read_spectra_sparse(
+                        self._file_path, store.spectra_allocator(cache_dir, key))
+                    store.mark_current(cache_dir, key, self._file_path)
+                self._spectra = store.read_spectra_partition(cache_dir, key)
         return self._spectra
 
+    @property
+    def scan_index(self):
+        """ numpy.ndarray: byte ``offset``, number of points ``npts`` and
+            retention ``time`` of every scan. Built on first access.
+        """
+        if self._scan_index is None:
+            self._scan_index = self._read_scan_index(self._file_path)
+        return self._scan_index
+
+    def get_scan(self, i):
+        """ Decode a single scan without decoding the whole file.
+
+            Parameters
+            ----------
+            i : int
+                Scan number.
+
+            Returns
+            -------
+            pandas.Series
+                Abundance by ion, named by the scan's retention time.
+        """
+        data, times, ions = self._read_scans(
+            self._file_path, self.scan_index[i:i + 1])
+        return pd.Series(data.toarray()[0], index=ions, name=times[0])
+
+    def get_scans(self, t0, t1):
+        """ Decode the scans with retention time within ``[t0, t1]``
+            without decoding the whole file.
+
+            Parameters
+            ----------
+            t0, t1 : float
+                Retention time window.
+
+            Returns
+            -------
+            pandas.DataFrame
+                Scans with ions as columns and time as index.
+        """
+        index = self.scan_index
+        lo, hi = (np.searchsorted(index['time'], t0, 'left'),
+                  np.searchsorted(index['time'], t1, 'right'))
+        data, times, ions = self._read_scans(self._file_path, index[lo:hi])
+        return pd.DataFrame(data=data.toarray(), index=times, columns=ions)
+
     @property
     def chromatogram(self):
         """
@@ -372,8 +678,8 @@ class AgilentGcfid(AgilentGcmsTableBase):
 
         Parameters
         ----------
-        file_path : str
-            Path to DATA.MS file.
+        file_path : str or bytes
+            Path to FID1A.ch file or its contents as bytes.
     """
 
     __chrom_colstr = {
@@ -407,14 +713,15 @@ class AgilentGcfid(AgilentGcmsTableBase):
         """
         
         resolution = 0.0001 #desired time resolution in seconds
-        f = open(file_path, 'rb')
+        f = _open_binary(file_path)
 
         f.seek(0x11A)
         start_time = struct.unpack('>f', f.read(4))[0] / 60000.
         end_time = struct.unpack('>f', f.read(4))[0] / 60000.
 
         f.seek(0x1800)
-        fid = np.fromfile(f, '<f8')
+        fid = np.frombuffer(f.read(), '<f8')
+        f.close()
         tme = np.linspace(start_time, end_time, fid.shape[0]) 
 
         
@@ -444,6 +751,51 @@ class AgilentGcfid(AgilentGcmsTableBase):
         """
         return self['chromatogram_fid']
 
+class AgilentGcmsMeta(object):
+    """ Manages reading of Agilent metadata text files such as
+        acqmeth.txt, fileinfo.txt or pre_post.ini into a dictionary.
+        Every ``key: value`` or ``key=value`` line is an entry; if a key
+        occurs more than once, the first value is kept.
+
+        Parameters
+        ----------
+        file_path : str or bytes
+            Path to metadata file or its contents as bytes.
+    """
+
+    __entry = re.compile(r'^\s*([^:=\[\]]+?)\s*[:=]\s*(.*?)\s*$')
+
+    @staticmethod
+    def _read_text(file_path):
+        """ return decoded contents of metadata file. ChemStation writes
+            some of them as UTF-16 with a byte order mark.
+        """
+        with _open_binary(file_path) as f:
+            raw = f.read()
+        if raw[:2] in (b'\xff\xfe', b'\xfe\xff'):
+            return raw.decode('utf-16', 'replace')
+        return raw.decode('utf-8', 'replace')
+
+    @classmethod
+    def _read_meta(cls, file_path):
+        """ return dictionary of the entries of metadata file
+        """
+        meta = {}
+        for line in cls._read_text(file_path).splitlines():
+            match = cls.__entry.match(line)
+            if match and match.group(2):
+                meta.setdefault(match.group(1), match.group(2))
+        return meta
+
+    def __init__(self, file_path):
+        self._meta = self._read_meta(file_path)
+
+    @property
+    def meta(self):
+        """ dict: entries of the metadata file.
+        """
+        return self._meta
+
 class AgilentGcmsDir(object):
     """ Read all GCMS files from Agilent .D folder.
 
@@ -451,47 +803,153 @@ class AgilentGcmsDir(object):
         ----------
         dir_path : str
             Path to Agilent .D folder.
+        files : dict
+            Optional. Mapping of file name to path or file contents as
+            bytes. If omitted, the files are discovered in ``dir_path``.
+        cache : RunCache
+            Optional. Cache holding the parsed files, usually shared by
+            all folders of a collection. If omitted, parsed files are
+            kept for the lifetime of the folder.
     """
 
     __file_str = {
-        'acqmeth.txt': None,
-        'audit.txt': None,
-        'cnorm.ini': None,
+        'acqmeth.txt': AgilentGcmsMeta,
+        'audit.txt': AgilentGcmsMeta,
+        'cnorm.ini': AgilentGcmsMeta,
         'data.ms': AgilentGcmsDataMs,
         'fames-ha.res': None,
         'fames-ha.xls': None,
-        'fileinfo.txt': None,
+        'fileinfo.txt': AgilentGcmsMeta,
         'ls_report': None,
-        'percent.txt': None,
-        'pre_post.ini': None,
-        'qreport.txt': None,
+        'percent.txt': AgilentGcmsMeta,
+        'pre_post.ini': AgilentGcmsMeta,
+        'qreport.txt': AgilentGcmsMeta,
         'results.csv': AgilentGcmsResults,
         'fid1a.ch':AgilentGcfid
     }
 
+    # metadata files by precedence of their entries
+    _meta_files = ('acqmeth.txt', 'fileinfo.txt', 'pre_post.ini',
+                   'cnorm.ini', 'percent.txt', 'qreport.txt', 'audit.txt')
+
     @classmethod
-    def _diriter(cls, dir_path):
+    def _diriter(cls, dir_path, max_depth=1):
         """ Non-public method that returns all files in Agilent .D folder.
 
+            Only entries whose lower case name is a known Agilent file
+            are returned, and subfolders are descended at most
+            ``max_depth`` levels. If a file name occurs more than once,
+            the one closest to ``dir_path`` is kept.
+
             Parameters
             ----------
             dir_path : str
                 Path to Agilent .D folder.
+            max_depth : int
+                Number of subfolder levels below ``dir_path`` to search.
 
             Returns
             -------
-            Generator
-                Itarable over files in ``dir_path``.
+            list
+                Pairs of file name and path of files in ``dir_path``.
+        """
+        found = {}
+        level = [dir_path]
+        for depth in range(max_depth + 1):
+            level = [sub for path in level for sub in cls._collect(
+                cls._entries(path), found, depth < max_depth)]
+        return list(found.values())
+
+    @staticmethod
+    def _entries(path):
+        """ Non-public method returning (name, path, is_dir) of every entry
+            of folder ``path``.
+        """
+        with os.scandir(path) as entries:
+            return [(entry.name, entry.path, entry.is_dir())
+                    for entry in entries]
+
+    @classmethod
+    def _collect(cls, entries, found, descend):
+        """ Non-public method adding the known Agilent files of folder
+            ``entries`` to mapping ``found`` of lower case file name to
+            (name, path), keeping files already found. Returns the paths
+            of the subfolders to search next if ``descend``.
+        """
+        subdirs = []
+        for name, path, is_dir in entries:
+            if name.lower() in cls.__file_str:
+                found.setdefault(name.lower(), (name, path))
+            elif descend and is_dir:
+                subdirs.append(path)
+        return subdirs
+
+    @classmethod
+    def _listdirs(cls, root_dir, include=None, exclude=None):
+        """ Non-public method that returns the Agilent .D folders directly
+            in ``root_dir``.
+
+            Parameters
+            ----------
+            root_dir : str
+                Path to folder containing Agilent .D folders.
+            include, exclude : str or list(str)
+                Optional. Glob patterns the folder names must match, or
+                must not match, respectively.
+
+            Returns
+            -------
+            list(str)
+                Sorted paths to the .D folders in ``root_dir``.
+        """
+        return cls._match_dirs(cls._entries(root_dir), include, exclude)
+
+    @classmethod
+    def _match_dirs(cls, entries, include=None, exclude=None):
+        """ Non-public method returning the sorted paths of the .D folders
+            among (name, path, is_dir) ``entries`` of a root folder, see
+            ``_listdirs``.
+        """
+        def matches(name, patterns):
+            if isinstance(patterns, str):
+                patterns = [patterns]
+            return any(fnmatch.fnmatch(name, pat) for pat in patterns)
+
+        return sorted(
+            path for name, path, is_dir in entries
+            if name.lower().endswith('.d') and is_dir
+            and (include is None or matches(name, include))
+            and (exclude is None or not matches(name, exclude))
+        )
+
+    @classmethod
+    def _scandirs(cls, dir_list, max_depth=1):
+        """ Non-public method returning the files of all folders in
+            ``dir_list``, discovered concurrently in a thread pool.
         """
-        return ((f, os.path.join(root, f))
-                for root, dirs, files in os.walk(dir_path)
-                for f in files if f.lower() in cls.__file_str)
+        with ThreadPoolExecutor() as pool:
+            return list(pool.map(
+                lambda path: cls._diriter(path, max_depth), dir_list))
 
-    def __init__(self, dir_path):
+    def __init__(self, dir_path, files=None, cache=None):
         self._dir_path = dir_path
-        self._files = {fn.lower(): fp
-                       for fn, fp in AgilentGcmsDir._diriter(dir_path)}
+        self._cache = cache
+        self._cache_dir = None
+        self._key = None
+        if files is None:
+            files = AgilentGcmsDir._diriter(dir_path)
+        else:
+            files = files.items()
+        self._files = {fn.lower(): fp for fn, fp in files}
         self._data = {fn.lower(): None for fn in self._files}
+        self._metadata = None
+
+    @classmethod
+    def _has_parser(cls, file_name):
+        """ Non-public method that returns True iff a parser is
+            implemented for ``file_name``.
+        """
+        return bool(cls.__file_str.get(file_name.lower()))
 
     def _key_validate(self, key):
         """ Non-public method to validate build of file in Agilent .D folder.
@@ -537,11 +995,47 @@ class AgilentGcmsDir(object):
             DataFrame
                 Data loaded from file associated with ``key``.
         """
-        self._key_validate(key)        
+        self._key_validate(key)
+        if self._cache is not None:
+            data = self._cache.get((self._dir_path, key))
+            if data is None:
+                data = self._build(key)
+                self._cache.put((self._dir_path, key), data)
+            return data
         if self._data[key] is None:
-            self._data[key] = AgilentGcmsDir.__file_str[key](self._files[key])
+            self._data[key] = self._build(key)
         return self._data[key]
 
+    def _parse(self, paths):
+        """ Non-public method parsing the tables of every file with a
+            parser, then replacing the file contents the folder was built
+            from by their ``paths``, so that only the tables are kept.
+            Spectra and scan index of DATA.MS are decoded from the same
+            contents, so the file is never read again.
+        """
+        paths = {fn.lower(): fp for fn, fp in paths.items()}
+        for key in self._files:
+            if not self._has_parser(key):
+                continue
+            data = self._data_cache(key)
+            if isinstance(data, AgilentGcmsTableBase):
+                data._parse()
+            if isinstance(data, AgilentGcmsDataMs):
+                data.spectra_sparse
+                data.scan_index
+                data._file_path = paths[key]
+        self._files = paths
+
+    def _build(self, key):
+        """ Non-public method parsing file associated with ``key``. Spectra
+            of DATA.MS are backed by the spectra store in ``_cache_dir``,
+            if any, so reloading an evicted run does not decode them again.
+        """
+        data = AgilentGcmsDir.__file_str[key](self._files[key])
+        if key == 'data.ms' and self._cache_dir:
+            data._spectra_store = (self._cache_dir, self._key)
+        return data
+
     @property
     def datams(self):
         """ obj: AgilentGcmsDataMs built from DATA.MS file in
@@ -549,6 +1043,26 @@ class AgilentGcmsDir(object):
         """
         return self._data_cache('data.ms')
 
+    @property
+    def metadata(self):
+        """ dict: run information from the DATA.MS header and the entries
+            of all metadata files in Agilent .D folder. Only the header and
+            the first scan of DATA.MS are read. If an entry occurs more
+            than once, DATA.MS header fields take precedence, then the
+            metadata files in the order of ``_meta_files``.
+        """
+        if self._metadata is None:
+            meta = {}
+            if 'data.ms' in self._files:
+                meta.update(
+                    AgilentGcmsDataMs._read_header(self._files['data.ms']))
+            for key in self._meta_files:
+                if key in self._files:
+                    for name, val in self._data_cache(key).meta.items():
+                        meta.setdefault(name, val)
+            self._metadata = meta
+        return self._metadata
+
     
     @property
     def datafid(self):
@@ -560,6 +1074,215 @@ class AgilentGcmsDir(object):
         """
         return self._data_cache('results.csv')
 
+class _SpectraMap(Mapping):
+    """ Read-only mapping of key to the spectra of the DATA.MS file of
+        each folder of ``folders``, decoded when the key is accessed.
+        Decoded spectra are held by the parsed DATA.MS, so they are
+        bounded by the cache of the folders, if any.
+    """
+    def __init__(self, folders):
+        self._folders = folders
+
+    def __getitem__(self, key):
+        folder = self._folders.get(key)
+        if folder is None or 'data.ms' not in folder._files:
+            raise KeyError(key)
+        spectra = folder.datams.spectra_sparse
+        if folder._cache is not None:
+            # measure the run again now that it holds its spectra
+            folder._cache.touch((folder._dir_path, 'data.ms'))
+        return spectra
+
+    def __iter__(self):
+        return (key for key, val in self._folders.items()
+                if 'data.ms' in val._files)
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+class _LocalReader(object):
+    """ Lists and reads local files in worker threads for
+        ``AgilentGcms.afrom_root``.
+    """
+    @staticmethod
+    def _read_file(path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    async def scandir(self, path):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, AgilentGcmsDir._entries, path)
+
+    async def read(self, path):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, self._read_file, path)
+
+class AgilentGcmsFollower(object):
+    """ Follow the DATA.MS and FID1A.CH files of an Agilent .D folder while
+        the run is acquiring.
+
+        Every ``poll`` decodes only the complete scan records and FID
+        points appended since the previous poll, so the header scan count,
+        which is only written at the end of the run, is not needed. The
+        run is finished once the header scan count is written and reached.
+
+        Parameters
+        ----------
+        dir_path : str
+            Path to Agilent .D folder. The files may not exist yet.
+        fid_interval : float
+            Optional. Minutes between FID points, used for the FID
+            retention times. If omitted, they are NaN.
+    """
+
+    __index_dtype = [('offset', 'i8'), ('npts', 'i4'), ('time', 'f8')]
+
+    def __init__(self, dir_path, fid_interval=None):
+        self._dir_path = dir_path
+        self._fid_interval = fid_interval
+        self._files = {}
+        self._ms_pos = None
+        self._nscans = 0
+        self._nfid = 0
+        self._finished = False
+
+    def _path(self, name):
+        """ Non-public method returning path of file ``name`` in the
+            folder, or None while it does not exist.
+        """
+        if name not in self._files:
+            found = dict((fn.lower(), fp) for fn, fp
+                         in AgilentGcmsDir._diriter(self._dir_path, 0))
+            if name in found:
+                self._files[name] = found[name]
+        return self._files.get(name)
+
+    def _poll_datams(self, path):
+        """ Non-public method decoding the complete scans appended to
+            DATA.MS since the last poll. Returns (chromatogram, spectra).
+        """
+        with open(path, 'rb') as f:
+            head = f.read(0x11A)
+            if len(head) < 0x11A:
+                return None, None
+            nscans = struct.unpack_from('>H', head, 0x118)[0]
+            if self._ms_pos is None:
+                start = 2 * struct.unpack_from('>H', head, 0x10A)[0] - 2
+                if start <= 0:
+                    return None, None
+                self._ms_pos = start
+            f.seek(self._ms_pos)
+            block = f.read()
+
+        rows, tics, pos = [], [], 0
+        while pos + 6 <= len(block):
+            if nscans and self._nscans + len(rows) >= nscans:
+                break
+            nwords, tme = struct.unpack_from('>HI', block, pos)
+            size = 2 * nwords
+            if nwords < 14 or pos + size > len(block):
+                break           # record not completely written yet
+            rows.append((self._ms_pos + pos, (size - 28) // 4, tme / 60000.))
+            tics.append(struct.unpack_from('>I', block, pos + size - 4)[0])
+            pos += size
+
+        lo = self._ms_pos
+        self._ms_pos += pos
+        self._nscans += len(rows)
+        self._finished = bool(nscans) and self._nscans >= nscans
+        if not rows:
+            return None, None
+
+        index = np.array(rows, dtype=self.__index_dtype)
+        spectra = AgilentGcmsDataMs._decode_scans(block[:pos], lo, index)
+        chromatogram = pd.DataFrame({'tic': tics, 'tme': index['time']},
+                                    dtype='f4')
+        return chromatogram, spectra
+
+    def _poll_fid(self, path):
+        """ Non-public method reading the FID points appended to FID1A.CH
+            since the last poll.
+        """
+        with open(path, 'rb') as f:
+            f.seek(0x11A)
+            head = f.read(4)
+            if len(head) < 4:
+                return None
+            start_time = struct.unpack('>f', head)[0] / 60000.
+            f.seek(0x1800 + 8 * self._nfid)
+            raw = f.read()
+        fid = np.frombuffer(raw, '<f8', count=len(raw) // 8)
+        if not len(fid):
+            return None
+        points = self._nfid + np.arange(len(fid))
+        self._nfid += len(fid)
+        tme = (start_time + points * self._fid_interval
+               if self._fid_interval else np.full(len(fid), np.nan))
+        return pd.DataFrame({'fid': fid, 'tme': tme}, dtype='f4')
+
+    def poll(self):
+        """ Decode the data appended since the last poll.
+
+            Returns
+            -------
+            dict
+                'chromatogram' (tic, tme) and 'chromatogram_fid' (fid, tme)
+                DataFrames and 'spectra' as (csr_matrix, times, ions) of
+                the new scans, each None if nothing new was appended. The
+                ions of every spectra chunk are those present in its scans.
+        """
+        chunk = {'chromatogram': None, 'chromatogram_fid': None,
+                 'spectra': None}
+        path = self._path('data.ms')
+        if path is not None:
+            chunk['chromatogram'], chunk['spectra'] = self._poll_datams(path)
+        path = self._path('fid1a.ch')
+        if path is not None:
+            chunk['chromatogram_fid'] = self._poll_fid(path)
+        return chunk
+
+    def follow(self, interval=1.0, idle_timeout=None):
+        """ Poll every ``interval`` seconds and yield the chunks with new
+            data until the run is finished, or nothing was appended for
+            ``idle_timeout`` seconds.
+
+            Parameters
+            ----------
+            interval : float
+                Seconds between polls.
+            idle_timeout : float
+                Optional. Stop after this many seconds without new data.
+
+            Returns
+            -------
+            Generator
+                Iterable over the dictionaries returned by ``poll``.
+        """
+        idle_since = time.monotonic()
+        while True:
+            chunk = self.poll()
+            if any(val is not None for val in chunk.values()):
+                idle_since = time.monotonic()
+                yield chunk
+            if self._finished:
+                return
+            if (idle_timeout is not None and
+                    time.monotonic() - idle_since > idle_timeout):
+                return
+            time.sleep(interval)
+
+    @property
+    def finished(self):
+        """ bool: True once all scans of the finished run were decoded.
+        """
+        return self._finished
+
+    @property
+    def nscans(self):
+        """ int: number of scans decoded so far.
+        """
+        return self._nscans
+
 class AgilentGcms(object):
     """ Read GCMS files from one or more Agilent .D folders into a collection
         of pandas.DataFrame.
@@ -571,15 +1294,45 @@ class AgilentGcms(object):
         dir_keys : list(str)
             Optional. Provide custom names for the .D folders. If omitted,
             the folders' names are used.
+        workers : int
+            Optional. Decode DATA.MS spectra in a pool of this many
+            processes. Workers write the decoded arrays to memory mapped
+            files that are attached without copying.
+        cache_dir : str
+            Optional. Folder for the decoded spectra of ``workers``.
+            Spectra of unchanged DATA.MS files are reused from it. If
+            omitted, a temporary folder is used.
+        cache_size : int
+            Optional. Bound in bytes of the RunCache shared by the .D
+            folders for their parsed files. Least recently used files
+            are evicted and parsed again on access, with spectra
+            reloaded from ``cache_dir``. If omitted, parsed files are
+            kept.
     """
+    __store_tables = {
+        'results_tic': 'rt',
+        'results_fid': 'rt',
+        'results_lib': 'rt',
+        'chromatogram': 'tme',
+        'chromatogram_fid': 'tme'
+    }
+
+    __signals = {
+        'tic': 'chromatogram',
+        'fid': 'chromatogram_fid'
+    }
+
     @classmethod
-    def from_dir(cls, agilent_dir):
+    def from_dir(cls, agilent_dir, workers=None, cache_dir=None,
+                 cache_size=None):
         """ Initialize AgilentGcms from single Agilent .D folder.
 
             Parameters
             ----------
             agilent_dir : str
                 Path to Agilent .D folder.
+            workers, cache_dir, cache_size :
+                Optional. See AgilentGcms.
 
             Returns
             -------
@@ -588,17 +1341,33 @@ class AgilentGcms(object):
                 Agilent .D folder
         """
         dir_list = [agilent_dir]
-        return cls(dir_list)
+        return cls(dir_list, workers=workers, cache_dir=cache_dir,
+                   cache_size=cache_size)
 
     @classmethod
-    def from_root(cls, root_dir):
+    def from_root(cls, root_dir, workers=None, cache_dir=None,
+                  include=None, exclude=None, where=None, cache_size=None):
         """ Initialize AgilentGcms from root folder containing at least one
             Agilent .D folder.
 
+            Only subfolders with a .D suffix are read, in name order. With
+            ``where``, runs are first selected from the table returned by
+            ``metadata_table`` so that the data of the other runs is never
+            parsed. ``tmax`` is only read if ``where`` uses it.
+
             Parameters
             ----------
             root_dir : str
                 Path to folder containing at least one Agilent .D folder.
+            workers, cache_dir, cache_size :
+                Optional. See AgilentGcms.
+            include, exclude : str or list(str)
+                Optional. Glob patterns the .D folder names must match,
+                or must not match, respectively.
+            where : str or callable
+                Optional. Query string for ``pandas.DataFrame.query``, or
+                function returning a boolean mask, evaluated on the
+                metadata table of the runs.
 
             Returns
             -------
@@ -606,19 +1375,240 @@ class AgilentGcms(object):
                 AgilentGcms object constructed from a folder containing one
                 or more Agilent .D folders
         """
-        dir_list = [os.path.join(root_dir, path)
-                    for path in next(os.walk(root_dir))[1]]
-        return cls(dir_list)
+        if where is None:
+            dir_list = AgilentGcmsDir._listdirs(root_dir, include, exclude)
+            return cls(dir_list, workers=workers, cache_dir=cache_dir,
+                       cache_size=cache_size)
+
+        def select(meta):
+            if callable(where):
+                return meta.index[np.asarray(where(meta), dtype=bool)]
+            return meta.query(where).index
+
+        folders = cls._root_folders(root_dir, include, exclude)
+        try:
+            keys = select(cls._metadata_table(folders))
+        except (KeyError, NameError):
+            # tmax walks all scan headers, so it is only read if used
+            keys = select(cls._metadata_table(folders, tmax=True))
+        return cls._from_folders({key: folders[key] for key in keys},
+                                 workers, cache_dir, cache_size)
+
+    @classmethod
+    def _root_folders(cls, root_dir, include=None, exclude=None):
+        """ Non-public method returning mapping of key to AgilentGcmsDir
+            for all .D folders in ``root_dir``.
+        """
+        dir_list = AgilentGcmsDir._listdirs(root_dir, include, exclude)
+        files = AgilentGcmsDir._scandirs(dir_list)
+        return {os.path.basename(path): AgilentGcmsDir(path, dict(f))
+                for path, f in zip(dir_list, files)}
+
+    @classmethod
+    def _metadata_table(cls, folders, tmax=False):
+        """ Non-public method building the metadata table of mapping of
+            key to AgilentGcmsDir, reading the folders in a thread pool.
+            With ``tmax``, the retention time of the last scan is added.
+        """
+        def row(val):
+            if tmax and 'data.ms' in val._files:
+                return dict(val.metadata, tmax=AgilentGcmsDataMs._read_tmax(
+                    val._files['data.ms']))
+            return val.metadata
+
+        with ThreadPoolExecutor() as pool:
+            rows = list(pool.map(row, folders.values()))
+        meta = pd.DataFrame(rows, index=pd.Index(list(folders), name='key'))
+        meta.insert(0, 'path', [val._dir_path for val in folders.values()])
+        return meta
+
+    @classmethod
+    def metadata_table(cls, root_dir, include=None, exclude=None,
+                       tmax=False):
+        """ Read run information of all Agilent .D folders in root folder
+            without loading their data.
+
+            Parameters
+            ----------
+            root_dir : str
+                Path to folder containing at least one Agilent .D folder.
+            include, exclude : str or list(str)
+                Optional. See ``from_root``.
+            tmax : bool
+                Optional. Also read the retention time of the last scan,
+                which walks the scan headers of every DATA.MS file.
+
+            Returns
+            -------
+            pandas.DataFrame
+                One row per run ``key`` with the folder ``path``, the
+                DATA.MS header fields (``nscans``, ``tmin``,
+                ``instrument``, ...) and the entries of the metadata
+                files.
+        """
+        return cls._metadata_table(
+            cls._root_folders(root_dir, include, exclude), tmax)
+
+    @classmethod
+    async def afrom_root(cls, root_dir, max_concurrency=16, reader=None,
+                         include=None, exclude=None):
+        """ Initialize AgilentGcms from root folder containing at least one
+            Agilent .D folder, listing and reading the files concurrently.
+
+            All folders are listed and all parsable files requested at
+            once, with at most ``max_concurrency`` requests in flight, and
+            their contents handed to the regular decoders. The tables and
+            spectra of a folder are decoded as soon as its files are read,
+            after which their contents are dropped, so the contents of at
+            most ``max_concurrency`` folders are held in memory. Use this
+            on storage with a high per-file latency.
+
+            Parameters
+            ----------
+            root_dir : str
+                Path to folder containing at least one Agilent .D folder.
+            max_concurrency : int
+                Maximum number of concurrent requests, and of folders read
+                at once.
+            reader : obj
+                Optional. Storage the files are listed and read from, with
+                coroutine methods ``scandir(path)`` returning a list of
+                (name, path, is_dir) of the entries of folder ``path``, and
+                ``read(path)`` returning the contents of file ``path`` as
+                bytes. Defaults to the local file system, accessed in
+                worker threads. Every file is read once: spectra of DATA.MS
+                are decoded from the same contents as its chromatogram.
+                Only ``get_scan`` and ``get_scans`` read DATA.MS again,
+                from its path, so they need the local file system.
+            include, exclude : str or list(str)
+                Optional. See ``from_root``.
+
+            Returns
+            -------
+            obj
+                AgilentGcms object constructed from a folder containing one
+                or more Agilent .D folders
+        """
+        loop = asyncio.get_running_loop()
+        requests = asyncio.Semaphore(max_concurrency)
+        in_memory = asyncio.Semaphore(max_concurrency)
+        if reader is None:
+            reader = _LocalReader()
+
+        async def scandir(path):
+            async with requests:
+                return await reader.scandir(path)
+
+        async def read(file_name, path):
+            if not AgilentGcmsDir._has_parser(file_name):
+                return path
+            async with requests:
+                return await reader.read(path)
+
+        async def read_dir(dir_path):
+            found, level = {}, [dir_path]
+            for descend in (True, False):
+                listings = await asyncio.gather(*map(scandir, level))
+                level = [sub for entries in listings for sub in
+                         AgilentGcmsDir._collect(entries, found, descend)]
+            files = list(found.values())
+            async with in_memory:
+                contents = await asyncio.gather(*(read(*f) for f in files))
+                folder = AgilentGcmsDir(
+                    dir_path,
+                    {fn: data for (fn, _), data in zip(files, contents)})
+                await loop.run_in_executor(None, folder._parse, dict(files))
+            return folder
+
+        dir_list = AgilentGcmsDir._match_dirs(
+            await scandir(root_dir), include, exclude)
+        folders = await asyncio.gather(*map(read_dir, dir_list))
+        dir_keys = [os.path.basename(path) for path in dir_list]
+        return await loop.run_in_executor(
+            None, cls._from_folders, dict(zip(dir_keys, folders)))
+
+    @classmethod
+    def _from_folders(cls, folders, workers=None, cache_dir=None,
+                      cache_size=None):
+        """ Non-public method to initialize AgilentGcms from mapping of
+            key to AgilentGcmsDir.
+        """
+        agi = cls.__new__(cls)
+        agi._stack_folders(folders, workers, cache_dir, cache_size)
+        return agi
+
+    @classmethod
+    def from_store(cls, path, keys=None, tmin=None, tmax=None):
+        """ Initialize AgilentGcms from a store written by ``to_store``.
+
+            Columns are memory mapped, so only the partitions of ``keys``
+            and the rows within ``[tmin, tmax]`` are read from disk and
+            copied into the tables.
+
+            Parameters
+            ----------
+            path : str
+                Path to folder written by ``to_store``.
+            keys : list(str)
+                Optional. Only load these runs. If omitted, all runs
+                in the store are loaded.
+            tmin, tmax : float
+                Optional. Only load rows with retention time within
+                ``[tmin, tmax]``.
+
+            Returns
+            -------
+            obj
+                AgilentGcms object constructed from the store.
+        """
+        agi = cls.__new__(cls)
+        agi._folders = {}
+        agi._cache = None
+        agi._cache_dir = None
+        agi._offsets = {}
+        with open(os.path.join(path, 'keys.txt')) as f:
+            agi._keys = [key for key in f.read().splitlines()
+                         if keys is None or key in keys]
+        for attr in cls.__store_tables:
+            df = store.read_table(os.path.join(path, attr), keys, tmin, tmax)
+            if df is not None:
+                df.index = pd.CategoricalIndex(
+                    df.index, categories=agi._keys, name='key')
+            setattr(agi, '_' + attr, df)
+        agi._spectra = store.read_spectra(
+            os.path.join(path, 'spectra'), keys, tmin, tmax)
+        return agi
+
+    def to_store(self, path):
+        """ Write collection to a partitioned columnar store with one
+            partition per run key. Reload with ``from_store``.
+
+            Parameters
+            ----------
+            path : str
+                Path to folder to write the store to.
+        """
+        os.makedirs(path, exist_ok=True)
+        for attr, time_col in self.__store_tables.items():
+            df = getattr(self, '_' + attr)
+            if df is not None:
+                store.write_table(df, os.path.join(path, attr), time_col)
+        store.write_spectra(self._spectra, os.path.join(path, 'spectra'))
+        with open(os.path.join(path, 'keys.txt'), 'w') as f:
+            f.write('\n'.join(self._keys))
 
     def _pandas_stack(self, accessor, attr):
-        """ Non-public method for stacking all data
+        """ Non-public method for stacking all data. The columns of the
+            stacked table are preallocated from the run lengths and filled
+            in place, and runs are identified by categorical key codes.
         """
-        dfs = []
-        for key, val in self._folders.items():
+        dfs, codes = [], []
+        for code, (key, val) in enumerate(self._folders.items()):
             try:
                 df = getattr(val, accessor)[attr]
                 if df is not None:
-                    dfs.append(df.assign(key=key))
+                    dfs.append(df)
+                    codes.append(code)
             except KeyError:
                 # dfs.append(pd.DataFrame({'key': [key]}))
                 print(f'missing `{attr}` from `{accessor}` in {key}')
@@ -626,37 +1616,206 @@ class AgilentGcms(object):
         if not dfs:
             return None
 
-        return pd.concat(dfs, axis=0).set_index('key')
-
-    def _dict_stack(self, accessor, attr):
-        """ temporary hack to accomodate unstackable spectra
+        lengths = [len(df) for df in dfs]
+        stops = np.cumsum(lengths)
+        starts = stops - lengths
+        index = pd.CategoricalIndex(
+            pd.Categorical.from_codes(np.repeat(codes, lengths),
+                                      categories=self._keys),
+            name='key')
+
+        dtypes = dfs[0].dtypes
+        if len(set(dtypes)) == 1 and isinstance(dtypes.iloc[0], np.dtype):
+            # single block, e.g. chromatograms, wrapped without a copy
+            block = np.empty((len(dtypes), stops[-1]), dtype=dtypes.iloc[0])
+            for df, start, stop in zip(dfs, starts, stops):
+                block[:, start:stop] = df.values.T
+            return pd.DataFrame(block.T, index=index, columns=dtypes.index,
+                                copy=False)
+
+        columns = {}
+        for col, ty in dtypes.items():
+            if ty == 'category':
+                columns[col] = union_categoricals(
+                    [df[col].values for df in dfs])
+                continue
+            if not isinstance(ty, np.dtype):
+                # nullable integers keep their mask
+                columns[col] = pd.concat([df[col] for df in dfs],
+                                         ignore_index=True).array
+                continue
+            columns[col] = np.empty(stops[-1], dtype=ty)
+            for df, start, stop in zip(dfs, starts, stops):
+                columns[col][start:stop] = df[col].values
+        return pd.DataFrame(columns, index=index)
+
+    def _pool_stack(self, workers, cache_dir):
+        """ Non-public method decoding spectra of all folders in a process
+            pool and attaching the memory mapped results.
         """
-        stack = {}
-        for key, val in self._folders.items():
-            try:
-                stack[key] = getattr(getattr(val, accessor), attr)
-            except KeyError:
-                print(f'cannot access `{attr}` from `{accessor}` file')
-        return stack
-
-    def __init__(self, dir_list, dir_keys=None):
+        jobs = [(val._files['data.ms'], cache_dir, key)
+                for key, val in self._folders.items()
+                if 'data.ms' in val._files]
+        with multiprocessing.Pool(workers) as pool:
+            keys = pool.map(_decode_spectra, jobs, chunksize=1)
+        store.write_spectra_keys(keys, cache_dir)
+        return store.read_spectra(cache_dir, keys)
+
+    def __init__(self, dir_list, dir_keys=None, workers=None, cache_dir=None,
+                 cache_size=None):
         if not dir_keys:
             dir_keys = [os.path.basename(path) for path in dir_list]
-        self._folders = {k: AgilentGcmsDir(v)
-                         for k, v in zip(dir_keys, dir_list)}
+        files = AgilentGcmsDir._scandirs(dir_list)
+        self._stack_folders({k: AgilentGcmsDir(v, dict(f))
+                             for k, v, f in zip(dir_keys, dir_list, files)},
+                            workers, cache_dir, cache_size)
+
+    def _stack_folders(self, folders, workers=None, cache_dir=None,
+                       cache_size=None):
+        """ Non-public method building the stacked tables from mapping
+            of key to AgilentGcmsDir.
+        """
+        if workers and workers > 1 and cache_dir is None:
+            cache_dir = tempfile.mkdtemp(prefix='pyvalence-')
+            weakref.finalize(self, shutil.rmtree, cache_dir, True)
+        self._folders = folders
+        self._keys = list(self._folders)
+        self._cache = None if cache_size is None else RunCache(cache_size)
+        self._cache_dir = cache_dir
+        self._offsets = {}
+        for key, val in self._folders.items():
+            val._cache = self._cache
+            val._cache_dir = cache_dir
+            val._key = key
         self._results_tic = self._pandas_stack('results', 'tic')
         self._results_fid = self._pandas_stack('results', 'fid')
         self._results_lib = self._pandas_stack('results', 'lib')
         self._chromatogram = self._pandas_stack('datams', 'chromatogram')
         self._chromatogram_fid = self._pandas_stack('datafid','chromatogram_fid')
-        self._spectra = self._dict_stack('datams', 'spectra')
+        if workers and workers > 1:
+            self._spectra = self._pool_stack(workers, cache_dir)
+        else:
+            self._spectra = _SpectraMap(self._folders)
 
 
+    def _run_offsets(self, attr):
+        """ Non-public method returning mapping of key to the (start, stop)
+            rows of the run in stacked table ``attr``.
+        """
+        if attr not in self._offsets:
+            df = getattr(self, '_' + attr)
+            codes = (df.index.codes if isinstance(df.index, pd.CategoricalIndex)
+                     else pd.factorize(df.index)[0])
+            bounds = np.flatnonzero(np.diff(codes)) + 1
+            starts = np.r_[0, bounds]
+            stops = np.r_[bounds, len(codes)]
+            self._offsets[attr] = {
+                key: (start, stop) for key, start, stop
+                in zip(df.index[starts[:len(df)]], starts, stops)
+            }
+        return self._offsets[attr]
+
+    def window(self, keys=None, tmin=None, tmax=None, signal='tic'):
+        """ Return rows of the stacked chromatogram within ``[tmin, tmax]``
+            for each run in ``keys``.
+
+            Runs are located by their row offsets and the window by a
+            binary search on the sorted ``tme`` column, so no mask over
+            the full table is computed and the returned frames are slices
+            of the stacked table rather than copies.
+
+            Parameters
+            ----------
+            keys : list(str)
+                Optional. Runs to query. If omitted, all runs are queried.
+            tmin, tmax : float
+                Optional. Retention time window.
+            signal : str
+                'tic' for ``chromatogram`` or 'fid' for
+                ``chromatogram_fid``.
+
+            Returns
+            -------
+            dict
+                Mapping of key to pandas.DataFrame window of the run.
+        """
+        if signal not in self.__signals:
+            raise KeyError('{} not a recognized signal'.format(signal))
+        attr = self.__signals[signal]
+        df = getattr(self, '_' + attr)
+        if df is None:
+            print(f'missing `{attr}`')
+            return {}
+
+        offsets = self._run_offsets(attr)
+        tme = df['tme'].values
+        # compare in the precision of tme, as a mask over it would
+        tmin, tmax = (None if t is None else tme.dtype.type(t)
+                      for t in (tmin, tmax))
+        windows = {}
+        for key in (self._keys if keys is None else keys):
+            if key not in offsets:
+                continue
+            start, stop = offsets[key]
+            lo = (start if tmin is None else
+                  start + np.searchsorted(tme[start:stop], tmin, 'left'))
+            hi = (stop if tmax is None else
+                  start + np.searchsorted(tme[start:stop], tmax, 'right'))
+            windows[key] = df.iloc[lo:hi]
+        return windows
+
+    def scan_index(self, key):
+        """ Return scan index of DATA.MS file of run ``key``. With a
+            ``cache_dir`` the index is built once per file and saved
+            beside the cached spectra.
+
+            Parameters
+            ----------
+            key : str
+                Run key.
+
+            Returns
+            -------
+            numpy.ndarray
+                See AgilentGcmsDataMs.scan_index.
+        """
+        datams = self._folders[key].datams
+        if datams._scan_index is None and self._cache_dir:
+            path = self._folders[key]._files['data.ms']
+            index = store.read_scan_index(self._cache_dir, key, path)
+            if index is None:
+                index = datams.scan_index
+                store.write_scan_index(index, self._cache_dir, key, path)
+            datams._scan_index = index
+        return datams.scan_index
+
+    def get_scan(self, key, i):
+        """ Decode scan ``i`` of run ``key``, see
+            AgilentGcmsDataMs.get_scan.
+        """
+        self.scan_index(key)
+        return self._folders[key].datams.get_scan(i)
+
+    def get_scans(self, key, t0, t1):
+        """ Decode scans of run ``key`` within ``[t0, t1]``, see
+            AgilentGcmsDataMs.get_scans.
+        """
+        self.scan_index(key)
+        return self._folders[key].datams.get_scans(t0, t1)
+
+    @property
+    def cache(self):
+        """ RunCache: cache shared by the .D folders for their parsed files,
+            with its ``hits``, ``misses`` and ``evictions`` counters, or
+            None if ``cache_size`` was not given.
+        """
+        return self._cache
+
     @property
     def keys(self):
         """ list(str): Keys representing .D folder names.
         """
-        return self._folders.keys()
+        return self._keys
 
     @property
     def chromatogram(self):
@@ -677,6 +1836,15 @@ class AgilentGcms(object):
         """
         pass #return self._spectra
 
+    @property
+    def spectra_sparse(self):
+        """ dict: (scipy.sparse.csr_matrix, times, ions) spectra of
+            DATA.MS files by key, see AgilentGcmsDataMs.spectra_sparse.
+            Unless decoded by worker processes, the spectra of a run are
+            decoded when its key is first accessed.
+        """
+        return self._spectra
+
     @property
     def results_fid(self):
         """ pandas.DataFrame: RESULTS.CSV fid data from .D folders
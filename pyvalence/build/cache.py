@@ -0,0 +1,159 @@
+""" Bounded least recently used cache for parsed Agilent files.
+
+    The parsed objects of all folders of a collection share one cache
+    whose size is measured in bytes. Objects evicted from it are parsed
+    again when next accessed.
+"""
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+def _nbytes(obj, seen=None):
+    """ return estimate of the memory held by ``obj`` in bytes. Memory
+        mapped arrays are not counted, and long lists are estimated from
+        their first element.
+    """
+    if seen is None:
+        seen = set()
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    if isinstance(obj, np.ndarray):
+        base = obj
+        while isinstance(base, np.ndarray):
+            if isinstance(base, np.memmap):
+                return 0
+            base = base.base
+        return obj.nbytes
+    # sparse matrices only exist once scipy.sparse was imported
+    sparse = sys.modules.get('scipy.sparse')
+    if sparse is not None and sparse.issparse(obj):
+        return sum(_nbytes(getattr(obj, attr), seen)
+                   for attr in ('data', 'indices', 'indptr')
+                   if hasattr(obj, attr))
+    if isinstance(obj, (pd.DataFrame, pd.Series, pd.Index)):
+        usage = obj.memory_usage(deep=True)
+        return int(usage.sum() if isinstance(obj, pd.DataFrame) else usage)
+    if isinstance(obj, dict):
+        return sys.getsizeof(obj) + sum(_nbytes(val, seen)
+                                        for val in obj.values())
+    if isinstance(obj, (list, tuple)):
+        if len(obj) > 16:
+            return sys.getsizeof(obj) + len(obj) * _nbytes(obj[0], seen)
+        return sys.getsizeof(obj) + sum(_nbytes(val, seen) for val in obj)
+    if hasattr(obj, '__dict__'):
+        return sys.getsizeof(obj) + _nbytes(vars(obj), seen)
+    return sys.getsizeof(obj)
+
+
+class RunCache(object):
+    """ Least recently used cache of parsed objects bounded by their
+        total size in bytes.
+
+        Parameters
+        ----------
+        max_bytes : int
+            Optional. Evict least recently used objects once the cached
+            objects hold more than this many bytes. If omitted, nothing
+            is evicted.
+
+        Attributes
+        ----------
+        hits, misses, evictions : int
+            Number of lookups that found an object, lookups that did not,
+            and objects evicted to stay within ``max_bytes``.
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._nbytes = 0
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def nbytes(self):
+        """ int: estimated size of the cached objects in bytes.
+        """
+        return self._nbytes
+
+    def _evict(self, keep):
+        """ Non-public method evicting least recently used objects other
+            than ``keep`` until the cache is within ``max_bytes``.
+        """
+        while (self.max_bytes is not None and self._nbytes > self.max_bytes
+               and len(self._entries) > 1):
+            key = next(iter(self._entries))
+            if key == keep:
+                self._entries.move_to_end(key)
+                key = next(iter(self._entries))
+            _, size = self._entries.pop(key)
+            self._nbytes -= size
+            self.evictions += 1
+
+    def get(self, key):
+        """ Return object cached for ``key`` and mark it most recently
+            used, or None if it is not cached.
+
+            Objects grow as their tables are built on access, so the size
+            of the object is measured again on every hit.
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return self.touch(key)
+
+    def touch(self, key):
+        """ Measure object cached for ``key`` again and mark it most
+            recently used, without counting a lookup. Returns the object,
+            or None if it is not cached.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return None
+            obj, size = self._entries[key]
+            self._entries.move_to_end(key)
+            new_size = _nbytes(obj)
+            self._entries[key] = (obj, new_size)
+            self._nbytes += new_size - size
+            self._evict(key)
+            return obj
+
+    def put(self, key, obj):
+        """ Cache ``obj`` for ``key`` and evict least recently used
+            objects if the cache outgrows ``max_bytes``.
+        """
+        with self._lock:
+            self.discard(key)
+            size = _nbytes(obj)
+            self._entries[key] = (obj, size)
+            self._nbytes += size
+            self._evict(key)
+
+    def discard(self, key):
+        """ Remove object cached for ``key``, if any.
+        """
+        with self._lock:
+            if key in self._entries:
+                _, size = self._entries.pop(key)
+                self._nbytes -= size
+
+    def clear(self):
+        """ Remove all cached objects. Counters are kept.
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
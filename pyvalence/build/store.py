@@ -0,0 +1,341 @@
+""" Partitioned columnar store for stacked pyvalence tables.
+
+    Each table is written to its own folder with one ``key=<run key>``
+    partition per run. Every column of a partition is a separate ``.npy``
+    file that is memory mapped on reload, so only the partitions and time
+    windows that are requested are ever read from disk. Object and
+    categorical columns are saved as category codes, with the categories
+    of the whole table in ``<col>.categories.npy``.
+"""
+import os
+import json
+import numpy as np
+import pandas as pd
+
+_SCHEMA = '_schema.json'
+_MISSING = '.isna.npy'
+_CATEGORIES = '.categories.npy'
+_SPECTRA_ARRAYS = ('data', 'indices', 'indptr', 'times', 'ions')
+
+
+def _partition(table_dir, key):
+    """ return path to partition folder of ``key`` in ``table_dir``
+    """
+    return os.path.join(table_dir, 'key={}'.format(key))
+
+
+def _partition_keys(schema, keys):
+    """ return partition keys of table restricted to ``keys``
+    """
+    if keys is None:
+        return schema['keys']
+    keys = set(keys)
+    return [key for key in schema['keys'] if key in keys]
+
+
+def _encode(df, table_dir):
+    """ return ``df`` with object and categorical columns replaced by
+        their category codes, missing values coded -1, and the names of
+        those columns. The categories of each are saved to ``table_dir``.
+    """
+    codes = {}
+    for col in df.columns:
+        if df[col].dtype.kind != 'O':
+            continue
+        cat = pd.Categorical(df[col])
+        categories = np.asarray(cat.categories)
+        if categories.dtype.kind == 'O':
+            categories = categories.astype(str)
+        np.save(os.path.join(table_dir, col + _CATEGORIES), categories)
+        codes[col] = cat.codes
+    return df.assign(**codes), list(codes)
+
+
+def _column_array(series):
+    """ return numpy array that can be memory mapped for ``series`` and
+        mask of its missing values, None if no value is missing. Missing
+        values of nullable integers are kept by the mask.
+    """
+    if isinstance(series.dtype, np.dtype):
+        return series.values, None
+    missing = series.isna().values
+    missing = missing if missing.any() else None
+    return series.to_numpy(series.dtype.numpy_dtype, na_value=0), missing
+
+
+def _column_values(arr, dtype, mask, categories):
+    """ return column of dtype name ``dtype`` from its saved array ``arr``,
+        missing value mask ``mask`` and ``categories``
+    """
+    if dtype == 'category':
+        return pd.Categorical.from_codes(arr, categories)
+    if categories is not None:
+        values = np.full(len(arr), np.nan, dtype=object)
+        values[arr >= 0] = categories[arr[arr >= 0]]
+        return values
+    if dtype.startswith('Int'):
+        mask = np.zeros(len(arr), dtype=bool) if mask is None else mask
+        return pd.arrays.IntegerArray(np.array(arr), mask)
+    return arr
+
+
+def _time_slice(tme, tmin, tmax, is_sorted):
+    """ return slice or mask selecting ``tmin <= tme <= tmax``, compared
+        in the precision of ``tme``
+    """
+    tmin, tmax = (None if t is None else tme.dtype.type(t)
+                  for t in (tmin, tmax))
+    if is_sorted:
+        lo = 0 if tmin is None else np.searchsorted(tme, tmin, 'left')
+        hi = (len(tme) if tmax is None
+              else np.searchsorted(tme, tmax, 'right'))
+        return slice(lo, hi)
+    mask = np.ones(len(tme), dtype=bool)
+    if tmin is not None:
+        mask &= tme >= tmin
+    if tmax is not None:
+        mask &= tme <= tmax
+    return mask
+
+
+def write_table(df, table_dir, time_col=None):
+    """ Write stacked table to ``table_dir`` with one partition per key.
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Stacked table indexed by run ``key``.
+        table_dir : str
+            Folder to write the table to.
+        time_col : str
+            Optional. Column used for time range pushdown on reload.
+    """
+    os.makedirs(table_dir, exist_ok=True)
+    keys = []
+    is_sorted = time_col is not None
+    dtypes = [str(ty) for ty in df.dtypes]
+    df, encoded = _encode(df, table_dir)
+    for key, part in df.groupby(level=0, observed=True, sort=False):
+        keys.append(key)
+        part_dir = _partition(table_dir, key)
+        os.makedirs(part_dir, exist_ok=True)
+        for col in df.columns:
+            values, missing = _column_array(part[col])
+            np.save(os.path.join(part_dir, col + '.npy'), values)
+            mask = os.path.join(part_dir, col + _MISSING)
+            if missing is not None:
+                np.save(mask, missing)
+            elif os.path.exists(mask):
+                os.remove(mask)
+        if time_col is not None:
+            is_sorted &= bool(part[time_col].is_monotonic_increasing)
+
+    with open(os.path.join(table_dir, _SCHEMA), 'w') as f:
+        json.dump({'columns': list(df.columns),
+                   'dtypes': dtypes,
+                   'encoded': encoded,
+                   'keys': [str(key) for key in keys],
+                   'time_col': time_col,
+                   'sorted': is_sorted}, f)
+
+
+def read_table(table_dir, keys=None, tmin=None, tmax=None):
+    """ Read stacked table from ``table_dir``. Columns are memory mapped,
+        so only the requested partitions and rows are read from disk; the
+        rows read are copied into the returned table.
+
+        Parameters
+        ----------
+        table_dir : str
+            Folder the table was written to by ``write_table``.
+        keys : list(str)
+            Optional. Only read partitions of these run keys.
+        tmin, tmax : float
+            Optional. Only read rows whose time column is within
+            ``[tmin, tmax]``.
+
+        Returns
+        -------
+        pandas.DataFrame
+            Stacked table indexed by run ``key``, or None if the table
+            was not written.
+    """
+    if not os.path.isdir(table_dir):
+        return None
+    with open(os.path.join(table_dir, _SCHEMA)) as f:
+        schema = json.load(f)
+
+    categories = {col: np.load(os.path.join(table_dir, col + _CATEGORIES))
+                  for col in schema['encoded']}
+
+    dfs = []
+    for key in _partition_keys(schema, keys):
+        part_dir = _partition(table_dir, key)
+        cols = {col: np.load(os.path.join(part_dir, col + '.npy'),
+                             mmap_mode='r')
+                for col in schema['columns']}
+        rows = slice(None)
+        if schema['time_col'] and (tmin is not None or tmax is not None):
+            rows = _time_slice(cols[schema['time_col']],
+                               tmin, tmax, schema['sorted'])
+        data = {}
+        for col, dtype in zip(schema['columns'], schema['dtypes']):
+            mask = os.path.join(part_dir, col + _MISSING)
+            mask = np.load(mask)[rows] if os.path.exists(mask) else None
+            data[col] = _column_values(np.asarray(cols[col][rows]), dtype,
+                                       mask, categories.get(col))
+        nrows = len(next(iter(data.values()))) if data else 0
+        dfs.append(pd.DataFrame(
+            data, columns=schema['columns'],
+            index=pd.Index([key] * nrows, name='key')))
+
+    if not dfs:
+        return None
+    return pd.concat(dfs, axis=0)
+
+
+def write_spectra(spectra, table_dir):
+    """ Write sparse spectra to ``table_dir`` with one partition per key.
+
+        Parameters
+        ----------
+        spectra : dict
+            Mapping of run key to ``(csr_matrix, times, ions)``.
+        table_dir : str
+            Folder to write the spectra to.
+    """
+    keys = [key for key, val in spectra.items() if val is not None]
+    for key in keys:
+        data, times, ions = spectra[key]
+        part_dir = _partition(table_dir, key)
+        os.makedirs(part_dir, exist_ok=True)
+        arrays = (data.data, data.indices, data.indptr, times, ions)
+        for name, arr in zip(_SPECTRA_ARRAYS, arrays):
+            np.save(os.path.join(part_dir, name + '.npy'), np.asarray(arr))
+    write_spectra_keys(keys, table_dir)
+
+
+def write_spectra_keys(keys, table_dir):
+    """ Write schema listing the spectra partitions of ``keys`` in
+        ``table_dir``.
+    """
+    os.makedirs(table_dir, exist_ok=True)
+    with open(os.path.join(table_dir, _SCHEMA), 'w') as f:
+        json.dump({'keys': [str(key) for key in keys]}, f)
+
+
+def spectra_allocator(table_dir, key):
+    """ Return ``alloc(name, shape, dtype)`` creating the memory mapped
+        arrays of spectra partition ``key`` in ``table_dir``, for decoders
+        that write their output straight to disk.
+    """
+    part_dir = _partition(table_dir, key)
+    os.makedirs(part_dir, exist_ok=True)
+
+    def alloc(name, shape, dtype):
+        path = os.path.join(part_dir, name + '.npy')
+        shape = tuple(np.atleast_1d(shape).tolist())
+        if not np.prod(shape):
+            # empty arrays cannot be memory mapped
+            np.save(path, np.empty(shape, dtype=dtype))
+            return np.empty(shape, dtype=dtype)
+        return np.lib.format.open_memmap(
+            path, mode='w+', dtype=dtype, shape=shape)
+    return alloc
+
+
+def _source_stamp(source):
+    """ return size and modification time of file ``source``
+    """
+    stat = os.stat(source)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def is_current(table_dir, key, source, name='_source'):
+    """ Return True iff partition ``key`` of ``table_dir`` was written
+        from file ``source`` and ``source`` has not changed since.
+        ``name`` distinguishes stamps of different outputs.
+    """
+    stamp = os.path.join(_partition(table_dir, key), name + '.json')
+    if not isinstance(source, str) or not os.path.exists(stamp):
+        return False
+    with open(stamp) as f:
+        return json.load(f) == _source_stamp(source)
+
+
+def mark_current(table_dir, key, source, name='_source'):
+    """ Record that partition ``key`` of ``table_dir`` was completely
+        written from file ``source``.
+    """
+    if isinstance(source, str):
+        stamp = os.path.join(_partition(table_dir, key), name + '.json')
+        with open(stamp, 'w') as f:
+            json.dump(_source_stamp(source), f)
+
+
+def read_spectra(table_dir, keys=None, tmin=None, tmax=None):
+    """ Read sparse spectra from ``table_dir`` using memory mapping.
+
+        Parameters
+        ----------
+        table_dir : str
+            Folder the spectra were written to by ``write_spectra``.
+        keys : list(str)
+            Optional. Only read partitions of these run keys.
+        tmin, tmax : float
+            Optional. Only read scans with retention time within
+            ``[tmin, tmax]``.
+
+        Returns
+        -------
+        dict
+            Mapping of run key to ``(csr_matrix, times, ions)``.
+    """
+    if not os.path.isdir(table_dir):
+        return {}
+    with open(os.path.join(table_dir, _SCHEMA)) as f:
+        schema = json.load(f)
+
+    return {key: read_spectra_partition(table_dir, key, tmin, tmax)
+            for key in _partition_keys(schema, keys)}
+
+
+def read_spectra_partition(table_dir, key, tmin=None, tmax=None):
+    """ Read sparse spectra of partition ``key`` from ``table_dir`` using
+        memory mapping, whether or not it is listed in the schema.
+        Returns ``(csr_matrix, times, ions)``, see ``read_spectra``.
+    """
+    part_dir = _partition(table_dir, key)
+    data, indices, indptr, times, ions = (
+        np.load(os.path.join(part_dir, name + '.npy'), mmap_mode='r')
+        for name in _SPECTRA_ARRAYS)
+    rows = _time_slice(times, tmin, tmax, True)
+    lo, hi = indptr[rows.start], indptr[rows.stop]
+    import scipy.sparse
+    matrix = scipy.sparse.csr_matrix(
+        (data[lo:hi], indices[lo:hi],
+         indptr[rows.start:rows.stop + 1] - lo),
+        shape=(rows.stop - rows.start, len(ions))
+    )
+    return matrix, np.asarray(times[rows]), np.asarray(ions)
+
+
+def write_scan_index(index, table_dir, key, source):
+    """ Write scan index of DATA.MS file ``source`` to partition ``key``
+        of ``table_dir``.
+    """
+    part_dir = _partition(table_dir, key)
+    os.makedirs(part_dir, exist_ok=True)
+    np.save(os.path.join(part_dir, 'scan_index.npy'), index)
+    mark_current(table_dir, key, source, '_scan_index')
+
+
+def read_scan_index(table_dir, key, source):
+    """ Read scan index of DATA.MS file ``source`` from partition ``key``
+        of ``table_dir`` using memory mapping. Returns None if the index
+        is missing or ``source`` changed since it was written.
+    """
+    if not is_current(table_dir, key, source, '_scan_index'):
+        return None
+    path = os.path.join(_partition(table_dir, key), 'scan_index.npy')
+    return np.load(path, mmap_mode='r')
@@ -0,0 +1,171 @@
+""" Command line interface of pyvalence.
+
+    ``pyvalence quantify ROOT --standards standards.csv --out results/``
+    matches the areas of every Agilent .D folder in ROOT in a process pool,
+    fits the standard curves and writes the concentrations. Matched areas
+    are checkpointed per run in the output folder, so running the command
+    again only processes runs that have not finished or whose RESULTS.CSV
+    changed since. Runs whose matching raised are recorded in a failure
+    marker, reported in the summary and retried on the next run.
+"""
+import os
+import sys
+import shutil
+import argparse
+import traceback
+
+import pandas as pd
+
+from .build import AgilentGcmsDir, store
+from .analyze import shards
+
+
+def _checkpoint(out_dir, key):
+    """ return checkpoint folder of run ``key`` in ``out_dir``
+    """
+    return os.path.join(out_dir, 'checkpoints', key)
+
+
+def _write_checkpoint(out_dir, key, compiled, source):
+    """ Write matched areas of run ``key`` to its checkpoint. The folder
+        is written under a temporary name and renamed once complete.
+    """
+    final = _checkpoint(out_dir, key)
+    tmp = final + '.tmp'
+    shutil.rmtree(tmp, ignore_errors=True)
+    store.write_table(compiled, tmp)
+    os.makedirs(os.path.join(tmp, 'key={}'.format(key)), exist_ok=True)
+    store.mark_current(tmp, key, source)
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+
+
+def _failure(out_dir, key):
+    """ return failure marker of run ``key`` in ``out_dir``
+    """
+    return os.path.join(out_dir, 'failed', key + '.txt')
+
+
+def _write_failure(out_dir, key, err):
+    """ Record that matching run ``key`` raised ``err``.
+    """
+    path = _failure(out_dir, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        f.write(''.join(traceback.format_exception(
+            type(err), err, err.__traceback__)))
+
+
+def _is_done(out_dir, key, source):
+    """ return True iff run ``key`` has a checkpoint written from the
+        current ``source``
+    """
+    final = _checkpoint(out_dir, key)
+    return os.path.isdir(final) and store.is_current(final, key, source)
+
+
+class _Checkpoints(object):
+    """ Checkpoints of matched areas in ``out_dir`` for
+        ``shards.quantify``, reporting progress of ``total`` runs.
+        ``sources`` maps run key to the file it is matched from.
+    """
+    def __init__(self, out_dir, sources, total):
+        self._out_dir = out_dir
+        self._sources = sources
+        self._total = total
+        self.done = 0
+
+    def load(self, path):
+        key = os.path.basename(path)
+        if not _is_done(self._out_dir, key, self._sources[key]):
+            return None
+        self.done += 1
+        compiled = store.read_table(_checkpoint(self._out_dir, key))
+        return pd.DataFrame() if compiled is None else compiled
+
+    def save(self, path, compiled):
+        key = os.path.basename(path)
+        if compiled is None:
+            compiled = pd.DataFrame()
+        _write_checkpoint(self._out_dir, key, compiled, self._sources[key])
+        if os.path.exists(_failure(self._out_dir, key)):
+            os.remove(_failure(self._out_dir, key))
+        self.done += 1
+        print('[{}/{}] matched {}'.format(self.done, self._total, key),
+              file=sys.stderr)
+
+    def fail(self, path, err):
+        key = os.path.basename(path)
+        print('failed {}: {}'.format(key, err), file=sys.stderr)
+        _write_failure(self._out_dir, key, err)
+
+    def save_curves(self, curves):
+        curves.to_csv(os.path.join(self._out_dir, 'std_curves.csv'),
+                      index=False)
+
+
+def quantify(args):
+    """ Run the ``quantify`` command with parsed ``args``.
+    """
+    standards = pd.read_csv(args.standards)
+    os.makedirs(args.out, exist_ok=True)
+    dir_list = AgilentGcmsDir._listdirs(args.root, args.include, args.exclude)
+    # runs without RESULTS.CSV are stamped by their folder
+    sources = {os.path.basename(path): shards.results_file(files) or path
+               for path, files
+               in zip(dir_list, AgilentGcmsDir._scandirs(dir_list))}
+    pending = [key for key in map(os.path.basename, dir_list)
+               if not _is_done(args.out, key, sources[key])]
+    retried = sum(os.path.exists(_failure(args.out, key)) for key in pending)
+    print('{} runs, {} to process, {} of them failed before'.format(
+        len(dir_list), len(pending), retried), file=sys.stderr)
+
+    checkpoints = _Checkpoints(args.out, sources, len(dir_list))
+    conc = shards.quantify(dir_list, standards, args.threshold,
+                           args.shard_size, args.workers,
+                           checkpoint=checkpoints)
+
+    failed = [key for key in map(os.path.basename, dir_list)
+              if not _is_done(args.out, key, sources[key])]
+    if failed:
+        print('failed to match {} runs: {}; see {}'.format(
+            len(failed), ', '.join(failed),
+            os.path.join(args.out, 'failed')), file=sys.stderr)
+    if conc is None:
+        return 1
+
+    shutil.rmtree(os.path.join(args.out, 'concentrations'),
+                  ignore_errors=True)
+    store.write_table(conc, os.path.join(args.out, 'concentrations'))
+    print('wrote concentrations of {} runs to {}'.format(
+        len(dir_list) - len(failed), args.out), file=sys.stderr)
+    return 0 if not failed else 1
+
+
+def main(argv=None):
+    """ Entry point of the ``pyvalence`` console script.
+    """
+    parser = argparse.ArgumentParser(prog='pyvalence')
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    cmd = commands.add_parser(
+        'quantify', help='compute concentrations of all runs in a folder')
+    cmd.add_argument('root', help='folder containing Agilent .D folders')
+    cmd.add_argument('--standards', required=True,
+                     help='csv of standards concentrations, see std_curves')
+    cmd.add_argument('--out', required=True, help='output folder')
+    cmd.add_argument('--workers', type=int, default=None,
+                     help='number of worker processes')
+    cmd.add_argument('--shard-size', type=int, default=16,
+                     help='runs per worker task')
+    cmd.add_argument('--threshold', type=float, default=0.1,
+                     help='retention time threshold of match_area')
+    cmd.add_argument('--include', action='append',
+                     help='glob of .D folder names to include')
+    cmd.add_argument('--exclude', action='append',
+                     help='glob of .D folder names to exclude')
+    cmd.set_defaults(func=quantify)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
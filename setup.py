@@ -49,7 +49,10 @@ options = {
     ],
     'package_data': {'pyvalence': []},
     'include_package_data': True,
-    'install_requires': ['numpy', 'scipy', 'pandas']
+    'install_requires': ['numpy', 'scipy', 'pandas'],
+    'entry_points': {
+        'console_scripts': ['pyvalence = pyvalence.cli:main']
+    }
 }
 
 setup(**options)
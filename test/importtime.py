@@ -0,0 +1,88 @@
+import os
+import sys
+import subprocess
+
+
+# import statements and seconds allowed for them in a fresh interpreter.
+# None of them may load scipy.
+IMPORTS = [
+    ('import pyvalence', 0.05),
+    ('import pyvalence.build', 0.05),
+    ('import pyvalence.analyze', 0.05),
+    ('from pyvalence.build import AgilentGcms', 1.0),
+    ('from pyvalence.analyze import match_area', 1.0)
+]
+
+# statements run on a folder of synthetic runs, bound to ROOT, after
+# ``from pyvalence.build import AgilentGcms``. Building the tables of a
+# collection may not load scipy either; only decoding spectra does.
+USES = [
+    'AgilentGcms.from_root(ROOT)',
+    'AgilentGcms.from_root(ROOT, cache_size=1 << 20).chromatogram',
+    'AgilentGcms.metadata_table(ROOT)'
+]
+
+PROBE = '''
+import sys, time
+start = time.perf_counter()
+{}
+elapsed = time.perf_counter() - start
+print(elapsed, ','.join(m for m in sys.modules if m.split('.')[0] == 'scipy'))
+'''
+
+
+USE_PROBE = '''
+import os, sys, tempfile
+sys.path.insert(0, {here!r})
+import synthetic
+ROOT = tempfile.mkdtemp()
+synthetic.make_root(ROOT, 2)
+from pyvalence.build import AgilentGcms
+{statement}
+print(','.join(m for m in sys.modules if m.split('.')[0] == 'scipy'))
+'''
+
+
+def use_modules(statement):
+    """ return the scipy modules loaded by running ``statement`` of USES
+        in a fresh interpreter.
+    """
+    probe = USE_PROBE.format(here=os.path.dirname(os.path.abspath(__file__)),
+                             statement=statement)
+    out = subprocess.run([sys.executable, '-c', probe],
+                         capture_output=True, text=True, check=True)
+    return out.stdout.strip()
+
+
+def import_time(statement, repeat=5):
+    """ return best time of import ``statement`` in a fresh interpreter
+        and the scipy modules it loaded.
+    """
+    best, loaded = None, ''
+    for _ in range(repeat):
+        out = subprocess.run([sys.executable, '-c', PROBE.format(statement)],
+                             capture_output=True, text=True, check=True)
+        elapsed, loaded = out.stdout.split(' ', 1)
+        best = min(float(elapsed), best or float('inf'))
+    return best, loaded.strip()
+
+
+if __name__ == '__main__':
+
+    failed = False
+    for statement, budget in IMPORTS:
+        elapsed, loaded = import_time(statement)
+        print('{:<45} {:.3f}s'.format(statement, elapsed))
+        if loaded:
+            print('  imports scipy at load: {}'.format(loaded))
+            failed = True
+        if elapsed > budget:
+            print('  over budget of {}s'.format(budget))
+            failed = True
+    for statement in USES:
+        loaded = use_modules(statement)
+        print(statement)
+        if loaded:
+            print('  imports scipy: {}'.format(loaded))
+            failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,144 @@
+""" Writers of small synthetic Agilent .D folders for the tests.
+
+    Files follow the layout the readers in pyvalence.build expect: DATA.MS
+    scan records after a 0x200 byte header, FID1A.CH doubles after 0x1800
+    bytes, and RESULTS.CSV with tic, lib and fid tables.
+"""
+import os
+import csv
+import struct
+import numpy as np
+
+COMPOUNDS = ('hexane', 'heptane', 'octane', 'nonane')
+
+
+def datams_header(nscans, gc=False):
+    """ return DATA.MS header announcing ``nscans`` scans, 0 while the
+        run is acquiring, laid out as ChemStation writes it: the file type
+        is a Pascal string at 0x4 and the scan count is stored at 0x118.
+        With ``gc`` the file type is the 'GC / MS Data File' of GC runs.
+    """
+    file_type = b'GC / MS Data File' if gc else b'MS Data File'
+    hdr = bytearray(0x200)
+    hdr[0x4] = len(file_type)
+    hdr[0x5:0x5 + len(file_type)] = file_type
+    struct.pack_into('>H', hdr, 0x118, nscans)
+    struct.pack_into('>H', hdr, 0x10A, (len(hdr) + 2) // 2)
+    return hdr
+
+
+def datams_scan(tme, mzs, abundances):
+    """ return scan record at ``tme`` minutes of integer ``abundances``
+        at ``mzs``
+    """
+    body = struct.pack('>I', int(round(tme * 60000))) + b'\0' * 12
+    for mz, ab in zip(mzs, abundances):
+        body += struct.pack('>HH', int(round(mz * 20)), int(ab))
+    body += b'\0' * 6 + struct.pack('>I', int(np.sum(abundances)))
+    return struct.pack('>H', (2 + len(body)) // 2) + body
+
+
+def random_scans(nscans=200, seed=0, start=1.0, step=0.01):
+    """ return list of (tme, mzs, abundances) of random scans
+    """
+    rng = np.random.default_rng(seed)
+    scans = []
+    for i in range(nscans):
+        npts = int(rng.integers(3, 12))
+        mzs = np.sort(rng.choice(np.arange(40, 300), npts, replace=False))
+        scans.append((start + i * step, mzs, rng.integers(1, 16000, npts)))
+    return scans
+
+
+def write_datams(path, nscans=200, seed=0, gc=False):
+    """ write DATA.MS of random scans and return the scans
+    """
+    scans = random_scans(nscans, seed)
+    with open(path, 'wb') as f:
+        f.write(datams_header(nscans, gc))
+        for scan in scans:
+            f.write(datams_scan(*scan))
+    return scans
+
+
+def fid_signal(n=500, t0=1.0, t1=3.0, seed=0):
+    """ return FID trace with two peaks and noise
+    """
+    rng = np.random.default_rng(seed)
+    x = np.linspace(t0, t1, n)
+    return (100 * np.exp(-((x - 1.5) / 0.02) ** 2) +
+            50 * np.exp(-((x - 2.2) / 0.03) ** 2) + rng.normal(0, 1, n))
+
+
+def fid_header(t0=1.0, t1=3.0):
+    """ return FID1A.CH header of a trace from ``t0`` to ``t1`` minutes
+    """
+    hdr = bytearray(0x1800)
+    struct.pack_into('>f', hdr, 0x11A, t0 * 60000)
+    struct.pack_into('>f', hdr, 0x11E, t1 * 60000)
+    return hdr
+
+
+def write_fid(path, n=500, t0=1.0, t1=3.0, seed=0):
+    """ write FID1A.CH and return its trace
+    """
+    sig = fid_signal(n, t0, t1, seed)
+    with open(path, 'wb') as f:
+        f.write(fid_header(t0, t1))
+        f.write(sig.astype('<f8').tobytes())
+    return sig
+
+
+def write_results(path, seed=0, ids=COMPOUNDS, blank=()):
+    """ write RESULTS.CSV with a tic, lib and fid table of one peak per
+        compound of ``ids``. Fields of the tic table named in ``blank``
+        are left empty in the first row.
+    """
+    rng = np.random.default_rng(seed)
+    tic_header = ['Header=', 'Peak', 'R.T.', 'First', 'Max', 'Last',
+                  'PK  TY', 'Height', 'Area', 'Pct Max', 'Pct Total']
+    rows = [['Sample', 'x'], tic_header]
+    rts = [1.2 + 0.3 * i for i in range(len(ids))]
+    for i, rt in enumerate(rts):
+        scan = int((rt - 1.0) / 0.01)
+        row = ['{}='.format(i + 1), str(i + 1), '{:.3f}'.format(rt),
+               str(scan - 3), str(scan), str(scan + 3), 'BB',
+               str(int(rng.integers(100, 1000))),
+               str(int(rng.integers(1000, 100000))), '50.0', '10.0']
+        if i == 0:
+            row = ['' if col in blank else val
+                   for col, val in zip(tic_header, row)]
+        rows.append(row)
+    rows.append(['Other', 'meta'])
+    rows.append(['Header=', 'PK', 'RT', 'Area Pct', 'Library/ID', 'Ref',
+                 'CAS', 'Qual'])
+    for i, rt in enumerate(rts):
+        rows.append(['{}='.format(i + 1), str(i + 1),
+                     '{:.3f}'.format(rt + 0.01), '10.0', ids[i], '123',
+                     '000{}-00-0'.format(i), '90'])
+    rows.append(['Other', 'fid'])
+    rows.append(['Header=', 'Peak', 'R.T.', 'Start', 'End', 'PK TY',
+                 'Height', 'Area', 'Pct Max', 'Pct Total'])
+    for i, rt in enumerate(rts):
+        rows.append(['{}='.format(i + 1), str(i + 1),
+                     '{:.3f}'.format(rt + 0.05), '1', '2', 'BB', '10',
+                     str(int(rng.integers(1000, 100000))), '50.0', '10.0'])
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+def make_root(root, nruns=4):
+    """ write ``nruns`` .D folders RUN00.D, RUN01.D, ... to ``root`` and
+        return their paths
+    """
+    paths = []
+    for i in range(nruns):
+        path = os.path.join(root, 'RUN{:02d}.D'.format(i))
+        os.makedirs(path, exist_ok=True)
+        write_datams(os.path.join(path, 'DATA.MS'), seed=i)
+        write_fid(os.path.join(path, 'FID1A.CH'), seed=i)
+        write_results(os.path.join(path, 'RESULTS.CSV'), seed=i)
+        with open(os.path.join(path, 'acqmeth.txt'), 'w') as f:
+            f.write('Method Information\nMethod: FAMES.M\n')
+        paths.append(path)
+    return paths
@@ -0,0 +1,75 @@
+import os
+import shutil
+import asyncio
+import numpy as np
+import pandas as pd
+from pyvalence.build import AgilentGcms
+
+import synthetic
+
+
+class SlowStorage(object):
+    """ in-memory copy of a folder tree with a latency per request
+    """
+    def __init__(self, root, latency=0.01):
+        self.latency = latency
+        self.listings, self.contents = {}, {}
+        for path, dirs, files in os.walk(root):
+            self.listings[path] = (
+                [(d, os.path.join(path, d), True) for d in dirs] +
+                [(f, os.path.join(path, f), False) for f in files])
+            for f in files:
+                with open(os.path.join(path, f), 'rb') as fh:
+                    self.contents[os.path.join(path, f)] = fh.read()
+        self.active = self.peak = 0
+        self.reads = []
+
+    async def _request(self, result):
+        self.active += 1
+        self.peak = max(self.peak, self.active)
+        await asyncio.sleep(self.latency)
+        self.active -= 1
+        return result
+
+    async def scandir(self, path):
+        return await self._request(self.listings[path])
+
+    async def read(self, path):
+        self.reads.append(os.path.basename(path))
+        return await self._request(self.contents[path])
+
+
+def test_matches_from_root(tmp_path, monkeypatch):
+    root = str(tmp_path)
+    synthetic.make_root(root, 6)
+    expected = AgilentGcms.from_root(root)
+    storage = SlowStorage(root)
+
+    def no_scandir(path):
+        raise AssertionError('listed outside of the reader')
+    monkeypatch.setattr(os, 'scandir', no_scandir)
+    agi = asyncio.run(AgilentGcms.afrom_root(root, max_concurrency=4,
+                                             reader=storage))
+    monkeypatch.undo()
+
+    assert 1 < storage.peak <= 4
+    assert sorted(set(storage.reads)) == ['DATA.MS', 'FID1A.CH',
+                                          'RESULTS.CSV', 'acqmeth.txt']
+    assert agi.keys == expected.keys
+    for attr in ('results_tic', 'results_lib', 'results_fid',
+                 'chromatogram', 'chromatogram_fid'):
+        pd.testing.assert_frame_equal(getattr(agi, attr),
+                                      getattr(expected, attr))
+
+    # contents are dropped once decoded, spectra included, so nothing is
+    # read from the local files
+    for folder in agi._folders.values():
+        assert all(isinstance(fp, str) for fp in folder._files.values())
+        assert folder.datams._tables == []
+    assert storage.reads.count('DATA.MS') == 6
+    expected_data, expected_times, _ = expected.spectra_sparse['RUN03.D']
+    shutil.rmtree(root)
+    data, times, _ = agi.spectra_sparse['RUN03.D']
+    assert len(agi.scan_index('RUN03.D')) == len(times)
+    assert (data != expected_data).nnz == 0
+    np.testing.assert_array_equal(times, expected_times)
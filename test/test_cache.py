@@ -0,0 +1,52 @@
+import numpy as np
+from pyvalence.build import AgilentGcms, RunCache
+from pyvalence.build.cache import _nbytes
+
+import synthetic
+
+
+def test_lru_eviction():
+    cache = RunCache(max_bytes=2500)
+    for key in 'abc':
+        cache.put(key, np.zeros(100))        # 800 bytes each
+    assert cache.get('a') is not None and cache.evictions == 0
+    cache.put('d', np.zeros(100))
+    assert 'b' not in cache and 'a' in cache
+    assert cache.nbytes <= 2500 and cache.evictions == 1
+    assert cache.get('b') is None and cache.misses == 1
+
+    # objects are measured again when they grow
+    grown = {'x': np.zeros(10)}
+    cache.put('e', grown)
+    grown['y'] = np.zeros(200)
+    cache.get('e')
+    assert cache.nbytes <= 2500 and list(cache._entries)[-1] == 'e'
+
+    # measuring again is not a lookup
+    grown['z'] = np.zeros(10)
+    counts = cache.hits, cache.misses
+    assert cache.touch('e') is grown and cache.touch('b') is None
+    assert (cache.hits, cache.misses) == counts
+
+
+def test_bounds_decoded_spectra(tmp_path):
+    synthetic.make_root(str(tmp_path), 6)
+    full = AgilentGcms.from_root(str(tmp_path))
+    run = full._folders['RUN00.D'].datams
+    full.spectra_sparse['RUN00.D']
+    per_run = _nbytes(run)
+
+    agi = AgilentGcms.from_root(str(tmp_path), cache_size=3 * per_run)
+    for key in agi.keys:
+        lookups = agi._cache.hits + agi._cache.misses
+        data, _, _ = agi.spectra_sparse[key]
+        # one lookup per access, the spectra are measured without one
+        assert agi._cache.hits + agi._cache.misses == lookups + 1
+        assert (data != full.spectra_sparse[key][0]).nnz == 0
+        assert agi._cache.nbytes <= 3 * per_run
+    assert agi._cache.evictions > 0
+    resident = [key for (path, name), (obj, _) in agi._cache._entries.items()
+                if name == 'data.ms' and obj._spectra is not None]
+    assert 0 < len(resident) <= 3
+    # the collection itself keeps no decoded spectra
+    assert vars(agi._spectra) == {'_folders': agi._folders}
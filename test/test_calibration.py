@@ -0,0 +1,83 @@
+import numpy as np
+import pandas as pd
+from pyvalence.build import AgilentGcms
+from pyvalence.analyze import (
+    CalibrationStore,
+    compound_fingerprints,
+    match_area,
+    std_curves,
+    concentrations
+)
+from pyvalence.analyze.calibration import read_curves
+
+import synthetic
+
+
+def standards():
+    return pd.DataFrame({'library_id': list(synthetic.COMPOUNDS),
+                         'RUN00.D': [1., 2., 3., 4.],
+                         'RUN01.D': [2., 3., 4., 5.],
+                         'RUN02.D': [2., 3., 4., 5.]})
+
+
+def compiled(root):
+    synthetic.make_root(root, 4)
+    agi = AgilentGcms.from_root(root)
+    return match_area(agi.results_lib, agi.results_tic)
+
+
+def test_fingerprints_ignore_row_order(tmp_path):
+    comp = compiled(str(tmp_path))
+    std = standards()
+    fps = compound_fingerprints(comp, std)
+    assert sorted(fps.index) == sorted(synthetic.COMPOUNDS)
+    shuffled = compound_fingerprints(comp.iloc[::-1], std.iloc[::-1])
+    pd.testing.assert_series_equal(fps.sort_index(), shuffled.sort_index())
+
+    std.loc[0, 'RUN00.D'] = 1.5
+    changed = compound_fingerprints(comp, std)
+    lid = std.loc[0, 'library_id']
+    assert changed[lid] != fps[lid]
+    assert (changed.drop(lid) == fps.drop(lid)).all()
+
+
+def test_store_round_trip(tmp_path):
+    comp = compiled(str(tmp_path / 'runs'))
+    std = standards()
+    store = CalibrationStore(str(tmp_path / 'cal'))
+    assert store.load() is None
+
+    curves = store.curves(comp, std)
+    fingerprint = store.fingerprint(comp, std)
+    assert store.models == [fingerprint]
+    expected = std_curves(comp, std)
+    np.testing.assert_allclose(
+        curves.set_index('library_id')['responsefactor'],
+        expected.astype({'library_id': str}).set_index('library_id')
+                .loc[curves['library_id'], 'responsefactor'])
+
+    # a stored calibration is reused, not refitted
+    assert store.curves(comp, std).equals(curves)
+    assert store.models == [fingerprint]
+    assert read_curves(str(tmp_path / 'missing.csv')) is None
+
+    # concentrations accept the path of the stored curves
+    cols = ['library_id', 'conc']
+    from_path = concentrations(comp, store.file(fingerprint))
+    fitted = concentrations(comp, expected)
+    pd.testing.assert_frame_equal(
+        from_path.reset_index()[cols].astype({'library_id': str}),
+        fitted.reset_index()[cols].astype({'library_id': str}),
+        check_dtype=False)
+
+
+def test_stale(tmp_path):
+    comp = compiled(str(tmp_path / 'runs'))
+    std = standards()
+    store = CalibrationStore(str(tmp_path / 'cal'))
+    store.save(comp, std)
+    assert not store.stale(comp, std).any()
+
+    std.loc[1, 'RUN01.D'] = 9.
+    stale = store.stale(comp, std)
+    assert stale[stale].index.tolist() == [std.loc[1, 'library_id']]
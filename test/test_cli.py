@@ -0,0 +1,48 @@
+import os
+import shutil
+import pandas as pd
+from pyvalence import cli
+from pyvalence.build import store
+
+import synthetic
+
+
+def write_standards(path):
+    pd.DataFrame({'library_id': list(synthetic.COMPOUNDS),
+                  'RUN00.D': [1., 2., 3., 4.],
+                  'RUN01.D': [2., 3., 4., 5.]}).to_csv(path, index=False)
+
+
+def test_failure_is_recorded_and_retried(tmp_path, capsys):
+    root, out = str(tmp_path / 'root'), str(tmp_path / 'out')
+    paths = synthetic.make_root(root, 5)
+    os.remove(os.path.join(paths[4], 'RESULTS.CSV'))
+    write_standards(str(tmp_path / 'std.csv'))
+    broken = os.path.join(paths[3], 'RESULTS.CSV')
+    os.remove(broken)
+    os.makedirs(broken)                 # reading it raises
+    argv = ['quantify', root, '--standards', str(tmp_path / 'std.csv'),
+            '--out', out, '--workers', '2', '--shard-size', '1']
+
+    assert cli.main(argv) == 1
+    err = capsys.readouterr().err
+    assert 'failed to match 1 runs: RUN03.D' in err
+    with open(os.path.join(out, 'failed', 'RUN03.D.txt')) as f:
+        assert 'Error' in f.read()
+    conc = store.read_table(os.path.join(out, 'concentrations'))
+    assert sorted(conc.index.unique()) == ['RUN00.D', 'RUN01.D', 'RUN02.D']
+    assert os.path.exists(os.path.join(out, 'std_curves.csv'))
+
+    # only the failed run is processed again
+    shutil.rmtree(broken)
+    synthetic.write_results(broken, seed=3)
+    assert cli.main(argv) == 0
+    err = capsys.readouterr().err
+    assert '5 runs, 1 to process, 1 of them failed before' in err
+    assert not os.path.exists(os.path.join(out, 'failed', 'RUN03.D.txt'))
+    conc = store.read_table(os.path.join(out, 'concentrations'))
+    assert len(conc.index.unique()) == 4
+
+    assert cli.main(argv) == 0
+    err = capsys.readouterr().err
+    assert '5 runs, 0 to process' in err and 'matched' not in err
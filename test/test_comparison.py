@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from pyvalence.build import AgilentGcms
+from pyvalence.analyze import (
+    resample_runs,
+    spectral_profiles,
+    similarity,
+    outlier_scores,
+    cluster_runs
+)
+
+import synthetic
+
+
+def chromatograms(shapes, seed=0):
+    """ return stacked chromatogram with one run per trace function of
+        ``shapes``, sampled on slightly different time grids
+    """
+    rng = np.random.default_rng(seed)
+    frames = []
+    for i, shape in enumerate(shapes):
+        tme = np.sort(rng.uniform(1, 3, 400))
+        frames.append(pd.DataFrame(
+            {'tic': shape(tme) + rng.normal(0, 0.01, len(tme)),
+             'tme': tme}, index=pd.Index(['R{:02d}'.format(i)] * len(tme),
+                                         name='key')))
+    return pd.concat(frames)
+
+
+def peak(center):
+    return lambda t: np.exp(-((t - center) / 0.05) ** 2)
+
+
+def test_resample_matches_interp():
+    chrom = chromatograms([peak(1.5), peak(2.0), peak(2.5)])
+    grid = np.linspace(0.5, 3.5, 200)
+    resampled = resample_runs(chrom, grid=grid)
+    assert list(resampled.index) == ['R00', 'R01', 'R02']
+    for key, run in chrom.groupby(level='key'):
+        np.testing.assert_allclose(
+            resampled.loc[key].values,
+            np.interp(grid, run['tme'].values, run['tic'].values))
+    default = resample_runs(chrom)
+    starts = chrom.groupby(level='key')['tme'].min()
+    assert default.columns.min() == starts.max()
+
+
+def test_similarity_outliers_and_clusters():
+    shapes = [peak(1.5)] * 4 + [peak(2.5)] * 4 + [lambda t: t * 0 + 1.]
+    sim = similarity(resample_runs(chromatograms(shapes)), block_size=3)
+    profiles = resample_runs(chromatograms(shapes)).values
+    np.testing.assert_allclose(sim.values, np.corrcoef(profiles), atol=1e-2)
+    np.testing.assert_allclose(sim.values, sim.values.T)
+
+    # replicates are nearly identical, so their scores spread widely
+    scores = outlier_scores(sim, k=2, cutoff=10)
+    assert scores['outlier'].tolist() == [False] * 8 + [True]
+    assert scores['score'].idxmax() == 'R08'
+    clusters = cluster_runs(sim, threshold=0.8)
+    assert clusters.iloc[:4].nunique() == 1
+    assert clusters.iloc[4:8].nunique() == 1
+    assert clusters.nunique() == 3
+
+
+def test_spectral_profiles(tmp_path):
+    synthetic.make_root(str(tmp_path), 2)
+    agi = AgilentGcms.from_root(str(tmp_path))
+    profiles = spectral_profiles(agi.spectra_sparse, bin_width=10.)
+    for key in agi.keys:
+        scans, _, ions = agi.spectra_sparse[key]
+        total = np.asarray(scans.sum(axis=0)).ravel()
+        expected = pd.Series(total).groupby(np.floor(ions / 10.) * 10.).sum()
+        np.testing.assert_allclose(
+            profiles.loc[key, expected.index].values, expected.values)
+    assert profiles.values.sum() == sum(
+        agi.spectra_sparse[key][0].sum() for key in agi.keys)
+    sim = similarity(profiles, metric='cosine')
+    np.testing.assert_allclose(np.diag(sim.values), 1, rtol=1e-6)
@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import scipy.stats
+from pyvalence.analyze import deconvolve
+from pyvalence.analyze.deconvolution import _cho_solve, _levenberg_marquardt
+
+TIMES = np.arange(0, 10, .01)
+
+
+def gaussian(area, center, sigma):
+    return area * scipy.stats.norm.pdf(TIMES, center, sigma)
+
+
+def emg(area, center, sigma, tau):
+    return area * scipy.stats.exponnorm.pdf(TIMES, tau / sigma, center,
+                                            sigma)
+
+
+def stacked(*traces):
+    keys = ['RUN{:02d}.D'.format(i) for i in range(len(traces))]
+    return pd.DataFrame(
+        {'tic': np.concatenate(traces), 'tme': np.tile(TIMES, len(traces))},
+        index=pd.CategoricalIndex(np.repeat(keys, len(TIMES)),
+                                  categories=keys, name='key'))
+
+
+def test_gaussian_runs():
+    chrom = stacked(gaussian(10, 3, .05) + gaussian(4, 6, .08) + 1,
+                    gaussian(7, 5, .06))
+    result = deconvolve(chrom)
+    assert result.index.tolist() == ['RUN00.D', 'RUN00.D', 'RUN01.D']
+    assert result['peak'].tolist() == [1, 2, 1]
+    assert result['converged'].all()
+    np.testing.assert_allclose(result['area'], [10, 4, 7], rtol=1e-4)
+    np.testing.assert_allclose(result['rt'], [3, 6, 5], atol=1e-4)
+    np.testing.assert_allclose(result['sigma'], [.05, .08, .06], rtol=1e-3)
+
+
+def test_shoulder():
+    # 2.4 sigma apart the second peak has no maximum of its own
+    result = deconvolve(stacked(gaussian(10, 5, .05) +
+                                gaussian(6, 5 + 2.4 * .05, .05)))
+    assert len(result) == 2 and result['cluster'].nunique() == 1
+    assert result['converged'].all()
+    np.testing.assert_allclose(result['area'], [10, 6], rtol=1e-3)
+    np.testing.assert_allclose(result['rt'], [5, 5.12], atol=1e-3)
+
+
+def test_emg_coeluting():
+    chrom = stacked(emg(10, 5, .05, .15) + emg(5, 5.2, .05, .15))
+    result = deconvolve(chrom, shape='emg')
+    assert result['converged'].all()
+    np.testing.assert_allclose(result['area'], [10, 5], rtol=1e-3)
+    np.testing.assert_allclose(result['sigma'], [.05, .05], rtol=1e-2)
+    np.testing.assert_allclose(result['tau'], [.15, .15], rtol=1e-2)
+
+
+def test_areas_not_negative():
+    # Gaussians fitted to tailing peaks used to cancel out
+    result = deconvolve(stacked(emg(10, 5, .05, .15) + emg(5, 5.2, .05, .15)))
+    assert (result['area'] >= 0).all()
+    np.testing.assert_allclose(result['area'].sum(), 15, rtol=.1)
+
+
+def test_stall_not_converged():
+    t = TIMES[None, 400:600]
+    y = gaussian(10, 5, .05)[None, 400:600]
+    # parameters pinned away from the data by their bounds cannot improve
+    p = np.array([[5., 5.1, np.log(.05), 0., 0.]])
+    p, converged = _levenberg_marquardt(t, y, np.ones_like(y), p, 1,
+                                        (p.copy(), p.copy()), 'gaussian',
+                                        200, 1e-8)
+    assert not converged[0]
+
+
+def test_cho_solve():
+    rng = np.random.default_rng(0)
+    a = rng.random((4, 40, 40))
+    a = a @ a.transpose(0, 2, 1) + 40 * np.eye(40)
+    b = rng.random((4, 40))
+    a[3, 0, 0] = np.nan
+    x = _cho_solve(a, b)
+    np.testing.assert_allclose(np.einsum('cij,cj->ci', a[:3], x[:3]), b[:3],
+                               atol=1e-10)
+    assert (x[3] == 0).all()
@@ -0,0 +1,58 @@
+import numpy as np
+import pandas as pd
+from pyvalence.analyze import map_ids_to_fid
+
+
+def runs(offsets, slope=1.01, seed=0):
+    """ return lib and fid tables of runs whose FID retention times are
+        the MS ones shifted by ``offsets`` and stretched by ``slope``, with
+        one unidentified FID peak per run
+    """
+    rng = np.random.default_rng(seed)
+    keys = ['RUN{:02d}.D'.format(i) for i in range(len(offsets))]
+    ms_rt = np.array([1.0, 1.3, 1.6, 1.9, 2.5, 3.1])
+    libs, fids = [], []
+    for key, off in zip(keys, offsets):
+        fid_rt = off + slope * ms_rt + rng.normal(0, 0.002, len(ms_rt))
+        libs.append(pd.DataFrame({
+            'key': key, 'library_id': ['c{}'.format(i) for i in
+                                       range(len(ms_rt))],
+            'rt': ms_rt, 'qual': [95, 90, 40, 92, 97, 91]}))
+        fids.append(pd.DataFrame({
+            'key': key, 'peak': np.arange(1, len(ms_rt) + 2),
+            'rt': np.r_[fid_rt, fid_rt[2] + 0.06],
+            'area': np.r_[1000 * np.arange(1, len(ms_rt) + 1), 1]}))
+    lib = pd.concat(libs).set_index('key')
+    fid = pd.concat(fids).set_index('key').sort_values(['key', 'rt'])
+    lib.index = pd.CategoricalIndex(lib.index, categories=keys, name='key')
+    return lib, fid
+
+
+def test_offsets_are_corrected():
+    lib, fid = runs([0.12, -0.2, 0.3])
+    result = map_ids_to_fid(lib, fid, threshold=0.03, metrics=True)
+    assert isinstance(result.index, pd.CategoricalIndex)
+    assert len(result) == len(lib)
+    expected = np.tile(1000. * np.arange(1, 7), 3)
+    np.testing.assert_array_equal(result['area'].values, expected)
+    assert (result['delta_rt'] < 0.03).all()
+    np.testing.assert_allclose(
+        result.groupby(level='key', observed=True)['area%'].sum(), 1)
+
+
+def test_one_to_one_and_unmatched():
+    lib, fid = runs([0.1])
+    # a second identification at the same rt gets no area of its own
+    lib = pd.concat([lib, lib.iloc[[0]].assign(library_id='dup', qual=10)])
+    fid = fid[fid['area'] != 5000]
+    result = map_ids_to_fid(lib, fid, threshold=0.03, metrics=True)
+    areas = result.set_index('library_id')['area']
+    assert np.isnan(areas['c4'])
+    assert areas['c0'] == 1000 and np.isnan(areas['dup'])
+    assert result['area_pk'].dropna().is_unique
+
+
+def test_missing_tables():
+    lib, fid = runs([0.1])
+    assert map_ids_to_fid(None, fid) is None
+    assert map_ids_to_fid(lib, None) is None
@@ -0,0 +1,43 @@
+import os
+from pyvalence.build import AgilentGcms, AgilentGcmsDir
+
+import synthetic
+
+
+def touch(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    open(path, 'w').close()
+
+
+def test_diriter(tmp_path):
+    run = str(tmp_path / 'RUN00.D')
+    for rel in ('Results.csv', 'notes.docx', 'sub/DATA.MS',
+                'sub/results.csv', 'sub/deeper/fid1a.ch'):
+        touch(os.path.join(run, rel))
+    files = dict(AgilentGcmsDir._diriter(run))
+    # closest copy is kept, nothing below max_depth is found
+    assert files == {'Results.csv': os.path.join(run, 'Results.csv'),
+                     'DATA.MS': os.path.join(run, 'sub', 'DATA.MS')}
+    assert dict(AgilentGcmsDir._diriter(run, 0)) == {
+        'Results.csv': os.path.join(run, 'Results.csv')}
+    assert 'fid1a.ch' in dict(AgilentGcmsDir._diriter(run, 2))
+
+
+def test_listdirs(tmp_path):
+    root = str(tmp_path)
+    for name in ('A1.D', 'a2.d', 'B1.D', 'Other'):
+        os.makedirs(os.path.join(root, name))
+    touch(os.path.join(root, 'file.D'))
+    names = lambda paths: [os.path.basename(p) for p in paths]
+    assert names(AgilentGcmsDir._listdirs(root)) == ['A1.D', 'B1.D', 'a2.d']
+    assert names(AgilentGcmsDir._listdirs(root, include='A*')) == ['A1.D']
+    assert names(AgilentGcmsDir._listdirs(
+        root, include=['A*', 'a*'], exclude='*2.d')) == ['A1.D']
+
+
+def test_from_root_filters(tmp_path):
+    synthetic.make_root(str(tmp_path), 4)
+    agi = AgilentGcms.from_root(str(tmp_path), exclude=['RUN01.D', 'RUN03*'])
+    assert agi.keys == ['RUN00.D', 'RUN02.D']
+    assert sorted(agi._folders['RUN00.D']._files) == [
+        'acqmeth.txt', 'data.ms', 'fid1a.ch', 'results.csv']
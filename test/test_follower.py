@@ -0,0 +1,58 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from pyvalence.build import AgilentGcmsDataMs, AgilentGcmsFollower
+
+import synthetic
+
+
+def append(path, data):
+    with open(path, 'ab') as f:
+        f.write(data)
+
+
+@pytest.mark.parametrize('gc', [False, True])
+def test_follows_appended_scans(tmp_path, gc):
+    run = str(tmp_path / 'RUN00.D')
+    os.makedirs(run)
+    ms, fid = os.path.join(run, 'DATA.MS'), os.path.join(run, 'FID1A.CH')
+    follower = AgilentGcmsFollower(run, fid_interval=0.004)
+    assert follower.poll() == {'chromatogram': None,
+                               'chromatogram_fid': None, 'spectra': None}
+
+    scans = synthetic.random_scans(90)
+    records = [synthetic.datams_scan(*scan) for scan in scans]
+    signal = synthetic.fid_signal(300)
+    # the scan count is only written once the run is finished
+    append(ms, synthetic.datams_header(0, gc))
+    append(fid, synthetic.fid_header())
+    chunks = []
+    for lo, hi in ((0, 25), (25, 60), (60, 90)):
+        data = b''.join(records[lo:hi])
+        # the last record of a write may still be incomplete
+        append(ms, data[:-5])
+        chunks.append(follower.poll())
+        append(ms, data[-5:])
+        append(fid, signal[lo * 3:hi * 3].astype('<f8').tobytes())
+        chunks.append(follower.poll())
+        assert not follower.finished
+    assert follower.nscans == 90
+
+    with open(ms, 'r+b') as f:
+        f.write(synthetic.datams_header(90, gc))
+    assert follower.poll()['spectra'] is None
+    assert follower.finished
+
+    full, times, ions = AgilentGcmsDataMs(ms).spectra_sparse
+    parts = [c['spectra'] for c in chunks if c['spectra'] is not None]
+    np.testing.assert_allclose(np.concatenate([p[1] for p in parts]), times)
+    chunked = pd.concat([pd.DataFrame(p[0].toarray(), columns=p[2])
+                         for p in parts]).fillna(0)
+    np.testing.assert_array_equal(chunked[ions].values, full.toarray())
+    tic = np.concatenate([c['chromatogram']['tic'] for c in chunks
+                          if c['chromatogram'] is not None])
+    np.testing.assert_allclose(tic, [s[2].sum() for s in scans])
+    fids = np.concatenate([c['chromatogram_fid']['fid'] for c in chunks
+                           if c['chromatogram_fid'] is not None])
+    np.testing.assert_allclose(fids, signal[:270].astype('f4'))
@@ -0,0 +1,14 @@
+import pytest
+
+import importtime
+
+
+@pytest.mark.parametrize('statement', [s for s, _ in importtime.IMPORTS])
+def test_imports_skip_scipy(statement):
+    _, loaded = importtime.import_time(statement, repeat=1)
+    assert loaded == ''
+
+
+@pytest.mark.parametrize('statement', importtime.USES)
+def test_building_skips_scipy(statement):
+    assert importtime.use_modules(statement) == ''
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pyvalence.analyze import compound_matrix
+
+KEYS = ['RUN00.D', 'RUN01.D', 'RUN02.D', 'RUN03.D']
+
+
+def table():
+    """ return long table of three runs with matches; RUN02.D has none
+        and octane is found twice in RUN01.D
+    """
+    rows = [('RUN00.D', 'hexane', 10.), ('RUN00.D', 'octane', 30.),
+            ('RUN01.D', 'hexane', 20.), ('RUN01.D', 'octane', 5.),
+            ('RUN01.D', 'octane', 7.), ('RUN01.D', 'decane', np.nan),
+            ('RUN03.D', 'decane', 4.), ('RUN03.D', 'hexane', 16.)]
+    df = pd.DataFrame(rows, columns=['key', 'library_id', 'conc'])
+    return df.set_index(pd.CategoricalIndex(df.pop('key'), categories=KEYS,
+                                            name='key'))
+
+
+def pivot():
+    df = table().reset_index().astype({'key': str})
+    return (df.dropna().pivot_table(index='library_id', columns='key',
+                                    values='conc', aggfunc='sum')
+              .reindex(columns=KEYS))
+
+
+@pytest.mark.parametrize('sparse', [True, False])
+def test_matches_pivot(sparse, tmp_path):
+    matrix = compound_matrix(table(), sparse=sparse,
+                             mmap_dir=str(tmp_path))
+    assert matrix.sparse == sparse
+    assert list(matrix.runs) == KEYS
+    frame = matrix.to_frame()
+    pd.testing.assert_frame_equal(frame, pivot(), check_names=False)
+    assert frame.index.name == 'library_id' and frame.columns.name == 'key'
+
+
+@pytest.mark.parametrize('sparse', [True, False])
+def test_select_and_normalize(sparse):
+    matrix = compound_matrix(table(), sparse=sparse)
+    part = matrix.select(compounds=['octane', 'hexane'],
+                         runs=['RUN03.D', 'RUN00.D'])
+    pd.testing.assert_frame_equal(
+        part.to_frame(),
+        pivot().loc[['octane', 'hexane'], ['RUN03.D', 'RUN00.D']],
+        check_names=False)
+    with pytest.raises(KeyError):
+        matrix.select(runs=['RUN09.D'])
+
+    total = matrix.normalize().to_frame()
+    expected = pivot() / pivot().sum()
+    expected['RUN02.D'] = np.nan
+    pd.testing.assert_frame_equal(total, expected, check_names=False)
+    istd = matrix.normalize('istd', istd='hexane').to_frame()
+    pd.testing.assert_series_equal(
+        istd.loc['octane'], pivot().loc['octane'] / pivot().loc['hexane'],
+        check_names=False)
+    with pytest.raises(ValueError):
+        matrix.normalize('istd')
@@ -0,0 +1,64 @@
+import os
+import numpy as np
+import pytest
+from pyvalence.build import AgilentGcms, AgilentGcmsDir
+
+import synthetic
+
+
+@pytest.mark.parametrize('gc', [False, True])
+def test_header(tmp_path, gc):
+    run = str(tmp_path / 'RUN00.D')
+    os.makedirs(run)
+    scans = synthetic.write_datams(os.path.join(run, 'DATA.MS'),
+                                   nscans=50, gc=gc)
+    meta = AgilentGcmsDir(run).metadata
+    assert meta['file_type'] == ('GC / MS Data File' if gc
+                                 else 'MS Data File')
+    assert meta['nscans'] == 50
+    assert meta['tmin'] == pytest.approx(scans[0][0])
+    assert 'tmax' not in meta
+    table = AgilentGcms.metadata_table(str(tmp_path), tmax=True)
+    assert table.loc['RUN00.D', 'tmax'] == pytest.approx(scans[-1][0])
+
+    # only the first scan is read, the others may be missing
+    with open(os.path.join(run, 'DATA.MS'), 'r+b') as f:
+        f.truncate(0x200 + len(synthetic.datams_scan(*scans[0])))
+    meta = AgilentGcmsDir(run).metadata
+    assert meta['nscans'] == 50
+    assert meta['tmin'] == pytest.approx(scans[0][0])
+
+
+def test_metadata_files(tmp_path):
+    run = str(tmp_path / 'RUN00.D')
+    os.makedirs(run)
+    with open(os.path.join(run, 'acqmeth.txt'), 'w') as f:
+        f.write('Method: FAMES.M\nOven=250\nMethod: other\n')
+    with open(os.path.join(run, 'fileinfo.txt'), 'wb') as f:
+        f.write('Sample Name: std 1\r\nOven=300\r\n'.encode('utf-16'))
+    meta = AgilentGcmsDir(run).metadata
+    assert meta['Method'] == 'FAMES.M'
+    assert meta['Sample Name'] == 'std 1'
+    assert meta['Oven'] == '250'
+    assert 'nscans' not in meta
+
+
+def test_where(tmp_path):
+    paths = synthetic.make_root(str(tmp_path), 4)
+    synthetic.write_datams(os.path.join(paths[2], 'DATA.MS'), nscans=20)
+    with open(os.path.join(paths[3], 'acqmeth.txt'), 'w') as f:
+        f.write('Method: BLANK.M\n')
+
+    table = AgilentGcms.metadata_table(str(tmp_path))
+    assert list(table.index) == ['RUN00.D', 'RUN01.D', 'RUN02.D', 'RUN03.D']
+    assert table['nscans'].tolist() == [200, 200, 20, 200]
+    assert table['path'].tolist() == paths
+
+    agi = AgilentGcms.from_root(str(tmp_path),
+                                where='nscans > 100 and Method == "FAMES.M"')
+    assert agi.keys == ['RUN00.D', 'RUN01.D']
+    assert list(agi.results_tic.index.unique()) == agi.keys
+
+    agi = AgilentGcms.from_root(
+        str(tmp_path), where=lambda meta: np.isclose(meta['tmax'], 1.19))
+    assert agi.keys == ['RUN02.D']
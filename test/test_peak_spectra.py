@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from pyvalence.build import AgilentGcms
+from pyvalence.analyze import peak_spectra
+
+import synthetic
+
+
+@pytest.fixture
+def agi(tmp_path):
+    synthetic.make_root(str(tmp_path), 2)
+    return AgilentGcms.from_root(str(tmp_path))
+
+
+def dense(agi, key):
+    data, _, ions = agi.spectra_sparse[key]
+    return data.toarray(), ions
+
+
+def test_apex_and_mean(agi):
+    apex = peak_spectra(agi, mode='apex')
+    mean = peak_spectra(agi, mode='mean')
+    assert apex.index.names == ['key', 'peak'] and len(apex) == 8
+    for key in agi.keys:
+        scans, ions = dense(agi, key)
+        peaks = agi.results_tic.loc[key]
+        for peak, first, top, last in peaks[
+                ['peak', 'first', 'max', 'last']].itertuples(index=False):
+            row = apex.loc[(key, peak)].sparse.to_dense()
+            np.testing.assert_array_equal(
+                row.reindex(ions).values, scans[top - 1])
+            assert row.drop(ions).eq(0).all()
+            np.testing.assert_allclose(
+                mean.loc[(key, peak)].sparse.to_dense().reindex(ions).values,
+                scans[first - 1:last].mean(axis=0))
+
+
+def test_background_subtracted(agi):
+    spectra = peak_spectra(agi, mode='background_subtracted')
+    scans, ions = dense(agi, 'RUN00.D')
+    peak = agi.results_tic.loc['RUN00.D'].iloc[1]
+    expected = np.maximum(scans[peak['max'] - 1] - .5 * (
+        scans[peak['first'] - 1] + scans[peak['last'] - 1]), 0)
+    np.testing.assert_allclose(
+        spectra.loc[('RUN00.D', peak['peak'])].sparse.to_dense()
+               .reindex(ions).values, expected)
+    assert (spectra.sparse.to_dense().values >= 0).all()
+
+
+def test_missing_scans_and_mode(tmp_path):
+    root = str(tmp_path)
+    synthetic.make_root(root, 1)
+    synthetic.write_results(root + '/RUN00.D/RESULTS.CSV',
+                            blank=('First', 'Last'))
+    agi = AgilentGcms.from_root(root)
+    mean = peak_spectra(agi, mode='mean')
+    apex = peak_spectra(agi, mode='apex')
+    # a peak without first and last scans averages its apex only
+    np.testing.assert_allclose(mean.iloc[0].sparse.to_dense(),
+                               apex.iloc[0].sparse.to_dense())
+    with pytest.raises(ValueError):
+        peak_spectra(agi, mode='median')
@@ -0,0 +1,69 @@
+import os
+import pandas as pd
+from pyvalence.build import AgilentGcms
+from pyvalence.analyze import (
+    Pipeline,
+    match_area,
+    std_curves,
+    concentrations
+)
+
+import synthetic
+
+
+def standards():
+    return pd.DataFrame({'library_id': list(synthetic.COMPOUNDS),
+                         'RUN00.D': [1., 2., 3., 4.],
+                         'RUN01.D': [2., 3., 4., 5.],
+                         'RUN02.D': [2., 3., 4., 5.]})
+
+
+def add_run(root, name, seed):
+    path = os.path.join(root, name)
+    os.makedirs(path)
+    synthetic.write_results(os.path.join(path, 'RESULTS.CSV'), seed=seed)
+    synthetic.write_datams(os.path.join(path, 'DATA.MS'), seed=seed)
+    synthetic.write_fid(os.path.join(path, 'FID1A.CH'), seed=seed)
+
+
+def test_matches_unmemoized(tmp_path):
+    synthetic.make_root(str(tmp_path), 4)
+    agi = AgilentGcms.from_root(str(tmp_path))
+    result = Pipeline(standards()).run(agi)
+
+    compiled = match_area(agi.results_lib, agi.results_tic)
+    expected = concentrations(compiled, std_curves(compiled, standards()))
+    cols = ['library_id', 'area', 'responsefactor', 'conc']
+    pd.testing.assert_frame_equal(
+        result.reset_index().sort_values(['key', 'pk'])[cols]
+              .reset_index(drop=True),
+        expected.reset_index().sort_values(['key', 'pk'])[cols]
+                .reset_index(drop=True),
+        check_dtype=False, check_categorical=False)
+
+
+def test_recomputes_changes_only(tmp_path):
+    root = str(tmp_path)
+    synthetic.make_root(root, 4)
+    std = standards()
+    pipeline = Pipeline(std)
+    pipeline.run(AgilentGcms.from_root(root))
+    assert pipeline.recomputed['std_curves'] == list(synthetic.COMPOUNDS)
+
+    pipeline.run(AgilentGcms.from_root(root))
+    assert pipeline.recomputed == {'match_area': [], 'std_curves': [],
+                                   'concentrations': []}
+
+    # a sample run does not recalibrate
+    add_run(root, 'RUN09.D', 9)
+    result = pipeline.run(AgilentGcms.from_root(root))
+    assert pipeline.recomputed == {'match_area': ['RUN09.D'],
+                                   'std_curves': [],
+                                   'concentrations': ['RUN09.D']}
+    assert 'RUN09.D' in result.index
+
+    # a new standard only refits its compounds
+    std['RUN03.D'] = [None, 3., 4., None]
+    pipeline.run(AgilentGcms.from_root(root), std)
+    assert pipeline.recomputed['match_area'] == []
+    assert pipeline.recomputed['std_curves'] == ['heptane', 'octane']
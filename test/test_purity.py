@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse
+from pyvalence.analyze import peak_purity
+
+IONS = np.array([50., 60., 70., 80.])
+
+
+class Collection(object):
+    def __init__(self, peaks, spectra):
+        self.results_tic = peaks
+        self.spectra_sparse = spectra
+
+
+def profile(nscans, apex, width=2.):
+    return np.exp(-.5 * ((np.arange(nscans) - apex) / width) ** 2)
+
+
+def run(scans):
+    times = 1 + np.arange(len(scans)) / 100.
+    return scipy.sparse.csr_matrix(scans), times, IONS
+
+
+def peaks(keys, first, top, last):
+    return pd.DataFrame(
+        {'peak': np.arange(len(keys)) + 1, 'first': first, 'max': top,
+         'last': last},
+        index=pd.CategoricalIndex(keys, categories=sorted(set(keys)),
+                                  name='key'))
+
+
+def test_pure_and_coeluting():
+    nscans = 40
+    pure = np.outer(profile(nscans, 10), [100, 50, 30, 0])
+    mixed = (np.outer(profile(nscans, 25), [100, 50, 0, 0]) +
+             np.outer(profile(nscans, 29), [0, 0, 80, 100]))
+    agi = Collection(peaks(['RUN00.D'] * 2, [5, 20], [11, 27], [17, 35]),
+                     {'RUN00.D': run(pure + mixed)})
+    result = peak_purity(agi)
+    first, second = result.iloc[0], result.iloc[1]
+    assert first['purity_lead'] > .999 and first['purity_trail'] > .999
+    assert first['ion_ratio_cv'] < 1e-3
+    assert first['purity'] > .999
+    assert second['ion_ratio_cv'] > .1
+    assert second['purity'] < .9
+
+
+def test_peaks_without_ions():
+    # apex scans without any ion and runs without spectra are NaN
+    nscans = 20
+    agi = Collection(
+        peaks(['RUN00.D', 'RUN01.D'], [5, 5], [10, 10], [15, 15]),
+        {'RUN00.D': run(np.zeros((nscans, len(IONS)))), 'RUN01.D': None})
+    result = peak_purity(agi)
+    assert result[['purity_lead', 'purity_trail', 'ion_ratio_cv',
+                   'purity']].isna().all().all()
@@ -0,0 +1,50 @@
+import csv
+import numpy as np
+import pandas as pd
+from pyvalence.build import AgilentGcms
+from pyvalence.build.agilentgcms import AgilentGcmsResults
+from pyvalence.analyze import match_area
+
+import synthetic
+
+
+def test_declared_dtypes(tmp_path):
+    synthetic.make_root(str(tmp_path), 2)
+    agi = AgilentGcms.from_root(str(tmp_path))
+    tic = agi.results_tic
+    assert str(tic['peak'].dtype) == 'Int32'
+    assert str(tic['area'].dtype) == 'Int64'
+    assert tic['rt'].dtype == np.float32
+    assert tic['pk_ty'].dtype == 'category'
+    assert 'header=' not in tic
+    assert agi.results_lib['library_id'].dtype == 'category'
+    assert isinstance(tic.index, pd.CategoricalIndex)
+    assert list(tic.index.categories) == agi.keys
+
+
+def test_blank_and_float_fields(tmp_path):
+    path = str(tmp_path / 'RESULTS.CSV')
+    synthetic.write_results(path, blank=('Height', 'First'))
+    with open(path) as f:
+        rows = list(csv.reader(f))
+    rows[3][8] = '1234567.0'            # area of the second tic peak
+    with open(path, 'w', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+    tic = AgilentGcmsResults(path).tic
+    assert tic['height'].isna().tolist() == [True, False, False, False]
+    assert tic['first'].isna().tolist() == [True, False, False, False]
+    assert tic['area'].iloc[1] == 1234567
+    assert str(tic['height'].dtype) == 'Int32'
+
+
+def test_match_area_float(tmp_path):
+    root = tmp_path / 'root'
+    synthetic.make_root(str(root), 2)
+    synthetic.write_results(str(root / 'RUN01.D' / 'RESULTS.CSV'), seed=1,
+                            blank=('Area',))
+    agi = AgilentGcms.from_root(str(root))
+    matched = match_area(agi.results_lib, agi.results_tic)
+    assert matched['area'].dtype == np.float64
+    assert matched.loc['RUN01.D', 'area'].isna().sum() == 1
+    assert matched.loc['RUN00.D', 'area'].notna().all()
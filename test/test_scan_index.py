@@ -0,0 +1,42 @@
+import numpy as np
+import pytest
+from pyvalence.build import AgilentGcms
+from pyvalence.build.agilentgcms import AgilentGcmsDataMs
+
+import synthetic
+
+
+@pytest.mark.parametrize('gc', [False, True])
+def test_random_access(tmp_path, gc):
+    path = str(tmp_path / 'DATA.MS')
+    scans = synthetic.write_datams(path, nscans=120, gc=gc)
+    datams = AgilentGcmsDataMs(path)
+    index = datams.scan_index
+    assert len(index) == 120
+    np.testing.assert_allclose(index['time'], [s[0] for s in scans])
+    np.testing.assert_array_equal(index['npts'], [len(s[1]) for s in scans])
+    assert len(datams.chromatogram) == 120
+
+    data, times, ions = datams.spectra_sparse
+    scan = datams.get_scan(37)
+    assert scan.name == times[37]
+    np.testing.assert_array_equal(
+        scan.reindex(ions, fill_value=0).values, data[37].toarray()[0])
+    assert scan.sum() == scans[37][2].sum()
+
+    window = datams.get_scans(1.5, 1.6)
+    rows = (times >= 1.5) & (times <= 1.6)
+    np.testing.assert_array_equal(window.index, times[rows])
+    assert window.values.sum() == data[np.flatnonzero(rows)].sum()
+
+
+def test_persisted_index(tmp_path):
+    synthetic.make_root(str(tmp_path / 'root'), 2)
+    cache_dir = str(tmp_path / 'cache')
+    agi = AgilentGcms.from_root(str(tmp_path / 'root'), cache_dir=cache_dir)
+    index = agi.scan_index('RUN01.D')
+    again = AgilentGcms.from_root(str(tmp_path / 'root'),
+                                  cache_dir=cache_dir)
+    reloaded = again.scan_index('RUN01.D')
+    assert isinstance(reloaded, np.memmap)
+    np.testing.assert_array_equal(reloaded, index)
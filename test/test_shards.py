@@ -0,0 +1,107 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from pyvalence.build import AgilentGcms
+from pyvalence.build.agilentgcms import AgilentGcmsDataMs, AgilentGcfid
+from pyvalence.analyze import match_area, std_curves, concentrations
+from pyvalence.analyze import shards
+
+import synthetic
+
+
+def standards():
+    return pd.DataFrame({'library_id': list(synthetic.COMPOUNDS),
+                         'RUN00.D': [1., 2., 3., 4.],
+                         'RUN01.D': [2., 3., 4., 5.],
+                         'RUN02.D': [3., 4., 5., 6.]})
+
+
+def no_data(monkeypatch):
+    """ fail if anything but RESULTS.CSV is parsed
+    """
+    def fail(self, file_path):
+        raise AssertionError('parsed {}'.format(file_path))
+    monkeypatch.setattr(AgilentGcmsDataMs, '__init__', fail)
+    monkeypatch.setattr(AgilentGcfid, '__init__', fail)
+
+
+def sort(df):
+    cols = ['library_id', 'rt', 'area', 'area%']
+    return (df.reset_index().sort_values(['key', 'library_id'])
+              .reset_index(drop=True)[['key'] + cols]
+              .astype({'key': str, 'library_id': str}))
+
+
+def test_reads_results_only(tmp_path, monkeypatch):
+    paths = synthetic.make_root(str(tmp_path), 3)
+    os.remove(os.path.join(paths[1], 'RESULTS.CSV'))
+    agi = AgilentGcms(paths)
+    expected = match_area(agi.results_lib, agi.results_tic)
+
+    no_data(monkeypatch)
+    compiled = shards._shard_compiled(paths, 0.1)
+    assert isinstance(compiled.index, pd.CategoricalIndex)
+    assert list(compiled.index.unique()) == ['RUN00.D', 'RUN02.D']
+    pd.testing.assert_frame_equal(sort(compiled), sort(expected))
+    assert shards._shard_compiled(paths[1:2], 0.1) is None
+
+
+def test_quantify_matches_single_process(tmp_path):
+    root = str(tmp_path)
+    synthetic.make_root(root, 6)
+    agi = AgilentGcms.from_root(root)
+    compiled = match_area(agi.results_lib, agi.results_tic)
+    expected = concentrations(compiled, std_curves(compiled, standards()))
+
+    with ThreadPoolExecutor(2) as executor:
+        result = shards.quantify(root, standards(), shard_size=2,
+                                 executor=executor)
+    pd.testing.assert_frame_equal(
+        sort(result), sort(expected), check_dtype=False)
+    assert 'conc' in result and result['conc'].notna().any()
+
+
+class MemoryCheckpoint(object):
+    def __init__(self):
+        self.runs, self.failed, self.curves = {}, {}, None
+
+    def load(self, path):
+        return self.runs.get(path)
+
+    def save(self, path, compiled):
+        self.runs[path] = compiled
+
+    def fail(self, path, err):
+        self.failed[path] = err
+
+    def save_curves(self, curves):
+        self.curves = curves
+
+
+def test_quantify_checkpoint(tmp_path):
+    paths = synthetic.make_root(str(tmp_path), 5)
+    os.remove(os.path.join(paths[4], 'RESULTS.CSV'))
+    os.makedirs(os.path.join(paths[4], 'RESULTS.CSV'))     # reading raises
+    with ThreadPoolExecutor(2) as executor:
+        expected = shards.quantify(paths[:4], standards(), shard_size=2,
+                                   executor=executor)
+        checkpoint = MemoryCheckpoint()
+        result = shards.quantify(paths, standards(), shard_size=2,
+                                 executor=executor, checkpoint=checkpoint)
+    assert sorted(checkpoint.runs) == paths[:4]
+    assert list(checkpoint.failed) == [paths[4]]
+    assert checkpoint.curves is not None
+    pd.testing.assert_frame_equal(
+        sort(result), sort(expected), check_dtype=False)
+
+    # checkpointed runs are not matched again
+    jobs = []
+    with ThreadPoolExecutor(1) as executor:
+        def submit(fn, job):
+            jobs.append(job[0])
+            return ThreadPoolExecutor.submit(executor, fn, job)
+        executor.submit = submit
+        again = shards.quantify(paths, standards(), shard_size=2,
+                                executor=executor, checkpoint=checkpoint)
+    assert jobs == [[paths[4]]]
+    pd.testing.assert_frame_equal(again, result)
@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.signal
+from pyvalence.analyze import smooth
+
+
+def stacked(lengths, seed=0):
+    rng = np.random.default_rng(seed)
+    keys = ['RUN{:02d}.D'.format(i) for i in range(len(lengths))]
+    return pd.DataFrame(
+        {'tic': rng.normal(100, 10, sum(lengths)).astype('f4'),
+         'tme': np.concatenate([np.arange(n) for n in lengths]) / 100.},
+        index=pd.CategoricalIndex(np.repeat(keys, lengths), categories=keys,
+                                  name='key'))
+
+
+def test_savgol_per_run():
+    chrom = stacked([60, 45, 80])
+    result = smooth(chrom, window=11, polyorder=3)
+    assert result['tic'].dtype == np.float32
+    pd.testing.assert_series_equal(result['tme'], chrom['tme'])
+    for key in chrom.index.categories:
+        np.testing.assert_allclose(
+            result.loc[key, 'tic'].values,
+            scipy.signal.savgol_filter(chrom.loc[key, 'tic'].values
+                                       .astype(float), 11, 3, mode='mirror'),
+            rtol=1e-5)
+
+
+def test_runs_do_not_mix():
+    chrom = stacked([30, 30])
+    chrom['tic'] = np.repeat([0., 100.], 30).astype('f4')
+    for method in ('savgol', 'moving_average', 'gaussian'):
+        result = smooth(chrom, method=method, window=7)
+        np.testing.assert_allclose(result['tic'], chrom['tic'], atol=1e-4)
+
+
+def test_threads_match():
+    chrom = stacked([50, 20, 70, 40, 35])
+    for method in ('savgol', 'gaussian'):
+        pd.testing.assert_frame_equal(
+            smooth(chrom, method=method, threads=3),
+            smooth(chrom, method=method))
+
+
+def test_invalid_arguments():
+    chrom = stacked([20])
+    with pytest.raises(ValueError):
+        smooth(chrom, window=10)
+    with pytest.raises(ValueError):
+        smooth(chrom, method='median')
+    assert smooth(None) is None
@@ -0,0 +1,41 @@
+import os
+import numpy as np
+from pyvalence.build import AgilentGcms
+from pyvalence.build.agilentgcms import AgilentGcmsDataMs
+
+import synthetic
+
+
+def assert_spectra_equal(spectra, expected):
+    data, times, ions = spectra
+    expected_data, expected_times, expected_ions = expected
+    assert (data != expected_data).nnz == 0
+    np.testing.assert_array_equal(times, expected_times)
+    np.testing.assert_array_equal(ions, expected_ions)
+
+
+def test_decoded_on_access(tmp_path):
+    paths = synthetic.make_root(str(tmp_path), 3)
+    os.remove(os.path.join(paths[2], 'DATA.MS'))
+    agi = AgilentGcms.from_root(str(tmp_path))
+    assert all(val.datams._spectra is None
+               for key, val in agi._folders.items() if key != 'RUN02.D')
+
+    spectra = agi.spectra_sparse
+    assert list(spectra) == ['RUN00.D', 'RUN01.D'] and spectra
+    assert spectra.get('RUN02.D') is None
+    assert_spectra_equal(
+        spectra['RUN01.D'],
+        AgilentGcmsDataMs._read_spectra_sparse(
+            os.path.join(paths[1], 'DATA.MS')))
+    assert agi._folders['RUN00.D'].datams._spectra is None
+
+
+def test_workers_match(tmp_path):
+    synthetic.make_root(str(tmp_path), 3)
+    agi = AgilentGcms.from_root(str(tmp_path))
+    pooled = AgilentGcms.from_root(str(tmp_path), workers=2)
+    assert list(pooled.spectra_sparse) == list(agi.spectra_sparse)
+    for key in agi.keys:
+        assert_spectra_equal(pooled.spectra_sparse[key],
+                             agi.spectra_sparse[key])
@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import pandas as pd
+from pyvalence.build import AgilentGcms
+
+import synthetic
+
+
+def test_matches_concat(tmp_path):
+    paths = synthetic.make_root(str(tmp_path), 3)
+    os.remove(os.path.join(paths[1], 'FID1A.CH'))
+    agi = AgilentGcms.from_root(str(tmp_path))
+    for attr, accessor, table in (
+            ('chromatogram', 'datams', 'chromatogram'),
+            ('chromatogram_fid', 'datafid', 'chromatogram_fid'),
+            ('results_tic', 'results', 'tic'),
+            ('results_lib', 'results', 'lib')):
+        stacked = getattr(agi, attr)
+        runs = {key: getattr(val, accessor)[table]
+                for key, val in agi._folders.items()
+                if accessor != 'datafid' or key != 'RUN01.D'}
+        expected = pd.concat(runs, names=['key', None]).droplevel(1)
+        assert isinstance(stacked.index, pd.CategoricalIndex)
+        assert list(stacked.index.categories) == agi.keys
+        assert list(stacked.index) == list(expected.index)
+        pd.testing.assert_frame_equal(
+            stacked.reset_index(drop=True), expected.reset_index(drop=True),
+            check_categorical=False)
+
+
+def test_union_of_categories(tmp_path):
+    root = str(tmp_path)
+    synthetic.make_root(root, 2)
+    synthetic.write_results(os.path.join(root, 'RUN01.D', 'RESULTS.CSV'),
+                            ids=('decane', 'undecane', 'dodecane',
+                                 'tridecane'))
+    lib = AgilentGcms.from_root(root).results_lib
+    assert lib['library_id'].dtype == 'category'
+    assert set(lib['library_id'].cat.categories) == (
+        set(synthetic.COMPOUNDS) |
+        {'decane', 'undecane', 'dodecane', 'tridecane'})
+    assert lib.loc['RUN01.D', 'library_id'].tolist()[0] == 'decane'
+    assert np.array_equal(lib.index.codes, np.repeat([0, 1], 4))
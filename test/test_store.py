@@ -0,0 +1,90 @@
+import numpy as np
+import pandas as pd
+from pyvalence.build import AgilentGcms, store
+
+import synthetic
+
+
+def test_roundtrip(tmp_path):
+    synthetic.make_root(str(tmp_path / 'root'), 3)
+    agi = AgilentGcms.from_root(str(tmp_path / 'root'))
+    agi.to_store(str(tmp_path / 'store'))
+    back = AgilentGcms.from_store(str(tmp_path / 'store'))
+    for attr in ('results_tic', 'results_lib', 'results_fid',
+                 'chromatogram', 'chromatogram_fid'):
+        pd.testing.assert_frame_equal(getattr(agi, attr),
+                                      getattr(back, attr))
+    for key in agi.keys:
+        data, times, ions = agi.spectra_sparse[key]
+        back_data, back_times, back_ions = back.spectra_sparse[key]
+        assert (data != back_data).nnz == 0
+        np.testing.assert_array_equal(times, back_times)
+        np.testing.assert_array_equal(ions, back_ions)
+
+
+def test_partial_read(tmp_path):
+    synthetic.make_root(str(tmp_path / 'root'), 3)
+    agi = AgilentGcms.from_root(str(tmp_path / 'root'))
+    agi.to_store(str(tmp_path / 'store'))
+    part = AgilentGcms.from_store(str(tmp_path / 'store'), keys=['RUN01.D'],
+                                  tmin=1.5, tmax=2.0)
+    chrom = part.chromatogram
+    assert list(chrom.index.unique()) == ['RUN01.D']
+    assert chrom['tme'].between(1.5, 2.0).all()
+    expected = agi.chromatogram.loc['RUN01.D']
+    assert len(chrom) == expected['tme'].between(1.5, 2.0).sum()
+
+
+def test_missing_strings(tmp_path):
+    df = pd.DataFrame({'name': ['a', np.nan, 'c', 'nan'],
+                       'kind': pd.Categorical(['x', 'y', None, 'x']),
+                       'value': [1., 2., np.nan, 4.],
+                       'count': pd.array([1, None, 3, 4], dtype='Int32')},
+                      index=pd.Index(['k1', 'k1', 'k2', 'k2'], name='key'))
+    store.write_table(df, str(tmp_path / 'table'))
+    back = store.read_table(str(tmp_path / 'table'))
+    assert back['name'].isna().tolist() == [False, True, False, False]
+    assert back['name'].iloc[3] == 'nan'
+    assert back['kind'].isna().tolist() == [False, False, True, False]
+    assert back['value'].isna().tolist() == [False, False, True, False]
+    pd.testing.assert_series_equal(back['count'], df['count'])
+
+    # rewriting without missing values drops the stale mask
+    store.write_table(df.assign(name=df['name'].fillna('z')),
+                      str(tmp_path / 'table'))
+    back = store.read_table(str(tmp_path / 'table'))
+    assert back['name'].tolist() == ['a', 'z', 'c', 'nan']
+
+
+def test_partition_order(tmp_path):
+    keys = ['k{}'.format(i) for i in range(50)][::-1]
+    df = pd.DataFrame({'tme': np.tile([0., 1.], 50)},
+                      index=pd.Index(np.repeat(keys, 2), name='key'))
+    store.write_table(df, str(tmp_path / 'table'), time_col='tme')
+    back = store.read_table(str(tmp_path / 'table'))
+    assert list(back.index.unique()) == keys
+    assert len(back) == 100
+
+
+def test_float32_bounds(tmp_path):
+    df = pd.DataFrame({'tme': np.arange(100, 200, dtype=np.float32) / 100},
+                      index=pd.Index(['k'] * 100, name='key'))
+    store.write_table(df, str(tmp_path / 'table'), time_col='tme')
+    back = store.read_table(str(tmp_path / 'table'), tmin=1.4, tmax=1.9)
+    expected = df[(df['tme'] >= 1.4) & (df['tme'] <= 1.9)]
+    assert back['tme'].tolist() == expected['tme'].tolist()
+
+
+def test_categories(tmp_path):
+    kind = pd.Categorical(['b', None, 'a', 'b'], categories=['c', 'b', 'a'])
+    df = pd.DataFrame({'kind': kind, 'name': ['long name', 'x', None, 'x']},
+                      index=pd.Index(['k1', 'k1', 'k2', 'k2'], name='key'))
+    store.write_table(df, str(tmp_path / 'table'))
+    # strings are saved once per table, rows only keep their codes
+    for col in ('kind', 'name'):
+        codes = np.load(str(tmp_path / 'table' / 'key=k1' / (col + '.npy')))
+        assert codes.dtype.kind == 'i'
+    back = store.read_table(str(tmp_path / 'table'), keys=['k2'])
+    pd.testing.assert_series_equal(back['kind'], df['kind'].loc[['k2']])
+    assert back['name'].isna().tolist() == [True, False]
+    assert back['name'].iloc[1] == 'x'
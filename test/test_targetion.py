@@ -0,0 +1,69 @@
+import os
+import numpy as np
+import pandas as pd
+from pyvalence.build import AgilentGcms
+from pyvalence.analyze import target_area
+
+import synthetic
+
+TIMES = 1.0 + 0.01 * np.arange(200)
+
+
+def gaussian(center, height):
+    return height * np.exp(-((TIMES - center) / 0.03) ** 2)
+
+
+def write_run(path, scale=1.):
+    """ write .D folder with ion 57 at 1.5 and ion 71 at 2.0 minutes,
+        qualifier 43 at half of 57 and noise ion 100 everywhere
+    """
+    os.makedirs(path)
+    traces = {43: gaussian(1.5, 2000 * scale),
+              57: gaussian(1.5, 4000 * scale),
+              71: gaussian(2.0, 3000 * scale),
+              100: np.full(200, 5.)}
+    with open(os.path.join(path, 'DATA.MS'), 'wb') as f:
+        f.write(synthetic.datams_header(len(TIMES)))
+        for i, tme in enumerate(TIMES):
+            f.write(synthetic.datams_scan(
+                tme, list(traces),
+                [max(int(round(tr[i])), 1) for tr in traces.values()]))
+
+
+def method(**cols):
+    return pd.DataFrame(dict({'library_id': ['hexane', 'heptane'],
+                              'target': [57., 71.],
+                              'rt_min': [1.4, 1.9], 'rt_max': [1.6, 2.1]},
+                             **cols))
+
+
+def test_areas_and_qualifiers(tmp_path):
+    write_run(str(tmp_path / 'RUN00.D'))
+    write_run(str(tmp_path / 'RUN01.D'), scale=2.)
+    agi = AgilentGcms.from_root(str(tmp_path))
+    result = target_area(agi, method(qualifiers=[[43.], None],
+                                     ratios=[[.5], None]))
+    assert list(result.index) == ['RUN00.D'] * 2 + ['RUN01.D'] * 2
+    assert result['qualified'].all()
+    np.testing.assert_allclose(result['rt'], [1.5, 2.0, 1.5, 2.0],
+                               atol=1e-6)
+    expected = 4000 * 0.03 * np.sqrt(np.pi)
+    assert abs(result['area'].iloc[0] - expected) < 0.01 * expected
+    np.testing.assert_allclose(result.loc['RUN01.D', 'area'].values,
+                               2 * result.loc['RUN00.D', 'area'].values,
+                               rtol=1e-3)
+
+    off = target_area(agi, method(qualifiers=[[43.], None],
+                                  ratios=[[.8], None]))
+    assert off['qualified'].tolist() == [False, True] * 2
+
+
+def test_without_qualifiers(tmp_path):
+    write_run(str(tmp_path / 'RUN00.D'))
+    agi = AgilentGcms.from_root(str(tmp_path))
+    plain = target_area(agi, method())
+    for cols in ({'qualifiers': [None, None]},
+                 {'qualifiers': [None, None], 'ratios': [None, None]}):
+        pd.testing.assert_frame_equal(target_area(agi, method(**cols)),
+                                      plain)
+    assert abs(plain['area%'].sum() - 1) < 1e-12
@@ -0,0 +1,72 @@
+import numpy as np
+import pandas as pd
+import pytest
+from scipy.stats import linregress, t as t_dist
+from pyvalence.analyze import std_curves, concentrations
+
+
+def calibration(seed=0, nstd=6):
+    """ return compiled areas of two compounds in ``nstd`` standards and
+        one sample, and the standards table
+    """
+    rng = np.random.default_rng(seed)
+    keys = ['STD{}.D'.format(i) for i in range(nstd)] + ['SAMPLE.D']
+    conc = np.linspace(1, 10, nstd)
+    rows = []
+    for lid, rf in (('hexane', 2e-4), ('octane', 5e-5)):
+        areas = (np.r_[conc, 5.5] / rf) * rng.normal(1, 0.03, nstd + 1)
+        rows += [(key, lid, area) for key, area in zip(keys, areas)]
+    compiled = pd.DataFrame(rows, columns=['key', 'library_id', 'area'])
+    standards = pd.DataFrame(
+        dict({'library_id': ['hexane', 'octane']},
+             **{key: [c, c] for key, c in zip(keys, conc)}))
+    return compiled.set_index('key'), standards
+
+
+def test_analytic_matches_linregress():
+    compiled, standards = calibration()
+    curves = std_curves(compiled, standards, uncertainty='analytic')
+    for row in curves.itertuples():
+        pts = compiled[(compiled.library_id == row.library_id) &
+                       (compiled.index != 'SAMPLE.D')]
+        fit = linregress(pts['area'], standards[pts.index].iloc[0])
+        half = t_dist.ppf(0.975, len(pts) - 2) * fit.stderr
+        assert row.dof == len(pts) - 2
+        assert row.var_rf == pytest.approx(fit.stderr ** 2)
+        assert row.var_intercept == pytest.approx(fit.intercept_stderr ** 2)
+        assert row.rf_lo == pytest.approx(fit.slope - half)
+        assert row.rf_hi == pytest.approx(fit.slope + half)
+
+
+def test_bootstrap():
+    compiled, standards = calibration(nstd=8)
+    curves = std_curves(compiled, standards, uncertainty='bootstrap',
+                        n_boot=2000, seed=1)
+    again = std_curves(compiled, standards, uncertainty='bootstrap',
+                       n_boot=2000, seed=1)
+    pd.testing.assert_frame_equal(curves, again)
+    analytic = std_curves(compiled, standards, uncertainty='analytic')
+    assert (curves.rf_lo < curves.responsefactor).all()
+    assert (curves.rf_hi > curves.responsefactor).all()
+    # resampled and analytic slope variances agree in magnitude
+    ratio = curves.var_rf / analytic.var_rf
+    assert ((ratio > 0.2) & (ratio < 5)).all()
+    with pytest.raises(ValueError):
+        std_curves(compiled, standards, uncertainty='jackknife')
+
+
+def test_prediction_intervals():
+    compiled, standards = calibration()
+    conc = concentrations(
+        compiled, std_curves(compiled, standards, uncertainty='analytic'),
+        alpha=0.05)
+    assert (conc.conc_lo < conc.conc).all()
+    assert (conc.conc < conc.conc_hi).all()
+    sample = conc.loc['SAMPLE.D']
+    assert ((sample.conc_lo < 5.5) & (5.5 < sample.conc_hi)).all()
+    wide = concentrations(
+        compiled, std_curves(compiled, standards, uncertainty='analytic'),
+        alpha=0.01)
+    assert ((wide.conc_hi - wide.conc_lo) >
+            (conc.conc_hi - conc.conc_lo)).all()
+    assert 'var_rf' not in conc
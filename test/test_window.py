@@ -0,0 +1,45 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from pyvalence.build import AgilentGcms
+
+import synthetic
+
+
+@pytest.fixture
+def agi(tmp_path):
+    synthetic.make_root(str(tmp_path), 3)
+    return AgilentGcms.from_root(str(tmp_path))
+
+
+@pytest.mark.parametrize('signal,attr', [('tic', 'chromatogram'),
+                                         ('fid', 'chromatogram_fid')])
+def test_matches_mask(agi, signal, attr):
+    windows = agi.window(tmin=1.4, tmax=1.9, signal=signal)
+    assert list(windows) == agi.keys
+    stacked = getattr(agi, attr)
+    for key, df in windows.items():
+        run = stacked.loc[[key]]
+        pd.testing.assert_frame_equal(
+            df, run[(run['tme'] >= 1.4) & (run['tme'] <= 1.9)])
+        assert np.shares_memory(df['tme'].values, stacked['tme'].values)
+
+
+def test_keys_and_open_bounds(agi):
+    windows = agi.window(keys=['RUN02.D', 'RUN09.D'], tmax=1.2)
+    assert list(windows) == ['RUN02.D']
+    assert (windows['RUN02.D']['tme'] <= 1.2).all()
+    assert (len(agi.window(keys=['RUN01.D'])['RUN01.D']) ==
+            len(agi.chromatogram.loc['RUN01.D']))
+    with pytest.raises(KeyError):
+        agi.window(signal='uv')
+
+
+def test_run_without_chromatogram(tmp_path):
+    paths = synthetic.make_root(str(tmp_path), 3)
+    os.remove(os.path.join(paths[1], 'DATA.MS'))
+    agi = AgilentGcms.from_root(str(tmp_path))
+    windows = agi.window(tmin=1.5, tmax=1.6)
+    assert list(windows) == ['RUN00.D', 'RUN02.D']
+    assert windows['RUN02.D'].index.unique().tolist() == ['RUN02.D']